@@ -0,0 +1,53 @@
+import os
+import sys
+import argparse
+
+from modules.core import constants
+
+
+def parse_resolution(value: str) -> tuple[int, int]:
+    width, _, height = value.partition("x")
+    try:
+        return int(width), int(height or width)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid resolution '{value}', expected WIDTHxHEIGHT.")
+
+
+def parse_bool(value: str) -> bool:
+    if value.lower() in ("1", "true", "yes", "on"):
+        return True
+    if value.lower() in ("0", "false", "no", "off"):
+        return False
+    raise argparse.ArgumentTypeError(f"Invalid boolean '{value}'.")
+
+
+if __name__ == "__main__":
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Benchmark samplers, schedulers and resolutions of an image model.")
+    parser.add_argument("model", help=f"Model filename inside '{constants.IMAGE_MODEL_DIR_PATH}'.")
+    parser.add_argument("--samplers", nargs="+", default=["euler"])
+    parser.add_argument("--schedulers", nargs="+", default=["default"])
+    parser.add_argument("--steps", nargs="+", type=int, default=[20])
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution, default=[(512, 512)], metavar="WIDTHxHEIGHT")
+    parser.add_argument("--vae-tiling", nargs="+", type=parse_bool, default=[True])
+    parser.add_argument("--rng-type", default="default")
+    parser.add_argument("--threads", type=int, default=-1, help="Backend threads, -1 for the library default.")
+    parser.add_argument("--prompt", default="a photograph of an astronaut riding a horse")
+    parser.add_argument("--cfg-scale", type=float, default=7.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per cell.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per cell.")
+    parser.add_argument("--output", help="Write results to this .csv or .json file.")
+    parser.add_argument("--baseline", help="Compare against a previous .csv or .json result file and exit with 1 on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed slowdown against the baseline, as a fraction.")
+    parser.add_argument("--mock", action="store_true", help="Use the mock backend instead of stable_diffusion_cpp.")
+    arguments: argparse.Namespace = parser.parse_args()
+
+    # The backend is picked lazily, on the first model load, so setting this before the benchmark starts is enough.
+    if arguments.mock:
+        os.environ[constants.MOCK_BACKEND_ENVIRONMENT_VARIABLE] = "1"
+
+    from modules import settings
+    from modules import benchmark
+
+    settings.load()
+    sys.exit(benchmark.run(arguments))
@@ -1,18 +1,35 @@
-from typing import Any
+import time
+# Taken before the imports below, so the reported startup times include loading Gradio.
+startup_time: float = time.perf_counter()
 
-import gradio as gr
-import gradio.themes
 
-from modules.core import shared
-from modules import settings
-from modules import im_backend
-from modules.ui import sidebar
-from modules.ui import tab_t2i
-from modules.ui import tab_i2i
+if __name__ == "__main__":
+    # Worker processes re-run this module as their main module, so the UI imports stay behind the guard.
+    from typing import Any
+    import webbrowser
+    import contextlib
 
+    import fastapi
+    import uvicorn
+    import gradio as gr
+    import gradio.themes
 
-if __name__ == "__main__":
-    def create_base_interface() -> tuple[gr.Textbox, gr.Textbox, gr.Number, gr.Slider, gr.Dropdown, gr.Slider, gr.Slider, gr.Slider, gr.Button]:
+    from modules.core import constants
+    from modules.core import shared
+    from modules import settings
+    from modules import im_backend
+    from modules import diffuser_pool
+    from modules import preloader
+    from modules import worker_pool
+    from modules import job_journal
+    from modules import file_watcher
+    from modules import api
+    from modules.ui import sidebar
+    from modules.ui import tab_t2i
+    from modules.ui import tab_i2i
+    from modules.ui import generation_runner
+
+    def create_base_interface() -> tuple[gr.Textbox, gr.Textbox, gr.Number, gr.Slider, gr.Dropdown, gr.Slider, gr.Slider, gr.Slider, gr.Slider, gr.Slider, gr.Dropdown, gr.Button, gr.Button, gr.Markdown]:
         with gr.Row(equal_height=True):
             with gr.Column(scale=4):
                 positive_prompt_textbox: gr.Textbox = gr.Textbox(
@@ -44,20 +61,7 @@ if __name__ == "__main__":
                     show_reset_button=False,
                 )
                 sampler_dropdown: gr.Dropdown = gr.Dropdown(
-                    choices=(
-                        "euler_a",
-                        "euler",
-                        "heun",
-                        "dpm2",
-                        "dpmpp2s_a",
-                        "dpmpp2m",
-                        "dpmpp2mv2",
-                        "ipndm",
-                        "ipndm_v",
-                        "lcm",
-                        "ddim_trailing",
-                        "tcd",
-                    ),
+                    choices=constants.SAMPLERS,
                     value="euler",
                     label="Sampler",
                     interactive=True,
@@ -94,31 +98,108 @@ if __name__ == "__main__":
                 interactive=True,
                 show_reset_button=False,
             )
-            generate_button: gr.Button = gr.Button(
-                value="Generate",
-                variant="primary",
-                interactive=False,
-                elem_classes="generate-image-button",
+            with gr.Column(scale=1):
+                generate_button: gr.Button = gr.Button(
+                    value="Generate",
+                    variant="primary",
+                    interactive=False,
+                    elem_classes="generate-image-button",
+                )
+                cancel_button: gr.Button = gr.Button(
+                    value="Cancel",
+                    variant="stop",
+                    size="sm",
+                )
+        with gr.Row(equal_height=True):
+            batch_count_slider: gr.Slider = gr.Slider(
+                minimum=1.0,
+                maximum=32.0,
+                value=1.0,
+                step=1.0,
+                precision=0,
+                label="Batch Count",
+                info="Backend calls per click",
+                scale=2,
+                interactive=True,
+                show_reset_button=False,
+            )
+            batch_size_slider: gr.Slider = gr.Slider(
+                minimum=1.0,
+                maximum=8.0,
+                value=1.0,
+                step=1.0,
+                precision=0,
+                label="Batch Size",
+                info="Images per backend call",
+                scale=2,
+                interactive=True,
+                show_reset_button=False,
+            )
+            seed_mode_dropdown: gr.Dropdown = gr.Dropdown(
+                choices=(
+                    "increment",
+                    "random",
+                ),
+                value="increment",
+                label="Seed Mode",
+                info="Seed of each following batch",
                 scale=1,
+                interactive=True,
             )
-        return positive_prompt_textbox, negative_prompt_textbox, seed_number, steps_slider, sampler_dropdown, cfg_scale_slider, width_slider, height_slider, generate_button
+        status_markdown: gr.Markdown = gr.Markdown()
+        return positive_prompt_textbox, negative_prompt_textbox, seed_number, steps_slider, sampler_dropdown, cfg_scale_slider, width_slider, height_slider, batch_count_slider, batch_size_slider, seed_mode_dropdown, generate_button, cancel_button, status_markdown
 
     def on_demo_load():
+        global is_first_page_load
+
+        if is_first_page_load:
+            is_first_page_load = False
+            print(f"Time to first page: {time.perf_counter() - startup_time:.2f}s.")
+
+        # Read from the settings rather than the last values set in a page, since the file may have been edited since.
         outputs: list[Any] = []
-        for setting_component_value in shared.setting_component_values.values():
-            outputs.append(setting_component_value)
+        for key, default_value in shared.setting_component_keys.values():
+            outputs.append(settings.get_key(key, default_value))
         if len(outputs) == 1:
             return outputs[0]
         return outputs
 
+    def on_file_watch_timer_tick(seen_version: int):
+        version: int = file_watcher.get_version()
+        if version == seen_version:
+            return (seen_version, gr.update()) + (gr.update(),) * len(shared.setting_components)
+
+        image_model_choices: list[tuple[str, str]] = im_backend.get_image_model_choices()
+        setting_updates: list[Any] = []
+        for component, (key, default_value) in zip(shared.setting_components, shared.setting_component_keys.values()):
+            if component is sidebar_r.default_image_model_dropdown.instance:
+                setting_updates.append(gr.update(value=settings.get_key(key, default_value), choices=[("None", "")] + image_model_choices))
+            else:
+                setting_updates.append(gr.update(value=settings.get_key(key, default_value)))
+        return (version, gr.update(choices=image_model_choices), *setting_updates)
+
+    def on_readiness_timer_tick():
+        active_key: diffuser_pool.Key | None = diffuser_pool.get_active_key()
+        return (
+            gr.Timer(active=preloader.is_busy()),
+            gr.update(value="Loading..." if preloader.is_busy() else "Load", interactive=not preloader.is_busy()),
+            gr.update(interactive=im_backend.is_diffuser_loaded()),
+            gr.update(interactive=im_backend.is_diffuser_loaded()),
+            gr.update(value=active_key.image_model) if active_key is not None else gr.update(),
+        )
+
+    is_first_page_load: bool = True
+
     settings.load()
     settings.save()
+    worker_pool.configure()
+    preloader.start()
+    job_journal.recover()
+    file_watcher.start()
 
     with gr.Blocks(theme=gradio.themes.Origin(), analytics_enabled=False, title="CUDIFFUSION", css_paths="main.css") as demo:
         sidebar_r: sidebar.Element = sidebar.Element()
 
-        is_diffuser_busy: gr.State = gr.State(False)
-
         with gr.Row():
             clip_skip_slider: gr.Slider = gr.Slider(
                 minimum=0.0,
@@ -133,40 +214,183 @@ if __name__ == "__main__":
             gr.Column(scale=5)
         with gr.Tabs():
             with gr.Tab("🎨 Text-to-Image") as tab_1:
-                t2i_positive_prompt_textbox, t2i_negative_prompt_textbox, t2i_seed_number, t2i_steps_slider, t2i_sampler_dropdown, t2i_cfg_scale_slider, t2i_width_slider, t2i_height_slider, t2i_generate_button = create_base_interface()
-                t2i_output: gr.Image = gr.Image(
-                    width=560,
+                t2i_positive_prompt_textbox, t2i_negative_prompt_textbox, t2i_seed_number, t2i_steps_slider, t2i_sampler_dropdown, t2i_cfg_scale_slider, t2i_width_slider, t2i_height_slider, t2i_batch_count_slider, t2i_batch_size_slider, t2i_seed_mode_dropdown, t2i_generate_button, t2i_cancel_button, t2i_status_markdown = create_base_interface()
+                with gr.Accordion(label="Hires", open=False):
+                    with gr.Row(equal_height=True):
+                        t2i_hires_checkbox: gr.Checkbox = gr.Checkbox(
+                            value=False,
+                            label="Enable",
+                            info="Upscale, then refine in tiles",
+                            scale=1,
+                            interactive=True,
+                        )
+                        t2i_hires_scale_slider: gr.Slider = gr.Slider(
+                            minimum=1.0,
+                            maximum=4.0,
+                            value=2.0,
+                            step=0.25,
+                            label="Upscale Factor",
+                            scale=2,
+                            interactive=True,
+                            show_reset_button=False,
+                        )
+                        t2i_hires_tile_size_slider: gr.Slider = gr.Slider(
+                            minimum=256.0,
+                            maximum=1024.0,
+                            value=512.0,
+                            step=64.0,
+                            precision=0,
+                            label="Tile Size",
+                            scale=2,
+                            interactive=True,
+                            show_reset_button=False,
+                        )
+                        t2i_hires_tile_overlap_slider: gr.Slider = gr.Slider(
+                            minimum=0.0,
+                            maximum=256.0,
+                            value=64.0,
+                            step=8.0,
+                            precision=0,
+                            label="Tile Overlap",
+                            info="Blended across seams",
+                            scale=2,
+                            interactive=True,
+                            show_reset_button=False,
+                        )
+                        t2i_hires_strength_slider: gr.Slider = gr.Slider(
+                            minimum=0.05,
+                            maximum=1.0,
+                            value=0.35,
+                            step=0.05,
+                            label="Refine Strength",
+                            scale=2,
+                            interactive=True,
+                            show_reset_button=False,
+                        )
+                with gr.Accordion(label="Sweep", open=False):
+                    with gr.Row(equal_height=True):
+                        t2i_sweep_seeds_textbox: gr.Textbox = gr.Textbox(
+                            label="Seeds",
+                            placeholder="1, 2, 3",
+                            interactive=True,
+                        )
+                        t2i_sweep_steps_textbox: gr.Textbox = gr.Textbox(
+                            label="Steps",
+                            placeholder="10, 20, 30",
+                            interactive=True,
+                        )
+                        t2i_sweep_cfg_scales_textbox: gr.Textbox = gr.Textbox(
+                            label="CFG Scales",
+                            placeholder="5, 7.5",
+                            interactive=True,
+                        )
+                        t2i_sweep_samplers_textbox: gr.Textbox = gr.Textbox(
+                            label="Samplers",
+                            placeholder="euler, euler_a",
+                            interactive=True,
+                        )
+                        t2i_sweep_clip_skips_textbox: gr.Textbox = gr.Textbox(
+                            label="CLIP Skips",
+                            placeholder="0, 2",
+                            interactive=True,
+                        )
+                        t2i_sweep_sizes_textbox: gr.Textbox = gr.Textbox(
+                            label="Sizes",
+                            placeholder="512x512, 512x768",
+                            interactive=True,
+                        )
+                    with gr.Row(equal_height=True):
+                        gr.Markdown("Comma-separated values; empty fields keep the value set above. Every combination runs as one job.")
+                        t2i_sweep_button: gr.Button = gr.Button(
+                            value="Run Sweep",
+                            variant="secondary",
+                            size="sm",
+                        )
+                with gr.Accordion(label="Variations", open=False):
+                    with gr.Row(equal_height=True):
+                        t2i_variation_count_slider: gr.Slider = gr.Slider(
+                            minimum=2.0,
+                            maximum=constants.MAX_VARIATIONS,
+                            value=8.0,
+                            step=1.0,
+                            precision=0,
+                            label="Variations",
+                            info="Consecutive seeds from the seed above, in as few backend calls as fit in memory",
+                            scale=4,
+                            interactive=True,
+                            show_reset_button=False,
+                        )
+                        t2i_variations_button: gr.Button = gr.Button(
+                            value="Generate Variations",
+                            variant="secondary",
+                            size="sm",
+                            scale=1,
+                        )
+                    gr.Markdown("Select an image to copy its seed into the seed field.")
+                t2i_output: gr.Gallery = gr.Gallery(
                     height=320,
+                    columns=4,
                     type="pil",
-                    label="Generated Image",
+                    label="Generated Images",
                     interactive=False,
                     show_fullscreen_button=False,
                 )
+                with gr.Accordion(label="Retrieve Job", open=False):
+                    with gr.Row(equal_height=True):
+                        t2i_job_id_textbox: gr.Textbox = gr.Textbox(
+                            label="Job ID",
+                            info="Shown in the status while a generation is queued",
+                            scale=4,
+                            interactive=True,
+                        )
+                        t2i_retrieve_job_button: gr.Button = gr.Button(
+                            value="Retrieve",
+                            variant="secondary",
+                            size="sm",
+                            scale=1,
+                        )
             with gr.Tab("♻️ Image-to-Image") as tab_2:
-                i2i_positive_prompt_textbox, i2i_negative_prompt_textbox, i2i_seed_number, i2i_steps_slider, i2i_sampler_dropdown, i2i_cfg_scale_slider, i2i_width_slider, i2i_height_slider, i2i_generate_button = create_base_interface()
+                i2i_positive_prompt_textbox, i2i_negative_prompt_textbox, i2i_seed_number, i2i_steps_slider, i2i_sampler_dropdown, i2i_cfg_scale_slider, i2i_width_slider, i2i_height_slider, i2i_batch_count_slider, i2i_batch_size_slider, i2i_seed_mode_dropdown, i2i_generate_button, i2i_cancel_button, i2i_status_markdown = create_base_interface()
                 with gr.Row():
                     with gr.Column():
                         i2i_reference_image: gr.Image = gr.Image(
                             width=320,
                             height=320,
                             sources="upload",
-                            type="pil",
+                            type="filepath",
                             label="Reference Image",
                             interactive=True,
                             show_fullscreen_button=False,
                         )
+                        with gr.Row(equal_height=True):
+                            i2i_resize_mode_dropdown: gr.Dropdown = gr.Dropdown(
+                                choices=constants.REFERENCE_IMAGE_RESIZE_MODES,
+                                value="crop",
+                                label="Resize Mode",
+                                info="Fit to width and height",
+                                interactive=True,
+                            )
+                            i2i_strength_slider: gr.Slider = gr.Slider(
+                                minimum=0.05,
+                                maximum=1.0,
+                                value=0.75,
+                                step=0.05,
+                                label="Denoising Strength",
+                                interactive=True,
+                                show_reset_button=False,
+                            )
                     with gr.Column():
-                        i2i_output: gr.Image = gr.Image(
-                            width=560,
+                        i2i_output: gr.Gallery = gr.Gallery(
                             height=320,
+                            columns=4,
                             type="pil",
-                            label="Generated Image",
+                            label="Generated Images",
                             interactive=False,
                             show_fullscreen_button=False,
                         )
         gr.HTML("""
         <p style="text-align: center;">
-            <strong>WARNING:</strong> Please do not refresh or close the page at any time unless the app isn't busy.
+            Queued generations keep running if you refresh or close the page; use their job ID to retrieve the results.
         </p>
         """)
 
@@ -177,21 +401,173 @@ if __name__ == "__main__":
                 sidebar_r.vae_tiling_checkbox.instance,
                 sidebar_r.scheduler_dropdown.instance,
                 sidebar_r.rng_type_dropdown.instance,
-                is_diffuser_busy,
+                t2i_width_slider,
+                t2i_height_slider,
             ),
             outputs=(
                 sidebar_r.load_image_model_button,
                 t2i_generate_button,
                 i2i_generate_button,
+                t2i_width_slider,
+                t2i_height_slider,
+                i2i_width_slider,
+                i2i_height_slider,
             ),
             show_progress="hidden",
+            concurrency_limit=None,
+        )
+
+        sidebar_r.tune_threads_button.click(
+            fn=sidebar_r.on_tune_threads_button_click,
+            inputs=(  # type: ignore
+                sidebar_r.image_model_dropdown,
+                sidebar_r.vae_tiling_checkbox.instance,
+                sidebar_r.scheduler_dropdown.instance,
+                sidebar_r.rng_type_dropdown.instance,
+            ),
+            outputs=(
+                sidebar_r.tune_threads_button,
+                t2i_generate_button,
+                i2i_generate_button,
+            ),
+            show_progress="hidden",
+            concurrency_limit=None,
+        )
+
+        t2i_sweep_button.click(
+            fn=tab_t2i.on_generate_button_click,
+            inputs=(
+                t2i_positive_prompt_textbox,
+            ),
+        ).success(
+            fn=im_backend.mark_diffuser_as_busy,
+            outputs=(
+                tab_1,
+                tab_2,
+                t2i_generate_button,
+                i2i_generate_button,
+            ),
+            show_progress="hidden",
+        ).then(
+            fn=tab_t2i.run_sweep,
+            inputs=(
+                clip_skip_slider,
+                t2i_positive_prompt_textbox,
+                t2i_negative_prompt_textbox,
+                t2i_seed_number,
+                t2i_steps_slider,
+                t2i_sampler_dropdown,
+                t2i_cfg_scale_slider,
+                t2i_width_slider,
+                t2i_height_slider,
+                t2i_sweep_seeds_textbox,
+                t2i_sweep_steps_textbox,
+                t2i_sweep_cfg_scales_textbox,
+                t2i_sweep_samplers_textbox,
+                t2i_sweep_clip_skips_textbox,
+                t2i_sweep_sizes_textbox,
+            ),
+            outputs=(
+                t2i_output,
+                t2i_status_markdown,
+            ),
+            show_progress="hidden",
+            concurrency_limit=None,
+        ).then(
+            fn=im_backend.mark_diffuser_as_idle,
+            outputs=(
+                tab_1,
+                tab_2,
+                t2i_generate_button,
+                i2i_generate_button,
+            ),
+            show_progress="hidden",
+        )
+
+        t2i_variations_button.click(
+            fn=tab_t2i.on_generate_button_click,
+            inputs=(
+                t2i_positive_prompt_textbox,
+            ),
+        ).success(
+            fn=im_backend.mark_diffuser_as_busy,
+            outputs=(
+                tab_1,
+                tab_2,
+                t2i_generate_button,
+                i2i_generate_button,
+            ),
+            show_progress="hidden",
+        ).then(
+            fn=tab_t2i.generate_variations,
+            inputs=(
+                clip_skip_slider,
+                t2i_positive_prompt_textbox,
+                t2i_negative_prompt_textbox,
+                t2i_seed_number,
+                t2i_steps_slider,
+                t2i_sampler_dropdown,
+                t2i_cfg_scale_slider,
+                t2i_width_slider,
+                t2i_height_slider,
+                t2i_variation_count_slider,
+            ),
+            outputs=(
+                t2i_output,
+                t2i_status_markdown,
+            ),
+            show_progress="hidden",
+            concurrency_limit=None,
+        ).then(
+            fn=im_backend.mark_diffuser_as_idle,
+            outputs=(
+                tab_1,
+                tab_2,
+                t2i_generate_button,
+                i2i_generate_button,
+            ),
+            show_progress="hidden",
+        )
+
+        t2i_output.select(
+            fn=generation_runner.on_gallery_select,
+            outputs=(
+                t2i_seed_number,
+            ),
+            show_progress="hidden",
+        )
+        i2i_output.select(
+            fn=generation_runner.on_gallery_select,
+            outputs=(
+                i2i_seed_number,
+            ),
+            show_progress="hidden",
+        )
+
+        t2i_retrieve_job_button.click(
+            fn=generation_runner.retrieve_job,
+            inputs=(
+                t2i_job_id_textbox,
+            ),
+            outputs=(
+                t2i_output,
+                t2i_status_markdown,
+            ),
+            show_progress="hidden",
+        )
+        t2i_cancel_button.click(
+            fn=im_backend.cancel_pending_jobs,
+            show_progress="hidden",
+        )
+        i2i_cancel_button.click(
+            fn=im_backend.cancel_pending_jobs,
+            show_progress="hidden",
         )
 
         t2i_generate_button.click(
             fn=tab_t2i.on_generate_button_click,
             inputs=(
                 t2i_positive_prompt_textbox,
-                is_diffuser_busy,
             ),
         ).success(
             fn=im_backend.mark_diffuser_as_busy,
@@ -200,7 +576,6 @@ if __name__ == "__main__":
                 tab_2,
                 t2i_generate_button,
                 i2i_generate_button,
-                is_diffuser_busy,
             ),
             show_progress="hidden",
         ).then(
@@ -215,9 +590,21 @@ if __name__ == "__main__":
                 t2i_cfg_scale_slider,
                 t2i_width_slider,
                 t2i_height_slider,
+                t2i_batch_count_slider,
+                t2i_batch_size_slider,
+                t2i_seed_mode_dropdown,
+                t2i_hires_checkbox,
+                t2i_hires_scale_slider,
+                t2i_hires_tile_size_slider,
+                t2i_hires_tile_overlap_slider,
+                t2i_hires_strength_slider,
+            ),
+            outputs=(
+                t2i_output,
+                t2i_status_markdown,
             ),
-            outputs=t2i_output,
             show_progress="hidden",
+            concurrency_limit=None,
         ).then(
             fn=im_backend.mark_diffuser_as_idle,
             outputs=(
@@ -225,7 +612,6 @@ if __name__ == "__main__":
                 tab_2,
                 t2i_generate_button,
                 i2i_generate_button,
-                is_diffuser_busy,
             ),
             show_progress="hidden",
         )
@@ -234,7 +620,6 @@ if __name__ == "__main__":
             fn=tab_i2i.on_generate_button_click,
             inputs=(
                 i2i_reference_image,
-                is_diffuser_busy,
             ),
         ).success(
             fn=im_backend.mark_diffuser_as_busy,
@@ -243,7 +628,6 @@ if __name__ == "__main__":
                 tab_2,
                 t2i_generate_button,
                 i2i_generate_button,
-                is_diffuser_busy,
             ),
             show_progress="hidden",
         ).then(
@@ -258,10 +642,19 @@ if __name__ == "__main__":
                 i2i_cfg_scale_slider,
                 i2i_width_slider,
                 i2i_height_slider,
+                i2i_batch_count_slider,
+                i2i_batch_size_slider,
+                i2i_seed_mode_dropdown,
                 i2i_reference_image,
+                i2i_resize_mode_dropdown,
+                i2i_strength_slider,
+            ),
+            outputs=(
+                i2i_output,
+                i2i_status_markdown,
             ),
-            outputs=i2i_output,
             show_progress="hidden",
+            concurrency_limit=None,
         ).then(
             fn=im_backend.mark_diffuser_as_idle,
             outputs=(
@@ -269,18 +662,41 @@ if __name__ == "__main__":
                 tab_2,
                 t2i_generate_button,
                 i2i_generate_button,
-                is_diffuser_busy,
             ),
             show_progress="hidden",
         )
 
+        # Polls until the startup preload settles, so the generate buttons enable as soon as the model is hot.
+        readiness_timer: gr.Timer = gr.Timer(value=constants.READINESS_POLL_INTERVAL, active=preloader.is_busy())
+        readiness_timer.tick(
+            fn=on_readiness_timer_tick,
+            outputs=(
+                readiness_timer,
+                sidebar_r.load_image_model_button,
+                t2i_generate_button,
+                i2i_generate_button,
+                sidebar_r.image_model_dropdown,
+            ),
+            show_progress="hidden",
+        )
+
+        # Each page keeps the watcher version it last applied, so quiet ticks send no updates.
+        file_watch_version_state: gr.State = gr.State(file_watcher.get_version())
+        file_watch_timer: gr.Timer = gr.Timer(value=constants.FILE_WATCH_INTERVAL)
+        file_watch_timer.tick(
+            fn=on_file_watch_timer_tick,
+            inputs=file_watch_version_state,
+            outputs=[file_watch_version_state, sidebar_r.image_model_dropdown] + shared.setting_components,
+            show_progress="hidden",
+        )
+
         demo.load(
             fn=on_demo_load,
             outputs=shared.setting_components,
             show_progress="hidden",
         ).then(
             fn=lambda: (
-                gr.update(choices=im_backend.get_image_models()),
+                gr.update(choices=im_backend.get_image_model_choices()),
                 gr.update(interactive=im_backend.is_diffuser_loaded()),
                 gr.update(interactive=im_backend.is_diffuser_loaded()),
             ),
@@ -292,4 +708,14 @@ if __name__ == "__main__":
             show_progress="hidden",
         )
 
-    demo.launch(inbrowser=True, server_port=4200)
+    @contextlib.asynccontextmanager
+    async def lifespan(_: fastapi.FastAPI):
+        print(f"Server ready in {time.perf_counter() - startup_time:.2f}s.")
+        webbrowser.open(f"http://127.0.0.1:{constants.SERVER_PORT}/")
+        yield
+
+    app: fastapi.FastAPI = fastapi.FastAPI(lifespan=lifespan)
+    app.include_router(api.router)
+    app.include_router(api.metrics_router)
+    app = gr.mount_gradio_app(app, demo, path="/")
+    uvicorn.run(app, host="127.0.0.1", port=constants.SERVER_PORT)
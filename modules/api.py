@@ -0,0 +1,282 @@
+from typing import Any, Literal
+import io
+import os
+import json
+import base64
+import binascii
+
+import fastapi
+import fastapi.responses
+import fastapi.concurrency
+import pydantic
+from PIL import Image
+
+from modules.core import constants
+from modules import settings
+from modules import im_backend
+from modules import diffuser_pool
+from modules import job_queue
+from modules import generation
+from modules import model_catalog
+from modules import preloader
+from modules import thread_tuner
+from modules import reference_image
+from modules import metrics
+from modules import job_journal
+from modules import output_store
+
+
+class HiresPayload(pydantic.BaseModel):
+    scale: float = pydantic.Field(default=2.0, ge=1.0, le=4.0)
+    # Left out, tiles default to the native resolution of the model's architecture.
+    tile_size: int | None = pydantic.Field(default=None, ge=256, le=1024, multiple_of=64)
+    tile_overlap: int = pydantic.Field(default=64, ge=0, le=256)
+    strength: float = pydantic.Field(default=0.35, gt=0.0, le=1.0)
+
+
+class GenerationPayload(pydantic.BaseModel):
+    prompt: str = pydantic.Field(min_length=1)
+    negative_prompt: str = ""
+    model: str | None = None
+    seed: int = -1
+    steps: int = pydantic.Field(default=20, ge=1, le=100)
+    sampler: str = "euler"
+    cfg_scale: float = pydantic.Field(default=7.0, ge=0.0, le=30.0)
+    clip_skip: int = pydantic.Field(default=0, ge=0, le=2)
+    # Left out, the sizes default to the native resolution of the model's architecture.
+    width: int | None = pydantic.Field(default=None, ge=64, le=2048, multiple_of=64)
+    height: int | None = pydantic.Field(default=None, ge=64, le=2048, multiple_of=64)
+    batch_size: int = pydantic.Field(default=1, ge=1, le=8)
+    priority: int = 0
+    mode: Literal["sync", "async"] = "sync"
+    init_image: str | None = None
+    strength: float = pydantic.Field(default=0.75, gt=0.0, le=1.0)
+    resize_mode: Literal["crop", "pad", "stretch"] = "crop"
+    hires: HiresPayload | None = None
+
+    @pydantic.field_validator("sampler")
+    @classmethod
+    def validate_sampler(cls, sampler: str) -> str:
+        if sampler not in constants.SAMPLERS:
+            raise ValueError(f"Unknown sampler '{sampler}', expected one of {', '.join(constants.SAMPLERS)}.")
+        return sampler
+
+
+router: fastapi.APIRouter = fastapi.APIRouter(prefix="/api/v1")
+# Scrapers expect the metrics at the root rather than under the versioned API prefix.
+metrics_router: fastapi.APIRouter = fastapi.APIRouter()
+
+
+@metrics_router.get("/metrics", response_class=fastapi.responses.PlainTextResponse)
+def get_metrics() -> str:
+    return metrics.render()
+
+
+@router.get("/models")
+def get_models() -> dict[str, Any]:
+    active_key: diffuser_pool.Key | None = diffuser_pool.get_active_key()
+    image_models: list[str] = im_backend.get_image_models()
+    return {
+        "models": image_models,
+        "catalog": {image_model: model_catalog.get_info(image_model) for image_model in image_models},
+        "active": active_key.image_model if active_key is not None else None,
+    }
+
+
+@router.get("/health")
+def get_health() -> dict[str, Any]:
+    return {
+        "ready": im_backend.is_diffuser_loaded() and not preloader.is_busy(),
+        "preload": preloader.get_state(),
+        "busy": job_queue.is_busy(),
+    }
+
+
+@router.post("/txt2img")
+def text_to_image(payload: GenerationPayload) -> fastapi.responses.JSONResponse:
+    return __submit(payload, None)
+
+
+@router.post("/img2img")
+async def image_to_image(request: fastapi.Request) -> fastapi.responses.JSONResponse:
+    # Accepts either a JSON body with a base64 `init_image`, or a multipart form with the
+    # image as an `init_image` file and the remaining fields as a JSON `payload` field.
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form: Any = await request.form()
+            payload: GenerationPayload = GenerationPayload.model_validate_json(form.get("payload", "{}"))
+            upload: Any = form.get("init_image")
+            if upload is None or isinstance(upload, str):
+                raise fastapi.HTTPException(status_code=400, detail="Missing 'init_image' file.")
+            image_bytes: bytes = await upload.read()
+        else:
+            payload = GenerationPayload.model_validate(await request.json())
+            if payload.init_image is None:
+                raise fastapi.HTTPException(status_code=400, detail="Missing 'init_image'.")
+            # Tolerate data URLs as produced by browsers' FileReader.
+            image_bytes = base64.b64decode(payload.init_image.split(",", 1)[-1], validate=True)
+    except (pydantic.ValidationError, json.JSONDecodeError) as exception:
+        raise fastapi.HTTPException(status_code=422, detail=str(exception))
+    except binascii.Error:
+        raise fastapi.HTTPException(status_code=400, detail="'init_image' is not a valid image.")
+
+    # Decoding and the synchronous wait must not block the event loop.
+    return await fastapi.concurrency.run_in_threadpool(__submit, payload, image_bytes)
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str) -> fastapi.responses.JSONResponse:
+    job: job_queue.Job | None = job_queue.get_job(job_id)
+    if job is not None:
+        return __get_job_response(job)
+
+    # Jobs from before a restart, or too old for the in-memory history, are answered from the journal.
+    entry: dict[str, Any] | None = job_journal.get(job_id)
+    if entry is None:
+        raise fastapi.HTTPException(status_code=404, detail="Unknown job.")
+    content: dict[str, Any] = {
+        "job_id": job_id,
+        "status": entry["status"],
+    }
+    if entry["status"] == "done":
+        try:
+            content["images"] = [__encode_file(path) for path in entry["paths"]]
+        except OSError:
+            raise fastapi.HTTPException(status_code=410, detail="The results of this job are no longer available.")
+    elif entry["error"] is not None:
+        content["error"] = entry["error"]
+    return fastapi.responses.JSONResponse(content, status_code=200 if entry["status"] in ("done", "failed", "cancelled") else 202)
+
+
+@router.get("/jobs/{job_id}/images/{image_index}")
+def get_job_image(job_id: str, image_index: int) -> fastapi.responses.Response:
+    # Saved outputs are streamed straight from disk, so fetching them never decodes or re-encodes the image.
+    job: job_queue.Job | None = job_queue.get_job(job_id)
+    paths: list[str | None]
+    if job is not None:
+        if job.status != "done":
+            raise fastapi.HTTPException(status_code=409, detail=f"The job is {job.status}.")
+        paths = [output_store.get_path(image) for image in job_journal.get_images(job)]
+    else:
+        entry: dict[str, Any] | None = job_journal.get(job_id)
+        if entry is None:
+            raise fastapi.HTTPException(status_code=404, detail="Unknown job.")
+        if entry["status"] != "done":
+            raise fastapi.HTTPException(status_code=409, detail=f"The job is {entry['status']}.")
+        paths = entry["paths"]
+    if not 0 <= image_index < len(paths):
+        raise fastapi.HTTPException(status_code=404, detail="Unknown image.")
+
+    path: str | None = paths[image_index]
+    if path is None:
+        return fastapi.responses.Response(__encode_png(job_journal.get_images(job)[image_index]), media_type="image/png")
+    if not os.path.isfile(path):
+        raise fastapi.HTTPException(status_code=410, detail="The results of this job are no longer available.")
+    return fastapi.responses.FileResponse(path)
+
+
+@router.delete("/jobs/{job_id}")
+def cancel_job(job_id: str) -> dict[str, Any]:
+    if job_queue.get_job(job_id) is None:
+        raise fastapi.HTTPException(status_code=404, detail="Unknown job.")
+    return {"cancelled": job_queue.cancel(job_id)}
+
+
+def __submit(payload: GenerationPayload, image_bytes: bytes | None) -> fastapi.responses.JSONResponse:
+    diffuser_key: diffuser_pool.Key | None = diffuser_pool.get_active_key()
+    if payload.model is not None:
+        if payload.model not in im_backend.get_image_models():
+            raise fastapi.HTTPException(status_code=404, detail=f"Unknown model '{payload.model}'.")
+        diffuser_key = diffuser_pool.Key(
+            payload.model,
+            settings.get_key("image_model/use_vae_tiling", constants.DEFAULT_SETTINGS["image_model"]["use_vae_tiling"]),
+            settings.get_key("image_model/scheduler", constants.DEFAULT_SETTINGS["image_model"]["scheduler"]),
+            settings.get_key("image_model/rng_type", constants.DEFAULT_SETTINGS["image_model"]["rng_type"]),
+            n_threads=thread_tuner.get_thread_count(payload.model),
+        )
+    if diffuser_key is None:
+        raise fastapi.HTTPException(status_code=409, detail="No image model is loaded and none was requested.")
+    default_resolution: int = model_catalog.get_default_resolution(diffuser_key.image_model)
+    width: int = payload.width if payload.width is not None else default_resolution
+    height: int = payload.height if payload.height is not None else default_resolution
+
+    prepared_image: reference_image.PreparedImage | None = None
+    if image_bytes is not None:
+        try:
+            prepared_image = reference_image.prepare(image_bytes, width, height, payload.resize_mode)
+        except OSError:
+            raise fastapi.HTTPException(status_code=400, detail="'init_image' is not a valid image.")
+
+    generation_request: generation.Request = generation.Request(
+        diffuser_key=diffuser_key,
+        clip_skip=payload.clip_skip,
+        positive_prompt=payload.prompt,
+        negative_prompt=payload.negative_prompt,
+        seed=generation.resolve_seeds(payload.seed, 1, payload.batch_size, "increment")[0],
+        steps=payload.steps,
+        sampler=payload.sampler,
+        cfg_scale=payload.cfg_scale,
+        width=width,
+        height=height,
+        reference_image=prepared_image.image if prepared_image is not None else None,
+        strength=payload.strength,
+        hires=generation.HiresOptions(
+            payload.hires.scale,
+            payload.hires.tile_size if payload.hires.tile_size is not None else default_resolution,
+            payload.hires.tile_overlap,
+            payload.hires.strength,
+        ) if payload.hires is not None else None,
+        batch_size=payload.batch_size,
+        use_cache=payload.seed >= 0,
+    )
+
+    cached_images: list[Image.Image] | None = generation.get_cached(generation_request)
+    job: job_queue.Job
+    if cached_images is not None:
+        job = job_journal.complete(generation_request, cached_images, owner="api")
+    else:
+        job = job_journal.submit(generation_request, priority=payload.priority, owner="api")
+
+    if payload.mode == "sync":
+        job.wait(constants.API_SYNC_TIMEOUT)
+    return __get_job_response(job, generation_request.seed, prepared_image.resampled if prepared_image is not None else None)
+
+
+def __get_job_response(job: job_queue.Job, seed: int | None = None, resampled: bool | None = None) -> fastapi.responses.JSONResponse:
+    content: dict[str, Any] = {
+        "job_id": job.id,
+        "status": job.status,
+        "position": job_queue.get_position(job),
+        "eta": job_queue.get_eta(job),
+    }
+    if seed is not None:
+        content["seed"] = seed
+    if resampled is not None:
+        content["resampled"] = resampled
+    if job.status == "done":
+        content["images"] = [__encode_image(image) for image in job_journal.get_images(job)]
+    elif job.status == "failed":
+        content["error"] = repr(job.exception)
+    return fastapi.responses.JSONResponse(content, status_code=200 if job.is_done() else 202)
+
+
+def __encode_image(image: Image.Image) -> str:
+    # An image that was already saved is sent as the bytes on disk instead of being encoded a second time.
+    path: str | None = output_store.get_path(image)
+    if path is not None:
+        try:
+            return __encode_file(path)
+        except OSError:
+            pass
+    return base64.b64encode(__encode_png(image)).decode("ascii")
+
+
+def __encode_file(path: str) -> str:
+    with open(path, "rb") as file:
+        return base64.b64encode(file.read()).decode("ascii")
+
+
+def __encode_png(image: Image.Image) -> bytes:
+    buffer: io.BytesIO = io.BytesIO()
+    image.save(buffer, format="png")
+    return buffer.getvalue()
@@ -0,0 +1,155 @@
+from typing import Any
+import os
+import csv
+import json
+import time
+import argparse
+import itertools
+
+from modules import memory_info
+from modules import diffuser_pool
+from modules import generation
+
+
+FIELDS: tuple[str, ...] = (
+    "model",
+    "sampler",
+    "scheduler",
+    "steps",
+    "width",
+    "height",
+    "use_vae_tiling",
+    "load_time",
+    "step_time",
+    "latency",
+    "peak_rss",
+    "images_per_second",
+)
+CONFIGURATION_FIELDS: tuple[str, ...] = FIELDS[:7]
+
+
+def run(arguments: argparse.Namespace) -> int:
+    results: list[dict[str, Any]] = []
+    # Loading is keyed by scheduler and VAE tiling, so sweep those outermost and reuse each load for every inner cell.
+    for scheduler, use_vae_tiling in itertools.product(arguments.schedulers, arguments.vae_tiling):
+        diffuser_key: diffuser_pool.Key = diffuser_pool.Key(arguments.model, use_vae_tiling, scheduler, arguments.rng_type, n_threads=arguments.threads)
+        start_time: float = time.perf_counter()
+        diffuser_pool.acquire(diffuser_key)
+        load_time: float = time.perf_counter() - start_time
+
+        for sampler, steps, (width, height) in itertools.product(arguments.samplers, arguments.steps, arguments.resolutions):
+            result: dict[str, Any] = __run_cell(arguments, diffuser_key, sampler, steps, width, height)
+            result["load_time"] = load_time
+            results.append(result)
+            print(", ".join(f"{field}={__format_value(result[field])}" for field in FIELDS))
+
+    if arguments.output is not None:
+        save_results(arguments.output, results)
+        print(f"Saved {len(results)} result(s) to '{arguments.output}'.")
+
+    if arguments.baseline is not None:
+        regressions: list[str] = compare(load_results(arguments.baseline), results, arguments.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if len(regressions) > 0:
+            return 1
+        print(f"No regressions beyond {arguments.tolerance * 100.0:.0f}% against '{arguments.baseline}'.")
+    return 0
+
+
+def save_results(path: str, results: list[dict[str, Any]]) -> None:
+    directory: str = os.path.dirname(path)
+    if directory != "":
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "wt", newline="") as file:
+        if path.endswith(".csv"):
+            writer: csv.DictWriter[str] = csv.DictWriter(file, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+        else:
+            json.dump(results, file, indent=4)
+
+
+def load_results(path: str) -> list[dict[str, Any]]:
+    with open(path, "rt", newline="") as file:
+        if path.endswith(".csv"):
+            return [__parse_csv_row(row) for row in csv.DictReader(file)]
+        return json.load(file)
+
+
+def compare(baseline: list[dict[str, Any]], results: list[dict[str, Any]], tolerance: float) -> list[str]:
+    baseline_by_configuration: dict[tuple[Any, ...], dict[str, Any]] = {
+        tuple(row[field] for field in CONFIGURATION_FIELDS): row for row in baseline
+    }
+    regressions: list[str] = []
+    for result in results:
+        configuration: tuple[Any, ...] = tuple(result[field] for field in CONFIGURATION_FIELDS)
+        baseline_result: dict[str, Any] | None = baseline_by_configuration.get(configuration)
+        if baseline_result is None:
+            continue
+        for field in ("latency", "step_time"):
+            if baseline_result[field] > 0.0 and result[field] > baseline_result[field] * (1.0 + tolerance):
+                change: float = (result[field] / baseline_result[field] - 1.0) * 100.0
+                regressions.append(
+                    f"{', '.join(f'{name}={value}' for name, value in zip(CONFIGURATION_FIELDS, configuration))}: "
+                    f"{field} {baseline_result[field]:.3f}s -> {result[field]:.3f}s (+{change:.1f}%)"
+                )
+    return regressions
+
+
+def __run_cell(arguments: argparse.Namespace, diffuser_key: diffuser_pool.Key, sampler: str, steps: int, width: int, height: int) -> dict[str, Any]:
+    generation_request: generation.Request = generation.Request(
+        diffuser_key=diffuser_key,
+        clip_skip=0,
+        positive_prompt=arguments.prompt,
+        negative_prompt="",
+        seed=arguments.seed,
+        steps=steps,
+        sampler=sampler,
+        cfg_scale=arguments.cfg_scale,
+        width=width,
+        height=height,
+        save_outputs=False,
+    )
+    for _ in range(arguments.warmup):
+        generation.run(generation_request)
+
+    step_times: list[float] = []
+    latencies: list[float] = []
+    memory_info.reset_peak_rss()
+    for _ in range(arguments.repeats):
+        start_time: float = time.perf_counter()
+        generation.run(generation_request, lambda step, steps, step_time: step_times.append(step_time))
+        latencies.append(time.perf_counter() - start_time)
+
+    latency: float = sum(latencies) / len(latencies)
+    return {
+        "model": diffuser_key.image_model,
+        "sampler": sampler,
+        "scheduler": diffuser_key.scheduler,
+        "steps": steps,
+        "width": width,
+        "height": height,
+        "use_vae_tiling": diffuser_key.use_vae_tiling,
+        "step_time": sum(step_times) / len(step_times) if len(step_times) > 0 else 0.0,
+        "latency": latency,
+        "peak_rss": memory_info.get_peak_rss() / 1024 ** 2,
+        "images_per_second": 1.0 / latency if latency > 0.0 else 0.0,
+    }
+
+
+def __parse_csv_row(row: dict[str, str]) -> dict[str, Any]:
+    parsed: dict[str, Any] = dict(row)
+    for field in ("steps", "width", "height"):
+        parsed[field] = int(row[field])
+    for field in ("load_time", "step_time", "latency", "peak_rss", "images_per_second"):
+        parsed[field] = float(row[field])
+    parsed["use_vae_tiling"] = row["use_vae_tiling"] == "True"
+    return parsed
+
+
+def __format_value(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
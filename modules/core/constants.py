@@ -2,15 +2,125 @@ from typing import Any
 
 
 VERSION: str = "1.0.0"
+SERVER_PORT: int = 4200
 DEFAULT_SETTINGS: dict[str, Any] = {
     "image_model": {
         "use_vae_tiling": True,
         "scheduler": "default",
         "rng_type": "default",
+        "pool_memory_budget": 12288,
+        "default_model": "",
+        "warm_up": True,
+        "n_threads": -1,
+        "tuned_threads": {},
+    },
+    "queue": {
+        "ordering": "fifo",
+    },
+    "generation": {
+        "preview_interval": 0,
+        "coalesce_seed_sweeps": False,
+    },
+    "output": {
+        "format": "png",
+        "png_compress_level": 4,
+        "webp_lossless": True,
+        "quality": 90,
+    },
+    "workers": {
+        "count": 0,
+        "threads_per_worker": 0,
+        "cpu_affinity": False,
+    },
+    "result_cache": {
+        "enabled": True,
+        "memory_budget": 512,
+        "disk_budget": 4096,
     },
 }
 IMAGE_MODEL_DIR_PATH: str = "models/"
 IMAGE_OUTPUT_DIR_PATH: str = "images/"
 DATA_DIR_PATH: str = "data/"
+RESULT_CACHE_DIR_PATH: str = "data/result_cache/"
+JOB_RESULT_DIR_PATH: str = "data/jobs/"
 SETTINGS_FILENAME: str = "settings.json"
+SETTINGS_SAVE_DELAY: float = 1.0
 WARNING_GENERIC: str = "An error occurred."
+JOB_POLL_INTERVAL: float = 0.25
+JOB_DEFAULT_DURATION: float = 10.0
+JOB_HISTORY_SIZE: int = 64
+PROGRESS_BAR_WIDTH: int = 20
+MAX_SEED: int = 2 ** 31 - 1
+IMAGE_WRITER_THREADS: int = 2
+IMAGE_WRITER_QUEUE_SIZE: int = 16
+OUTPUT_WAIT_TIMEOUT: float = 30.0
+EXIF_IMAGE_DESCRIPTION_TAG: int = 0x010E
+OUTPUT_INDEX_FILENAME: str = "outputs.sqlite3"
+JOB_JOURNAL_FILENAME: str = "jobs.sqlite3"
+JOB_JOURNAL_HISTORY_SIZE: int = 256
+MOCK_BACKEND_ENVIRONMENT_VARIABLE: str = "CUDIFFUSION_MOCK_BACKEND"
+API_SYNC_TIMEOUT: float = 300.0
+WARM_UP_RESOLUTION: int = 64
+WARM_UP_STEPS: int = 1
+READINESS_POLL_INTERVAL: float = 1.0
+WORKER_HEALTH_CHECK_INTERVAL: float = 5.0
+WORKER_PING_TIMEOUT: float = 60.0
+WORKER_STOP_TIMEOUT: float = 5.0
+THREAD_TUNING_RESOLUTION: int = 256
+THREAD_TUNING_STEPS: int = 4
+SAMPLERS: tuple[str, ...] = (
+    "euler_a",
+    "euler",
+    "heun",
+    "dpm2",
+    "dpmpp2s_a",
+    "dpmpp2m",
+    "dpmpp2mv2",
+    "ipndm",
+    "ipndm_v",
+    "lcm",
+    "ddim_trailing",
+    "tcd",
+)
+METRICS_BUCKETS: tuple[float, ...] = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Ordered from the most to the least costly to change between backend calls, which is also the sweep order.
+SWEEP_AXES: dict[str, str] = {
+    "size": "Size",
+    "clip_skip": "CLIP Skip",
+    "sampler": "Sampler",
+    "steps": "Steps",
+    "cfg_scale": "CFG Scale",
+    "seed": "Seed",
+}
+SWEEP_AXIS_RANGES: dict[str, tuple[float, float]] = {
+    "steps": (1, 100),
+    "cfg_scale": (0.0, 30.0),
+    "clip_skip": (0, 2),
+}
+MAX_SWEEP_CELLS: int = 64
+# Larger grids have their cells scaled down to fit, so one sweep never builds a canvas of hundreds of megapixels.
+MAX_SWEEP_GRID_PIXELS: int = 8192 * 8192
+MAX_VARIATIONS: int = 16
+SWEEP_GRID_FONT_SIZE: int = 20
+SWEEP_GRID_PADDING: int = 8
+REFERENCE_IMAGE_CACHE_SIZE: int = 8
+REFERENCE_IMAGE_RESIZE_MODES: tuple[str, ...] = ("crop", "pad", "stretch")
+MODEL_CATALOG_FILENAME: str = "model_catalog.json"
+MODEL_DIGEST_SAMPLES: int = 64
+MODEL_DIGEST_SAMPLE_SIZE: int = 64 * 1024
+FILE_WATCH_INTERVAL: float = 2.0
+MAX_MODEL_HEADER_SIZE: int = 100 * 1024 ** 2
+# Coarse coefficients for the pre-flight memory estimate, taken from the compute buffer sizes the backend logs.
+DIFFUSION_BYTES_PER_PIXEL: int = 2240
+VAE_BYTES_PER_PIXEL: int = 6656
+VAE_TILE_BYTES: int = 416 * 1024 ** 2
+TEXT_ENCODER_WEIGHT_FRACTION: float = 0.15
+VAE_WEIGHT_FRACTION: float = 0.05
+MEMORY_HEADROOM: int = 512 * 1024 ** 2
+ARCHITECTURE_RESOLUTIONS: dict[str, int] = {
+    "SD1.x": 512,
+    "SD2.x": 768,
+    "SDXL": 1024,
+    "SD3": 1024,
+    "Flux": 1024,
+}
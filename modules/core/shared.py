@@ -5,7 +5,4 @@ import gradio as gr
 
 setting_components: list[gr.Component] = []
 setting_component_values: dict[int, Any] = {}
-diffuser: dict[str, Any] = {
-    "id": "",
-    "ref": None,
-}
+setting_component_keys: dict[int, tuple[str, Any]] = {}
@@ -0,0 +1,224 @@
+from typing import Any, NamedTuple
+import os
+import gc
+import time
+import threading
+import collections
+
+from modules.core import constants
+from modules import settings
+from modules import memory_info
+from modules import metrics
+from modules import model_catalog
+from modules import worker_pool
+
+
+class Key(NamedTuple):
+    image_model: str
+    use_vae_tiling: bool
+    scheduler: str
+    rng_type: str
+    keep_clip_on_cpu: bool = False
+    keep_vae_on_cpu: bool = False
+    n_threads: int = -1
+
+
+__entries: collections.OrderedDict[Key, dict[str, Any]] = collections.OrderedDict()
+__active_key: Key | None = None
+__stats: dict[str, Any] = {
+    "hits": 0,
+    "misses": 0,
+    "evictions": 0,
+    "load_time": 0.0,
+    "peak_rss": 0,
+}
+__native_backend: Any = None
+__lock: threading.RLock = threading.RLock()
+__load_lock: threading.Lock = threading.Lock()
+
+
+def acquire(key: Key) -> Any:
+    global __active_key
+
+    with __load_lock:
+        with __lock:
+            entry: dict[str, Any] | None = __entries.get(key)
+            if entry is not None:
+                __entries.move_to_end(key)
+                __stats["hits"] += 1
+                __active_key = key
+                return entry["ref"]
+            __stats["misses"] += 1
+
+        signature: tuple[int, int] | None = model_catalog.get_signature(key.image_model)
+        digest: str | None = model_catalog.get_digest(key.image_model)
+        # In-process, loads and generations share one dispatch thread, so nothing else resets the high-water mark meanwhile.
+        in_process: bool = not worker_pool.is_enabled()
+        if in_process:
+            memory_info.reset_peak_rss()
+        start_time: float = time.perf_counter()
+        try:
+            diffuser: Any = __create_diffuser(key)
+        except BaseException:
+            # Nothing is registered until the load succeeds, so the previously active model stays active;
+            # collecting here releases whatever the failed load had already allocated.
+            gc.collect()
+            metrics.increment("cudiffusion_model_loads_total", {"model": key.image_model, "status": "failed"})
+            raise
+        load_time: float = time.perf_counter() - start_time
+        metrics.increment("cudiffusion_model_loads_total", {"model": key.image_model, "status": "done"})
+        metrics.observe("cudiffusion_model_load_seconds", load_time, {"model": key.image_model})
+        peak_rss: int = memory_info.get_peak_rss() if in_process else diffuser.peak_rss
+
+        with __lock:
+            __stats["load_time"] += load_time
+            __stats["peak_rss"] = max(__stats["peak_rss"], peak_rss)
+            __entries[key] = {
+                "ref": diffuser,
+                # Worker processes each hold a copy, and the pool budget is spent on all of them.
+                "size": __get_model_size(key.image_model) * max(worker_pool.get_worker_count(), 1),
+                "load_time": load_time,
+                "peak_rss": peak_rss,
+                "signature": signature,
+                "digest": digest,
+            }
+            __active_key = key
+            __evict_over_budget()
+        print(f"Loaded image model '{key.image_model}' in {load_time:.2f}s (peak memory {peak_rss / 1024 ** 2:.0f} MiB).")
+        return diffuser
+
+
+def get_active() -> Any:
+    with __lock:
+        if __active_key is None or __active_key not in __entries:
+            return None
+        return __entries[__active_key]["ref"]
+
+
+def is_resident(key: Key) -> bool:
+    with __lock:
+        return key in __entries
+
+
+def get_active_key() -> Key | None:
+    with __lock:
+        if __active_key is None or __active_key not in __entries:
+            return None
+        return __active_key
+
+
+def get_stats() -> dict[str, Any]:
+    with __lock:
+        stats: dict[str, Any] = dict(__stats)
+        stats["resident"] = [key.image_model for key in __entries]
+        stats["resident_size"] = sum(entry["size"] for entry in __entries.values())
+    lookups: int = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups > 0 else 0.0
+    stats["average_load_time"] = stats["load_time"] / stats["misses"] if stats["misses"] > 0 else 0.0
+    return stats
+
+
+def format_stats() -> str:
+    stats: dict[str, Any] = get_stats()
+    return (
+        f"Model pool: {len(stats['resident'])} resident ({stats['resident_size'] / 1024 ** 2:.0f} MiB), "
+        f"{stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, "
+        f"{stats['average_load_time']:.2f}s average load, {stats['peak_rss'] / 1024 ** 2:.0f} MiB peak memory."
+    )
+
+
+def evict(key: Key) -> None:
+    global __active_key
+
+    with __lock:
+        if __entries.pop(key, None) is not None:
+            __stats["evictions"] += 1
+        if __active_key == key:
+            __active_key = None
+
+
+def invalidate(image_model: str) -> int:
+    with __lock:
+        keys: list[Key] = [key for key in __entries if key.image_model == image_model]
+    if len(keys) == 0:
+        return 0
+
+    # A new mtime alone is not enough to drop a warm model; the content has to differ too.
+    signature: tuple[int, int] | None = model_catalog.get_signature(image_model)
+    digest: str | None = None
+    evicted: int = 0
+    for key in keys:
+        with __lock:
+            entry: dict[str, Any] | None = __entries.get(key)
+            if entry is None or signature is not None and entry["signature"] == signature:
+                continue
+        if signature is not None and digest is None:
+            digest = model_catalog.get_digest(image_model)
+        if digest is not None and digest == entry["digest"]:
+            with __lock:
+                entry["signature"] = signature
+            continue
+        evict(key)
+        evicted += 1
+    return evicted
+
+
+def release_inactive() -> int:
+    with __lock:
+        inactive_keys: list[Key] = [key for key in __entries if key != __active_key]
+        for key in inactive_keys:
+            del __entries[key]
+            __stats["evictions"] += 1
+    if len(inactive_keys) > 0:
+        gc.collect()
+    return len(inactive_keys)
+
+
+def get_native_backend() -> Any:
+    global __native_backend
+
+    # Importing the native library initializes CUDA/BLAS, so it is put off until the first model load.
+    if __native_backend is None:
+        if os.environ.get(constants.MOCK_BACKEND_ENVIRONMENT_VARIABLE) == "1":
+            from modules import mock_backend
+            __native_backend = mock_backend
+        else:
+            import stable_diffusion_cpp  # type: ignore
+            __native_backend = stable_diffusion_cpp
+    return __native_backend
+
+
+def __get_backend() -> Any:
+    # With worker processes the models live in the workers, and this process only holds proxies to them.
+    return worker_pool if worker_pool.is_enabled() else get_native_backend()
+
+
+def __create_diffuser(key: Key) -> Any:
+    return __get_backend().StableDiffusion(
+        model_path=f"{constants.IMAGE_MODEL_DIR_PATH}{key.image_model}",
+        vae_tiling=key.use_vae_tiling,
+        rng_type=key.rng_type,
+        schedule=key.scheduler,
+        keep_clip_on_cpu=key.keep_clip_on_cpu,
+        keep_vae_on_cpu=key.keep_vae_on_cpu,
+        n_threads=key.n_threads,
+    )
+
+
+def __get_model_size(image_model: str) -> int:
+    try:
+        return os.path.getsize(f"{constants.IMAGE_MODEL_DIR_PATH}{image_model}")
+    except OSError:
+        return 0
+
+
+def __evict_over_budget() -> None:
+    budget: int = settings.get_key("image_model/pool_memory_budget", constants.DEFAULT_SETTINGS["image_model"]["pool_memory_budget"]) * 1024 ** 2
+    total_size: int = sum(entry["size"] for entry in __entries.values())
+
+    # The most recently used model always stays resident, even if it alone exceeds the budget.
+    while total_size > budget and len(__entries) > 1:
+        evicted_key, evicted_entry = __entries.popitem(last=False)
+        total_size -= evicted_entry["size"]
+        __stats["evictions"] += 1
+        print(f"Evicted image model '{evicted_key.image_model}' from the model pool.")
@@ -0,0 +1,72 @@
+import time
+import threading
+
+from modules.core import constants
+from modules import settings
+from modules import im_backend
+from modules import diffuser_pool
+from modules import model_catalog
+from modules import metrics
+
+
+__version: int = 0
+__model_signatures: dict[str, tuple[int, int] | None] = {}
+__thread: threading.Thread | None = None
+__lock: threading.Lock = threading.Lock()
+
+
+def start() -> None:
+    global __thread, __model_signatures
+
+    with __lock:
+        if __thread is not None:
+            return
+        __model_signatures = {image_model: model_catalog.get_signature(image_model) for image_model in im_backend.get_image_models()}
+        __thread = threading.Thread(target=__watch, name="file-watcher", daemon=True)
+        __thread.start()
+
+
+def get_version() -> int:
+    with __lock:
+        return __version
+
+
+def __watch() -> None:
+    while True:
+        time.sleep(constants.FILE_WATCH_INTERVAL)
+        # Any error ends this poll, never the thread, or hot-reload would stop for the rest of the run.
+        try:
+            __poll()
+        except Exception as exception:
+            metrics.log_exception("file_watch_failed", exception, {})
+
+
+def __poll() -> None:
+    global __version, __model_signatures
+
+    is_changed: bool = False
+    if settings.reload_if_changed():
+        print(f"Reloaded settings from '{constants.DATA_DIR_PATH}{constants.SETTINGS_FILENAME}'.")
+        is_changed = True
+
+    # Overwriting a file in place leaves the directory mtime alone, so every model file is stat'ed, which is cheap.
+    model_signatures: dict[str, tuple[int, int] | None] = {image_model: model_catalog.get_signature(image_model) for image_model in im_backend.get_image_models()}
+    for image_model, signature in model_signatures.items():
+        if image_model not in __model_signatures:
+            model_catalog.get_info(image_model)
+            print(f"Image model '{image_model}' added.")
+            is_changed = True
+        elif signature != __model_signatures[image_model]:
+            model_catalog.get_info(image_model)
+            evicted: int = diffuser_pool.invalidate(image_model)
+            print(f"Image model '{image_model}' changed{f', unloaded {evicted} stale instance(s)' if evicted > 0 else ''}.")
+            is_changed = True
+    for image_model in __model_signatures.keys() - model_signatures.keys():
+        diffuser_pool.invalidate(image_model)
+        print(f"Image model '{image_model}' removed.")
+        is_changed = True
+
+    with __lock:
+        __model_signatures = model_signatures
+        if is_changed:
+            __version += 1
@@ -0,0 +1,227 @@
+from typing import Any, Callable
+import time
+import random
+import inspect
+import dataclasses
+
+from PIL import Image
+
+from modules.core import constants
+from modules import settings
+from modules import diffuser_pool
+from modules import memory_planner
+from modules import model_catalog
+from modules import job_queue
+from modules import output_store
+from modules import result_cache
+from modules import metrics
+
+
+@dataclasses.dataclass(frozen=True)
+class HiresOptions:
+    scale: float
+    tile_size: int
+    tile_overlap: int
+    strength: float
+
+
+@dataclasses.dataclass
+class Request:
+    diffuser_key: diffuser_pool.Key
+    clip_skip: int
+    positive_prompt: str
+    negative_prompt: str
+    seed: int
+    steps: int
+    sampler: str
+    cfg_scale: float
+    width: int
+    height: int
+    reference_image: Image.Image | None = None
+    strength: float = 0.75
+    hires: HiresOptions | None = None
+    batch_size: int = 1
+    use_cache: bool = False
+    save_outputs: bool = True
+
+
+def run(request: Request, progress_callback: Callable[[int, int, float], None] | None = None) -> list[Image.Image]:
+    # The cache stays keyed by the requested settings, while saved metadata reports the ones the model was loaded with.
+    cache_key: str = get_cache_key(request)
+    labels: dict[str, str] = get_metric_labels(request)
+    start_time: float = time.perf_counter()
+    images: list[Image.Image]
+    timings: dict[str, float] = {}
+    try:
+        if request.hires is not None:
+            # Imported here since the hires pipeline is itself built on top of this module.
+            from modules import hires
+            images = hires.run(request, progress_callback)
+        else:
+            request, images, timings = __generate(request, progress_callback)
+        if request.save_outputs:
+            for image_index, image in enumerate(images):
+                output_store.save(image, get_metadata(request, request.seed + image_index))
+        if request.use_cache and result_cache.is_enabled():
+            result_cache.put(cache_key, images)
+    except BaseException as exception:
+        metrics.log_exception("generation_failed", exception, {**labels, "seed": request.seed, "batch_size": request.batch_size})
+        raise
+
+    total_time: float = time.perf_counter() - start_time
+    metrics.observe("cudiffusion_generation_seconds", total_time, labels)
+    metrics.increment("cudiffusion_images_generated_total", labels, len(images))
+    metrics.log_event("generation", {
+        **labels,
+        "mode": "t2i" if request.reference_image is None else "i2i",
+        "hires": request.hires is not None,
+        "seed": request.seed,
+        "steps": request.steps,
+        "images": len(images),
+        **{f"{stage}_seconds": round(stage_time, 4) for stage, stage_time in timings.items()},
+        "total_seconds": round(total_time, 4),
+    })
+    return images
+
+
+def get_metric_labels(request: Request) -> dict[str, str]:
+    return {
+        "model": request.diffuser_key.image_model,
+        "sampler": request.sampler,
+        "resolution": f"{request.width}x{request.height}",
+    }
+
+
+def __generate(request: Request, progress_callback: Callable[[int, int, float], None] | None) -> tuple[Request, list[Image.Image], dict[str, float]]:
+    request = dataclasses.replace(request, diffuser_key=plan(request.diffuser_key, request.width, request.height, request.batch_size))
+    diffuser: Any = diffuser_pool.acquire(request.diffuser_key)
+
+    kwargs: dict[str, Any] = {}
+    if request.reference_image is not None:
+        kwargs["init_image"] = request.reference_image
+        kwargs["strength"] = request.strength
+
+    # The backend restarts its step count for every image of a batch.
+    progress: dict[str, int] = {
+        "image_index": 0,
+        "step": 0,
+    }
+    # The backend only reports sampling steps, so encoding and decoding are timed as the gaps before the first and after the last one.
+    step_times: dict[str, float] = {
+        "first_step_end": 0.0,
+        "first_step": 0.0,
+        "last_step_end": 0.0,
+        "sampling": 0.0,
+    }
+
+    def on_progress(step: int, steps: int, step_time: float) -> None:
+        now: float = time.perf_counter()
+        if step_times["first_step_end"] == 0.0:
+            step_times["first_step_end"] = now
+            step_times["first_step"] = step_time
+        step_times["last_step_end"] = now
+        step_times["sampling"] += step_time
+        if step < progress["step"]:
+            progress["image_index"] = min(progress["image_index"] + 1, request.batch_size - 1)
+        progress["step"] = step
+        job_queue.set_progress(step, steps, step_time, progress["image_index"], request.batch_size)
+        if progress_callback is not None:
+            progress_callback(step, steps, step_time)
+
+    kwargs["progress_callback"] = on_progress
+
+    # Previews need a backend that exposes a preview callback; older bindings only report progress.
+    preview_interval: int = settings.get_key("generation/preview_interval", constants.DEFAULT_SETTINGS["generation"]["preview_interval"])
+    if preview_interval > 0 and "preview_callback" in inspect.signature(diffuser.generate_image).parameters:
+        kwargs["preview_method"] = "proj"
+        kwargs["preview_interval"] = preview_interval
+        kwargs["preview_callback"] = lambda step, frames, is_noisy: job_queue.set_preview(frames[0]) if len(frames) > 0 else None
+
+    start_time: float = time.perf_counter()
+    images: list[Image.Image] = diffuser.generate_image(
+        prompt=request.positive_prompt,
+        negative_prompt=request.negative_prompt,
+        clip_skip=request.clip_skip,
+        cfg_scale=request.cfg_scale,
+        min_cfg=0.0,
+        width=request.width,
+        height=request.height,
+        sample_method=request.sampler,
+        sample_steps=request.steps,
+        seed=request.seed,
+        batch_count=request.batch_size,
+        **kwargs,
+    )
+    end_time: float = time.perf_counter()
+    print(f"Generated {len(images)} image(s) at {request.width}x{request.height} in {end_time - start_time:.2f}s.")
+
+    timings: dict[str, float] = {"sampling": step_times["sampling"]}
+    if step_times["first_step_end"] > 0.0:
+        timings["text_encode"] = max(step_times["first_step_end"] - step_times["first_step"] - start_time, 0.0)
+        timings["vae_decode"] = end_time - step_times["last_step_end"]
+    labels: dict[str, str] = get_metric_labels(request)
+    for stage, stage_time in timings.items():
+        metrics.observe(f"cudiffusion_{stage}_seconds", stage_time, labels)
+    # Every image of a batch shares one conditioning, so merged seed sweeps show up as saved encodes.
+    metrics.increment("cudiffusion_prompt_encodes_total", labels)
+    metrics.increment("cudiffusion_prompt_encodes_saved_total", labels, request.batch_size - 1)
+    return request, images, timings
+
+
+def plan(diffuser_key: diffuser_pool.Key, width: int, height: int, batch_size: int = 1) -> diffuser_pool.Key:
+    # A resident model already fits; only loading one needs the pre-flight check and its fallbacks.
+    if diffuser_pool.is_resident(diffuser_key):
+        return diffuser_key
+    return memory_planner.plan(diffuser_key, width, height, batch_size)
+
+
+def get_cached(request: Request) -> list[Image.Image] | None:
+    if not request.use_cache or not result_cache.is_enabled():
+        return None
+    return result_cache.get(get_cache_key(request), request.batch_size)
+
+
+def get_cache_key(request: Request) -> str:
+    parameters: dict[str, Any] = get_metadata(request, request.seed)
+    parameters["batch_size"] = request.batch_size
+    # A checkpoint replaced under the same name gets a new size or mtime, so its old results are never served.
+    parameters["model_signature"] = model_catalog.get_signature(request.diffuser_key.image_model)
+    return result_cache.get_key(parameters, request.reference_image)
+
+
+def get_metadata(request: Request, seed: int) -> dict[str, Any]:
+    metadata: dict[str, Any] = {
+        "mode": "t2i" if request.reference_image is None else "i2i",
+        "model": request.diffuser_key.image_model,
+        "prompt": request.positive_prompt,
+        "negative_prompt": request.negative_prompt,
+        "seed": seed,
+        "steps": request.steps,
+        "sampler": request.sampler,
+        "cfg_scale": request.cfg_scale,
+        "clip_skip": request.clip_skip,
+        "width": request.width,
+        "height": request.height,
+        "scheduler": request.diffuser_key.scheduler,
+        "rng_type": request.diffuser_key.rng_type,
+        "use_vae_tiling": request.diffuser_key.use_vae_tiling,
+    }
+    if request.reference_image is not None:
+        metadata["strength"] = request.strength
+    if request.hires is not None:
+        for name, value in dataclasses.asdict(request.hires).items():
+            metadata[f"hires_{name}"] = value
+    return metadata
+
+
+def resolve_seeds(seed: int, batch_count: int, batch_size: int, seed_mode: str) -> list[int]:
+    # The backend gives the images of one call consecutive seeds, so "increment" mode
+    # advances by a whole batch per call to keep every seed in the range unique.
+    base_seed: int = seed if seed >= 0 else random.randint(0, constants.MAX_SEED)
+    seeds: list[int] = [base_seed]
+    for batch_index in range(1, batch_count):
+        if seed_mode == "increment":
+            seeds.append(base_seed + batch_index * batch_size)
+        else:
+            seeds.append(random.randint(0, constants.MAX_SEED))
+    return seeds
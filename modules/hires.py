@@ -0,0 +1,110 @@
+from typing import Callable
+import time
+import collections
+import dataclasses
+import concurrent.futures
+
+from PIL import Image, ImageChops
+
+from modules import job_queue
+from modules import generation
+from modules import worker_pool
+
+
+def run(request: generation.Request, progress_callback: Callable[[int, int, float], None] | None = None) -> list[Image.Image]:
+    assert request.hires is not None
+    base_request: generation.Request = dataclasses.replace(request, hires=None, use_cache=False, save_outputs=False)
+    base_images: list[Image.Image] = generation.run(base_request, progress_callback)
+    return [__refine(request, base_image, request.seed + image_index) for image_index, base_image in enumerate(base_images)]
+
+
+def get_output_size(request: generation.Request) -> tuple[int, int]:
+    assert request.hires is not None
+    return __round_to_multiple(request.width * request.hires.scale), __round_to_multiple(request.height * request.hires.scale)
+
+
+def get_tile_boxes(width: int, height: int, tile_size: int, tile_overlap: int) -> list[tuple[int, int, int, int]]:
+    tile_width: int = min(tile_size, width)
+    tile_height: int = min(tile_size, height)
+    return [(x, y, x + tile_width, y + tile_height) for y in __get_tile_offsets(height, tile_height, tile_overlap) for x in __get_tile_offsets(width, tile_width, tile_overlap)]
+
+
+def __refine(request: generation.Request, base_image: Image.Image, seed: int) -> Image.Image:
+    assert request.hires is not None
+    start_time: float = time.perf_counter()
+    width, height = get_output_size(request)
+    upscaled_image: Image.Image = base_image.convert("RGB").resize((width, height), Image.Resampling.LANCZOS)
+    tile_boxes: list[tuple[int, int, int, int]] = get_tile_boxes(width, height, request.hires.tile_size, request.hires.tile_overlap)
+
+    def refine_tile(tile_index: int) -> Image.Image:
+        box: tuple[int, int, int, int] = tile_boxes[tile_index]
+        # Every tile gets its own fixed seed, so its result does not depend on which worker ran it or when.
+        tile_request: generation.Request = dataclasses.replace(
+            request,
+            seed=seed + tile_index,
+            width=box[2] - box[0],
+            height=box[3] - box[1],
+            reference_image=upscaled_image.crop(box),
+            strength=request.hires.strength,
+            batch_size=1,
+            use_cache=False,
+            save_outputs=False,
+            hires=None,
+        )
+        return generation.run(tile_request)[0]
+
+    # One tile per worker process is in flight at a time, and tiles are blended in the order they were cut,
+    # so memory stays bounded by the window and the output is the same however the tiles were scheduled.
+    concurrency: int = max(worker_pool.get_worker_count(), 1) if worker_pool.is_enabled() else 1
+    output_image: Image.Image = upscaled_image.copy()
+    pending_tiles: collections.deque[concurrent.futures.Future[Image.Image]] = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="hires") as executor:
+        try:
+            next_tile_index: int = 0
+            for tile_index, box in enumerate(tile_boxes):
+                while next_tile_index < len(tile_boxes) and len(pending_tiles) < concurrency:
+                    pending_tiles.append(executor.submit(refine_tile, next_tile_index))
+                    next_tile_index += 1
+                tile_image: Image.Image = pending_tiles.popleft().result()
+                output_image.paste(tile_image.convert("RGB"), box[:2], __get_blend_mask(box, request.hires.tile_overlap))
+                job_queue.set_progress(tile_index + 1, len(tile_boxes), (time.perf_counter() - start_time) / (tile_index + 1))
+        finally:
+            for pending_tile in pending_tiles:
+                pending_tile.cancel()
+
+    print(f"Refined {len(tile_boxes)} tile(s) into a {width}x{height} image in {time.perf_counter() - start_time:.2f}s.")
+    return output_image
+
+
+def __get_tile_offsets(size: int, tile_size: int, tile_overlap: int) -> list[int]:
+    if size <= tile_size:
+        return [0]
+    stride: int = tile_size - min(tile_overlap, tile_size // 2)
+    offsets: list[int] = list(range(0, size - tile_size, stride))
+    # The last tile is pushed back against the edge instead of running past it.
+    offsets.append(size - tile_size)
+    return offsets
+
+
+def __get_blend_mask(box: tuple[int, int, int, int], tile_overlap: int) -> Image.Image:
+    width: int = box[2] - box[0]
+    height: int = box[3] - box[1]
+    mask: Image.Image = Image.new("L", (width, height), 255)
+    # Tiles are pasted left to right and top to bottom, so only the left and top edges overlap earlier tiles and fade in.
+    if box[0] > 0 and tile_overlap > 0:
+        ramp_width: int = min(tile_overlap, width)
+        ramp: Image.Image = Image.frombytes("L", (ramp_width, 1), __get_ramp(ramp_width)).resize((ramp_width, height), Image.Resampling.NEAREST)
+        mask.paste(ImageChops.multiply(mask.crop((0, 0, ramp_width, height)), ramp), (0, 0))
+    if box[1] > 0 and tile_overlap > 0:
+        ramp_height: int = min(tile_overlap, height)
+        ramp = Image.frombytes("L", (1, ramp_height), __get_ramp(ramp_height)).resize((width, ramp_height), Image.Resampling.NEAREST)
+        mask.paste(ImageChops.multiply(mask.crop((0, 0, width, ramp_height)), ramp), (0, 0))
+    return mask
+
+
+def __get_ramp(length: int) -> bytes:
+    return bytes(round((index + 1) * 255 / (length + 1)) for index in range(length))
+
+
+def __round_to_multiple(size: float) -> int:
+    return max(round(size / 64) * 64, 64)
@@ -1,11 +1,17 @@
 import os
-import datetime
+import threading
 
 import gradio as gr
-from PIL import Image
 
 from modules.core import constants
-from modules.core import shared
+from modules import diffuser_pool
+from modules import job_queue
+from modules import model_catalog
+
+
+__image_models: list[str] = []
+__image_models_mtime: int | None = None
+__image_models_lock: threading.Lock = threading.Lock()
 
 
 def mark_diffuser_as_idle():
@@ -14,7 +20,6 @@ def mark_diffuser_as_idle():
         gr.update(interactive=True),
         gr.update(value="Generate", interactive=True),
         gr.update(value="Generate", interactive=True),
-        False,
     )
 
 
@@ -24,29 +29,37 @@ def mark_diffuser_as_busy():
         gr.update(interactive=False),
         gr.update(value="Generating...", interactive=False),
         gr.update(value="Generating...", interactive=False),
-        True,
     )
 
 
-def save_image(image: Image.Image) -> None:
-    if not is_diffuser_loaded():
-        return
+def cancel_pending_jobs(request: gr.Request) -> None:
+    if job_queue.cancel_owner(request.session_hash or "") > 0:
+        gr.Info("Cancelled the pending generation.")
+
 
-    diffuser_string: str = os.path.splitext(shared.diffuser["id"])[0]
-    time_string: str = datetime.datetime.now().strftime("%Y-%m-%d-%f")
+def get_image_models() -> list[str]:
+    global __image_models_mtime, __image_models
 
-    os.makedirs(constants.IMAGE_OUTPUT_DIR_PATH, exist_ok=True)
-    image.save(f"{constants.IMAGE_OUTPUT_DIR_PATH}{diffuser_string}_{time_string}.png", "png")
+    try:
+        mtime: int = os.stat(constants.IMAGE_MODEL_DIR_PATH).st_mtime_ns
+    except OSError:
+        return []
 
+    # Adding, removing or renaming a file bumps the directory mtime, so the listing only needs a rescan then.
+    with __image_models_lock:
+        if mtime != __image_models_mtime:
+            image_models: list[str] = []
+            for entry in os.scandir(constants.IMAGE_MODEL_DIR_PATH):
+                if entry.is_file() and os.path.splitext(entry.name)[1] in (".safetensors", ".gguf"):
+                    image_models.append(entry.name)
+            __image_models = sorted(image_models)
+            __image_models_mtime = mtime
+        return list(__image_models)
 
-def get_image_models() -> list[str]:
-    image_models: list[str] = []
-    if os.path.exists(constants.IMAGE_MODEL_DIR_PATH):
-        for filename in os.listdir(constants.IMAGE_MODEL_DIR_PATH):
-            if os.path.splitext(filename)[1] in (".safetensors", ".gguf"):
-                image_models.append(filename)
-    return image_models
+
+def get_image_model_choices() -> list[tuple[str, str]]:
+    return model_catalog.get_choices(get_image_models())
 
 
 def is_diffuser_loaded() -> bool:
-    return shared.diffuser["id"] != "" and shared.diffuser["ref"] is not None
+    return diffuser_pool.get_active() is not None
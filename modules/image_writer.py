@@ -0,0 +1,131 @@
+from typing import Any, Callable
+import time
+import queue
+import atexit
+import threading
+import concurrent.futures
+
+from PIL import Image
+from PIL import PngImagePlugin
+
+from modules.core import constants
+from modules import settings
+from modules import metrics
+
+
+__queue: queue.Queue[tuple[Image.Image, str, dict[str, str], Callable[[str], None] | None, str | None, concurrent.futures.Future[str | None]] | None] = queue.Queue(maxsize=constants.IMAGE_WRITER_QUEUE_SIZE)
+__workers: list[threading.Thread | None] = []
+__lock: threading.Lock = threading.Lock()
+
+
+def submit(image: Image.Image, path_without_extension: str, text: dict[str, str], on_saved: Callable[[str], None] | None = None, image_format: str | None = None) -> concurrent.futures.Future[str | None]:
+    __ensure_started()
+    # The future resolves to the written path, or to None if saving the image failed; any other error is set on it.
+    future: concurrent.futures.Future[str | None] = concurrent.futures.Future()
+    # Blocks once the queue is full, which throttles generation instead of letting pending images pile up in memory.
+    __queue.put((image, path_without_extension, text, on_saved, image_format, future))
+    return future
+
+
+def flush() -> None:
+    __queue.join()
+
+
+def shutdown() -> None:
+    with __lock:
+        if len(__workers) == 0:
+            return
+        flush()
+        for _ in __workers:
+            __queue.put(None)
+        for worker in __workers:
+            worker.join()
+        __workers.clear()
+
+
+def get_save_arguments(image_format: str) -> tuple[str, dict[str, Any]]:
+    quality: int = settings.get_key("output/quality", constants.DEFAULT_SETTINGS["output"]["quality"])
+
+    if image_format == "webp":
+        return ".webp", {
+            "format": "webp",
+            "lossless": settings.get_key("output/webp_lossless", constants.DEFAULT_SETTINGS["output"]["webp_lossless"]),
+            "quality": quality,
+        }
+    if image_format == "jpeg":
+        return ".jpg", {
+            "format": "jpeg",
+            "quality": quality,
+        }
+    if image_format == "avif":
+        return ".avif", {
+            "format": "avif",
+            "quality": quality,
+        }
+    return ".png", {
+        "format": "png",
+        "compress_level": settings.get_key("output/png_compress_level", constants.DEFAULT_SETTINGS["output"]["png_compress_level"]),
+    }
+
+
+def __ensure_started() -> None:
+    with __lock:
+        if len(__workers) == 0:
+            atexit.register(shutdown)
+            __workers.extend([None] * constants.IMAGE_WRITER_THREADS)
+        # A thread that died would leave the bounded queue to fill up and block generation, so it is replaced.
+        for index, worker in enumerate(__workers):
+            if worker is None or not worker.is_alive():
+                __workers[index] = threading.Thread(target=__work, name=f"image-writer-{index}", daemon=True)
+                __workers[index].start()
+
+
+def __work() -> None:
+    while True:
+        item: tuple[Image.Image, str, dict[str, str], Callable[[str], None] | None, str | None, concurrent.futures.Future[str | None]] | None = __queue.get()
+        try:
+            if item is None:
+                return
+            try:
+                item[5].set_result(__write(*item[:5]))
+            except Exception as exception:
+                metrics.log_exception("image_writer_failed", exception, {"path": item[1]})
+                item[5].set_exception(exception)
+        finally:
+            __queue.task_done()
+
+
+def __write(image: Image.Image, path_without_extension: str, text: dict[str, str], on_saved: Callable[[str], None] | None, image_format: str | None) -> str | None:
+    if image_format is None:
+        image_format = settings.get_key("output/format", constants.DEFAULT_SETTINGS["output"]["format"])
+    extension, save_arguments = get_save_arguments(image_format)
+    path: str = f"{path_without_extension}{extension}"
+
+    # JPEG has no alpha channel.
+    if save_arguments["format"] == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+
+    # PNG stores every entry as its own text chunk; the other formats only get the
+    # "parameters" entry, in the EXIF image description.
+    if save_arguments["format"] == "png":
+        png_info: PngImagePlugin.PngInfo = PngImagePlugin.PngInfo()
+        for key, value in text.items():
+            png_info.add_text(key, value)
+        save_arguments["pnginfo"] = png_info
+    elif "parameters" in text:
+        exif: Image.Exif = Image.Exif()
+        exif[constants.EXIF_IMAGE_DESCRIPTION_TAG] = text["parameters"]
+        save_arguments["exif"] = exif
+
+    start_time: float = time.perf_counter()
+    try:
+        image.save(path, **save_arguments)
+    except (OSError, KeyError, ValueError) as exception:
+        metrics.increment("cudiffusion_image_save_failures_total", {"format": save_arguments["format"]})
+        metrics.log_exception("image_save_failed", exception, {"path": path})
+        return None
+    metrics.observe("cudiffusion_image_save_seconds", time.perf_counter() - start_time, {"format": save_arguments["format"]})
+
+    if on_saved is not None:
+        on_saved(path)
+    return path
@@ -0,0 +1,260 @@
+from typing import Any, Callable
+import os
+import json
+import uuid
+import shutil
+import sqlite3
+import datetime
+import threading
+import dataclasses
+import concurrent.futures
+
+from PIL import Image
+
+from modules.core import constants
+from modules import diffuser_pool
+from modules import job_queue
+from modules import generation
+from modules import image_writer
+from modules import output_store
+from modules import sweep
+
+
+__connection: sqlite3.Connection | None = None
+__lock: threading.Lock = threading.Lock()
+
+
+def submit(request: generation.Request, priority: int = 0, owner: str = "", sweep_axes: dict[str, list[Any]] | None = None) -> job_queue.Job:
+    job_id: str = uuid.uuid4().hex
+    # The reference image is written before the job is queued, so a crash at any later point can still replay it.
+    if request.reference_image is not None:
+        os.makedirs(__get_result_dir_path(job_id), exist_ok=True)
+        request.reference_image.save(f"{__get_result_dir_path(job_id)}reference.png", compress_level=1)
+
+    __insert(job_id, request, priority, owner, sweep_axes)
+    return __queue(job_id, request, priority, owner, sweep_axes)
+
+
+def complete(request: generation.Request, images: list[Image.Image], owner: str = "") -> job_queue.Job:
+    # Results served from the cache get a journal entry too, so their job ID can be retrieved after a restart like any other.
+    job_id: str = uuid.uuid4().hex
+    __insert(job_id, request, 0, owner, None)
+    __store_results(job_id, images)
+    return job_queue.complete(images, owner=owner, job_id=job_id)
+
+
+def get_images(job: job_queue.Job) -> list[Image.Image]:
+    # A sweep's result is its grid followed by the cells, the same order its journal entry stores them in.
+    if job.kind == "sweep":
+        grid, cells = job.result
+        return [grid] + [cell["image"] for cell in cells]
+    return job.result
+
+
+def get(job_id: str) -> dict[str, Any] | None:
+    with __lock:
+        row: sqlite3.Row | None = __get_connection().execute("SELECT status, result_count, error FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+
+    paths: list[str] = []
+    if row["status"] == "done":
+        result_dir_path: str = __get_result_dir_path(job_id)
+        file_names: dict[str, str] = {os.path.splitext(file_name)[0]: file_name for file_name in os.listdir(result_dir_path)} if os.path.isdir(result_dir_path) else {}
+        paths = [f"{result_dir_path}{file_names[str(image_index)]}" for image_index in range(row["result_count"]) if str(image_index) in file_names]
+    return {
+        "status": row["status"],
+        "paths": paths,
+        "error": row["error"],
+    }
+
+
+def recover() -> int:
+    with __lock:
+        rows: list[sqlite3.Row] = __get_connection().execute(
+            "SELECT id, owner, priority, request FROM jobs WHERE status IN ('pending', 'running') ORDER BY created_at",
+        ).fetchall()
+
+    # Jobs that never finished are queued again under their old ids; finished ones, including the
+    # finished batches of a larger request, are left alone and never run twice.
+    recovered: int = 0
+    for row in rows:
+        try:
+            request, sweep_axes = __deserialize(row["id"], row["request"])
+        except (OSError, ValueError, KeyError, TypeError) as exception:
+            print(f"Error recovering job {row['id']}: {exception}")
+            __execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?", (repr(exception), datetime.datetime.now().isoformat(), row["id"]))
+            continue
+        __execute("UPDATE jobs SET status = 'pending', updated_at = ? WHERE id = ?", (datetime.datetime.now().isoformat(), row["id"]))
+        __queue(row["id"], request, row["priority"], row["owner"], sweep_axes)
+        recovered += 1
+    if recovered > 0:
+        print(f"Recovered {recovered} unfinished job(s) from the journal.")
+    return recovered
+
+
+def __insert(job_id: str, request: generation.Request, priority: int, owner: str, sweep_axes: dict[str, list[Any]] | None) -> None:
+    now: str = datetime.datetime.now().isoformat()
+    __execute(
+        "INSERT INTO jobs (id, owner, priority, status, request, created_at, updated_at) VALUES (?, ?, ?, 'pending', ?, ?, ?)",
+        (job_id, owner, priority, __serialize(request, sweep_axes), now, now),
+    )
+
+
+def __queue(job_id: str, request: generation.Request, priority: int, owner: str, sweep_axes: dict[str, list[Any]] | None) -> job_queue.Job:
+    if sweep_axes is not None:
+        return job_queue.submit(lambda: __run_sweep(job_id, request, sweep_axes), kind="sweep", priority=priority, owner=owner, job_id=job_id)
+    return job_queue.submit(lambda: __run(job_id, request), priority=priority, owner=owner, job_id=job_id)
+
+
+def __run(job_id: str, request: generation.Request) -> list[Image.Image]:
+    images: list[Image.Image] = generation.run(request)
+    __store_results(job_id, images)
+    return images
+
+
+def __run_sweep(job_id: str, request: generation.Request, sweep_axes: dict[str, list[Any]]) -> tuple[Image.Image, list[dict[str, Any]]]:
+    grid, cells = sweep.run(request, sweep_axes)
+    __store_results(job_id, [grid] + [cell["image"] for cell in cells])
+    return grid, cells
+
+
+def __store_results(job_id: str, images: list[Image.Image]) -> None:
+    os.makedirs(__get_result_dir_path(job_id), exist_ok=True)
+    if len(images) == 0:
+        return
+
+    # This runs on a dispatch thread, so the files are stored from the writers' callbacks instead of waiting for the
+    # outputs here; the result count is only recorded once every file is on disk, so a restart never serves a partial job.
+    pending: dict[str, int] = {"count": len(images)}
+    pending_lock: threading.Lock = threading.Lock()
+
+    def on_stored() -> None:
+        with pending_lock:
+            pending["count"] -= 1
+            if pending["count"] > 0:
+                return
+        try:
+            __execute("UPDATE jobs SET result_count = ? WHERE id = ?", (len(images), job_id))
+        except sqlite3.Error as exception:
+            print(f"Error journaling the results of job {job_id}: {exception}")
+
+    for image_index, image in enumerate(images):
+        output_future: concurrent.futures.Future[str | None] | None = output_store.get_future(image)
+        if output_future is None:
+            image_writer.submit(image, f"{__get_result_dir_path(job_id)}{image_index}", {}, image_format="png").add_done_callback(lambda _: on_stored())
+        else:
+            output_future.add_done_callback(lambda future, image_index=image_index, image=image: __link_result(job_id, image_index, image, future, on_stored))
+
+
+def __link_result(job_id: str, image_index: int, image: Image.Image, output_future: concurrent.futures.Future[str | None], on_stored: Callable[[], None]) -> None:
+    try:
+        output_path: str | None = output_future.result() if output_future.exception() is None else None
+        path_without_extension: str = f"{__get_result_dir_path(job_id)}{image_index}"
+        if output_path is None:
+            # Saving the output failed, so the result gets a file of its own. It is written right here, since queueing
+            # it from a writer thread could wait forever on a queue only the writer threads drain.
+            image.save(f"{path_without_extension}.png", compress_level=1)
+            return
+        # Saved outputs are linked rather than encoded a second time.
+        result_path: str = f"{path_without_extension}{os.path.splitext(output_path)[1]}"
+        try:
+            os.link(output_path, result_path)
+        except OSError:
+            shutil.copyfile(output_path, result_path)
+    except OSError as exception:
+        print(f"Error storing result {image_index} of job {job_id}: {exception}")
+    finally:
+        on_stored()
+
+
+def __on_status_change(job: job_queue.Job) -> None:
+    if job.kind not in ("generation", "sweep"):
+        return
+    try:
+        with __lock:
+            connection: sqlite3.Connection = __get_connection()
+            cursor: sqlite3.Cursor = connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (job.status, repr(job.exception) if job.exception is not None else None, datetime.datetime.now().isoformat(), job.id),
+            )
+            connection.commit()
+            if cursor.rowcount == 0 or job.status == "running":
+                return
+            # Only the most recent finished jobs are kept, along with their stored results.
+            pruned_ids: list[str] = [row["id"] for row in connection.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed', 'cancelled') ORDER BY updated_at DESC LIMIT -1 OFFSET ?",
+                (constants.JOB_JOURNAL_HISTORY_SIZE,),
+            )]
+            connection.executemany("DELETE FROM jobs WHERE id = ?", [(pruned_id,) for pruned_id in pruned_ids])
+            connection.commit()
+    except sqlite3.Error as exception:
+        print(f"Error journaling job {job.id}: {exception}")
+        return
+    for pruned_id in pruned_ids:
+        shutil.rmtree(__get_result_dir_path(pruned_id), ignore_errors=True)
+
+
+def __serialize(request: generation.Request, sweep_axes: dict[str, list[Any]] | None) -> str:
+    fields: dict[str, Any] = {field.name: getattr(request, field.name) for field in dataclasses.fields(request) if field.name != "reference_image"}
+    fields["diffuser_key"] = request.diffuser_key._asdict()
+    fields["hires"] = dataclasses.asdict(request.hires) if request.hires is not None else None
+    if sweep_axes is not None:
+        fields["sweep_axes"] = sweep_axes
+    return json.dumps(fields)
+
+
+def __deserialize(job_id: str, text: str) -> tuple[generation.Request, dict[str, list[Any]] | None]:
+    fields: dict[str, Any] = json.loads(text)
+    sweep_axes: dict[str, list[Any]] | None = fields.pop("sweep_axes", None)
+    if sweep_axes is not None and "size" in sweep_axes:
+        # JSON turns the (width, height) tuples into lists.
+        sweep_axes["size"] = [tuple(size) for size in sweep_axes["size"]]
+    fields["diffuser_key"] = diffuser_pool.Key(**fields["diffuser_key"])
+    if fields["hires"] is not None:
+        fields["hires"] = generation.HiresOptions(**fields["hires"])
+    reference_image_path: str = f"{__get_result_dir_path(job_id)}reference.png"
+    if os.path.exists(reference_image_path):
+        with Image.open(reference_image_path) as reference_image:
+            fields["reference_image"] = reference_image.convert("RGB")
+    return generation.Request(**fields), sweep_axes
+
+
+def __get_result_dir_path(job_id: str) -> str:
+    return f"{constants.JOB_RESULT_DIR_PATH}{job_id}/"
+
+
+def __execute(query: str, parameters: tuple[Any, ...]) -> None:
+    with __lock:
+        connection: sqlite3.Connection = __get_connection()
+        connection.execute(query, parameters)
+        connection.commit()
+
+
+def __get_connection() -> sqlite3.Connection:
+    global __connection
+
+    if __connection is None:
+        os.makedirs(constants.DATA_DIR_PATH, exist_ok=True)
+        __connection = sqlite3.connect(f"{constants.DATA_DIR_PATH}{constants.JOB_JOURNAL_FILENAME}", check_same_thread=False)
+        __connection.row_factory = sqlite3.Row
+        __connection.execute("PRAGMA journal_mode=WAL")
+        __connection.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                request TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                result_count INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            )
+        """)
+        __connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        __connection.commit()
+    return __connection
+
+
+job_queue.add_listener(__on_status_change)
@@ -0,0 +1,257 @@
+from typing import Any, Callable, Iterator
+import time
+import uuid
+import heapq
+import itertools
+import threading
+import collections
+
+from modules.core import constants
+from modules import settings
+from modules import metrics
+from modules import worker_pool
+
+
+class Job:
+    def __init__(self, fn: Callable[[], Any], kind: str, priority: int, owner: str, job_id: str | None = None) -> None:
+        self.id: str = job_id if job_id is not None else uuid.uuid4().hex
+        self.fn: Callable[[], Any] = fn
+        self.kind: str = kind
+        self.priority: int = priority
+        self.owner: str = owner
+        self.status: str = "pending"
+        self.result: Any = None
+        self.exception: BaseException | None = None
+        self.submit_time: float = time.perf_counter()
+        self.start_time: float = 0.0
+        self.end_time: float = 0.0
+        self.step: int = 0
+        self.steps: int = 0
+        self.image_index: int = 0
+        self.image_count: int = 1
+        self.iterations_per_second: float = 0.0
+        self.preview: Any = None
+        self._done_event: threading.Event = threading.Event()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._done_event.wait(timeout)
+
+    def is_done(self) -> bool:
+        return self._done_event.is_set()
+
+
+__pending: list[tuple[int, int, Job]] = []
+__jobs: dict[str, Job] = {}
+__finished_jobs: collections.OrderedDict[str, Job] = collections.OrderedDict()
+__running: list[Job] = []
+__average_durations: dict[str, float] = {}
+__sequence: Iterator[int] = itertools.count()
+__condition: threading.Condition = threading.Condition()
+__workers: list[threading.Thread] = []
+__current: threading.local = threading.local()
+__listeners: list[Callable[[Job], None]] = []
+
+
+def submit(fn: Callable[[], Any], kind: str = "generation", priority: int = 0, owner: str = "", job_id: str | None = None) -> Job:
+    job: Job = Job(fn, kind, priority, owner, job_id)
+    with __condition:
+        # In FIFO mode every job shares the same rank, so the sequence number alone decides the order.
+        rank: int = -priority if settings.get_key("queue/ordering", constants.DEFAULT_SETTINGS["queue"]["ordering"]) == "priority" else 0
+        heapq.heappush(__pending, (rank, next(__sequence), job))
+        __jobs[job.id] = job
+        # Once the worker processes are up, one thread per process dispatches jobs so they run side by side;
+        # until then (and for good when models run in-process) a single thread keeps generations one at a time.
+        while len(__workers) < (max(worker_pool.get_worker_count(), 1) if worker_pool.is_started() else 1):
+            __workers.append(threading.Thread(target=__work, name=f"job-queue-worker-{len(__workers)}", daemon=True))
+            __workers[-1].start()
+        __condition.notify()
+    return job
+
+
+def complete(result: Any, kind: str = "generation", owner: str = "", job_id: str | None = None) -> Job:
+    job: Job = Job(lambda: result, kind, 0, owner, job_id)
+    job.result = result
+    job.start_time = job.submit_time
+    with __condition:
+        __finish(job, "done")
+    __notify_finished(job)
+    return job
+
+
+def add_listener(listener: Callable[[Job], None]) -> None:
+    # Listeners see every status change, from the thread that made it, without the queue's lock held,
+    # and before anyone waiting on the job is woken up.
+    __listeners.append(listener)
+
+
+def get_job(job_id: str) -> Job | None:
+    with __condition:
+        return __jobs.get(job_id, __finished_jobs.get(job_id))
+
+
+def cancel(job_id: str) -> bool:
+    with __condition:
+        job: Job | None = __jobs.get(job_id)
+        if job is None or job.status != "pending":
+            return False
+        __pending[:] = [entry for entry in __pending if entry[2] is not job]
+        heapq.heapify(__pending)
+        __finish(job, "cancelled")
+    __notify_finished(job)
+    return True
+
+
+def cancel_owner(owner: str) -> int:
+    with __condition:
+        job_ids: list[str] = [entry[2].id for entry in __pending if entry[2].owner == owner]
+    return sum(1 for job_id in job_ids if cancel(job_id))
+
+
+def get_position(job: Job) -> int:
+    with __condition:
+        if job.status != "pending":
+            return 0
+        return len(__get_jobs_ahead(job)) + 1
+
+
+def get_eta(job: Job) -> float:
+    with __condition:
+        if job.is_done():
+            return 0.0
+        if job.status == "running":
+            return __get_remaining_duration(job)
+
+        wait: float = sum(__get_average_duration(job_ahead.kind) for job_ahead in __get_jobs_ahead(job))
+        wait += sum(__get_remaining_duration(running_job) for running_job in __running)
+        return __get_average_duration(job.kind) + wait / len(__workers)
+
+
+def set_progress(step: int, steps: int, step_time: float, image_index: int = 0, image_count: int = 1) -> None:
+    job: Job | None = getattr(__current, "job", None)
+    if job is None:
+        return
+    job.step = step
+    job.steps = steps
+    job.image_index = image_index
+    job.image_count = image_count
+    if step_time > 0.0:
+        iterations_per_second: float = 1.0 / step_time
+        if job.iterations_per_second > 0.0:
+            job.iterations_per_second += (iterations_per_second - job.iterations_per_second) * 0.25
+        else:
+            job.iterations_per_second = iterations_per_second
+
+
+def set_preview(preview: Any) -> None:
+    job: Job | None = getattr(__current, "job", None)
+    if job is not None:
+        job.preview = preview
+
+
+def is_busy() -> bool:
+    with __condition:
+        return len(__running) > 0 or len(__pending) > 0
+
+
+def format_status(job: Job) -> str:
+    if job.status == "pending":
+        return f"Queued at position {get_position(job)}, ETA {get_eta(job):.0f}s."
+    if job.status == "running":
+        if job.steps > 0:
+            filled: int = round(job.step / job.steps * constants.PROGRESS_BAR_WIDTH)
+            progress_bar: str = "█" * filled + "░" * (constants.PROGRESS_BAR_WIDTH - filled)
+            image_string: str = f"image {job.image_index + 1}/{job.image_count}, " if job.image_count > 1 else ""
+            return f"`{progress_bar}` {image_string}step {job.step}/{job.steps}, {job.iterations_per_second:.2f} it/s, ETA {get_eta(job):.0f}s."
+        return f"Running, ETA {get_eta(job):.0f}s."
+    if job.status == "done":
+        return f"Done in {job.end_time - job.start_time:.2f}s (waited {job.start_time - job.submit_time:.2f}s)."
+    if job.status == "cancelled":
+        return "Cancelled."
+    return "Failed."
+
+
+def stream(job: Job, cancel_on_close: bool = True) -> Iterator[str]:
+    try:
+        while not job.wait(constants.JOB_POLL_INTERVAL):
+            yield format_status(job)
+    finally:
+        # The client went away while waiting, so there is no one left to receive the result.
+        if cancel_on_close and not job.is_done():
+            cancel(job.id)
+
+
+def __get_jobs_ahead(job: Job) -> list[Job]:
+    entry: tuple[int, int, Job] = next(entry for entry in __pending if entry[2] is job)
+    return [other_entry[2] for other_entry in __pending if other_entry[:2] < entry[:2]]
+
+
+def __get_average_duration(kind: str) -> float:
+    return __average_durations.get(kind, constants.JOB_DEFAULT_DURATION)
+
+
+def __get_remaining_duration(job: Job) -> float:
+    if job.steps > 0 and job.iterations_per_second > 0.0:
+        remaining_steps: int = job.steps - job.step + (job.image_count - job.image_index - 1) * job.steps
+        return remaining_steps / job.iterations_per_second
+    return max(__get_average_duration(job.kind) - (time.perf_counter() - job.start_time), 0.0)
+
+
+def __finish(job: Job, status: str) -> None:
+    job.status = status
+    job.end_time = time.perf_counter()
+    metrics.increment("cudiffusion_jobs_total", {"kind": job.kind, "status": status})
+    metrics.observe("cudiffusion_job_latency_seconds", job.end_time - job.submit_time, {"kind": job.kind})
+    __jobs.pop(job.id, None)
+    __finished_jobs[job.id] = job
+    while len(__finished_jobs) > constants.JOB_HISTORY_SIZE:
+        __finished_jobs.popitem(last=False)
+
+
+def __notify_finished(job: Job) -> None:
+    try:
+        __notify(job)
+    finally:
+        job._done_event.set()
+
+
+def __notify(job: Job) -> None:
+    # Listeners do disk I/O, so they run outside the lock, and one that fails must not strand the job or its thread.
+    for listener in __listeners:
+        try:
+            listener(job)
+        except Exception as exception:
+            metrics.log_exception("job_listener_failed", exception, {"job_id": job.id, "kind": job.kind, "status": job.status})
+
+
+def __work() -> None:
+    while True:
+        with __condition:
+            while len(__pending) == 0:
+                __condition.wait()
+            job: Job = heapq.heappop(__pending)[2]
+            job.status = "running"
+            job.start_time = time.perf_counter()
+            __running.append(job)
+        metrics.observe("cudiffusion_job_wait_seconds", job.start_time - job.submit_time, {"kind": job.kind})
+        __notify(job)
+
+        status: str = "done"
+        __current.job = job
+        try:
+            job.result = job.fn()
+        except BaseException as exception:
+            job.exception = exception
+            status = "failed"
+            metrics.log_exception("job_failed", exception, {"job_id": job.id, "kind": job.kind, "owner": job.owner})
+        finally:
+            __current.job = None
+
+        with __condition:
+            __running.remove(job)
+            __finish(job, status)
+            duration: float = job.end_time - job.start_time
+            if job.kind in __average_durations:
+                __average_durations[job.kind] += (duration - __average_durations[job.kind]) * 0.25
+            else:
+                __average_durations[job.kind] = duration
+        __notify_finished(job)
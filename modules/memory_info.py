@@ -0,0 +1,130 @@
+from typing import Any
+import os
+import sys
+import ctypes
+import subprocess
+
+
+__has_nvidia_smi: bool = True
+
+
+def get_peak_rss() -> int:
+    if sys.platform == "win32":
+        return __get_windows_process_memory_counters()[0]
+
+    # VmHWM follows reset_peak_rss(), unlike getrusage().
+    try:
+        with open("/proc/self/status", "rt") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    import resource
+    peak_rss: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes, macOS reports bytes.
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def get_rss() -> int:
+    if sys.platform == "win32":
+        return __get_windows_process_memory_counters()[1]
+
+    try:
+        with open("/proc/self/statm", "rt") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return get_peak_rss()
+
+
+def reset_peak_rss() -> bool:
+    # Only Linux can reset the high-water mark; elsewhere the peak covers the whole process lifetime.
+    try:
+        with open("/proc/self/clear_refs", "wt") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_available_memory() -> int | None:
+    if sys.platform == "win32":
+        status: __MemoryStatusEx = __MemoryStatusEx()
+        status.dwLength = ctypes.sizeof(status)
+        if getattr(ctypes, "windll").kernel32.GlobalMemoryStatusEx(ctypes.byref(status)) == 0:
+            return None
+        return status.ullAvailPhys
+
+    # MemAvailable counts reclaimable page cache, unlike MemFree.
+    try:
+        with open("/proc/meminfo", "rt") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def get_available_video_memory() -> int | None:
+    global __has_nvidia_smi
+
+    if not __has_nvidia_smi:
+        return None
+    try:
+        output: str = subprocess.run(
+            ("nvidia-smi", "--query-gpu=memory.free", "--format=csv,noheader,nounits"),
+            capture_output=True,
+            text=True,
+            timeout=5.0,
+            check=True,
+        ).stdout
+        # Only the first GPU is used by the backend.
+        return int(output.splitlines()[0]) * 1024 ** 2
+    except FileNotFoundError:
+        __has_nvidia_smi = False
+        return None
+    except (OSError, ValueError, IndexError, subprocess.SubprocessError):
+        return None
+
+
+class __MemoryStatusEx(ctypes.Structure):
+    _fields_ = [
+        ("dwLength", ctypes.c_ulong),
+        ("dwMemoryLoad", ctypes.c_ulong),
+        ("ullTotalPhys", ctypes.c_ulonglong),
+        ("ullAvailPhys", ctypes.c_ulonglong),
+        ("ullTotalPageFile", ctypes.c_ulonglong),
+        ("ullAvailPageFile", ctypes.c_ulonglong),
+        ("ullTotalVirtual", ctypes.c_ulonglong),
+        ("ullAvailVirtual", ctypes.c_ulonglong),
+        ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+    ]
+
+
+class __ProcessMemoryCounters(ctypes.Structure):
+    _fields_ = [
+        ("cb", ctypes.c_ulong),
+        ("PageFaultCount", ctypes.c_ulong),
+        ("PeakWorkingSetSize", ctypes.c_size_t),
+        ("WorkingSetSize", ctypes.c_size_t),
+        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+        ("PagefileUsage", ctypes.c_size_t),
+        ("PeakPagefileUsage", ctypes.c_size_t),
+    ]
+
+
+def __get_windows_process_memory_counters() -> tuple[int, int]:
+    counters: __ProcessMemoryCounters = __ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    windll: Any = getattr(ctypes, "windll")
+    windll.psapi.GetProcessMemoryInfo(windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+    return counters.PeakWorkingSetSize, counters.WorkingSetSize
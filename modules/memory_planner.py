@@ -0,0 +1,111 @@
+from modules.core import constants
+from modules import memory_info
+from modules import model_catalog
+from modules import diffuser_pool
+from modules import worker_pool
+
+
+class InsufficientMemoryError(Exception):
+    pass
+
+
+def estimate(key: diffuser_pool.Key, width: int, height: int, batch_size: int = 1) -> dict[str, int]:
+    weight_size: int = model_catalog.get_info(key.image_model)["file_size"]
+    text_encoder_size: int = int(weight_size * constants.TEXT_ENCODER_WEIGHT_FRACTION)
+    vae_weight_size: int = int(weight_size * constants.VAE_WEIGHT_FRACTION)
+    pixels: int = width * height * batch_size
+    vae_size: int = vae_weight_size + (constants.VAE_TILE_BYTES if key.use_vae_tiling else pixels * constants.VAE_BYTES_PER_PIXEL)
+
+    # "device" is what lands on the GPU, "host" is what the CPU offloading options keep in system memory.
+    usage: dict[str, int] = {
+        "device": weight_size - text_encoder_size - vae_weight_size + pixels * constants.DIFFUSION_BYTES_PER_PIXEL,
+        "host": 0,
+    }
+    usage["host" if key.keep_clip_on_cpu else "device"] += text_encoder_size
+    usage["host" if key.keep_vae_on_cpu else "device"] += vae_size
+
+    # Every worker process loads its own copy of the model and may be generating at the same time as the others.
+    copies: int = max(worker_pool.get_worker_count(), 1)
+    return {location: size * copies for location, size in usage.items()}
+
+
+def plan(key: diffuser_pool.Key, width: int, height: int, batch_size: int = 1) -> diffuser_pool.Key:
+    video_memory: int | None = memory_info.get_available_video_memory()
+
+    # Fallbacks are tried from least to most costly: tiling only slows decoding, offloading slows every step.
+    candidates: list[diffuser_pool.Key] = [key]
+    if not key.use_vae_tiling:
+        candidates.append(candidates[-1]._replace(use_vae_tiling=True))
+    if video_memory is not None:
+        if not key.keep_vae_on_cpu:
+            candidates.append(candidates[-1]._replace(keep_vae_on_cpu=True))
+        if not key.keep_clip_on_cpu:
+            candidates.append(candidates[-1]._replace(keep_clip_on_cpu=True))
+
+    for release_inactive in (False, True):
+        if release_inactive:
+            released: int = diffuser_pool.release_inactive()
+            if released == 0:
+                break
+            print(f"Released {released} inactive image model(s) to make room for '{key.image_model}'.")
+            video_memory = memory_info.get_available_video_memory()
+
+        memory: int | None = memory_info.get_available_memory()
+        if memory is None:
+            return key
+        for candidate in candidates:
+            if __fits(estimate(candidate, width, height, batch_size), memory, video_memory):
+                if candidate != key:
+                    print(f"Loading '{key.image_model}' with {__describe_fallback(key, candidate)} to fit in memory.")
+                return candidate
+
+    usage: dict[str, int] = estimate(candidates[-1], width, height, batch_size)
+    target: str = f"{width}x{height}" + (f" in batches of {batch_size}" if batch_size > 1 else "")
+    if worker_pool.get_worker_count() > 1:
+        target += f" on {worker_pool.get_worker_count()} workers"
+    if video_memory is not None and usage["device"] + constants.MEMORY_HEADROOM > video_memory:
+        raise InsufficientMemoryError(
+            f"'{key.image_model}' at {target} needs about {__format_size(usage['device'])} of video memory, "
+            f"but only {__format_size(video_memory)} is free, even with VAE tiling and CPU offloading."
+        )
+    required: int = usage["host"] if video_memory is not None else usage["host"] + usage["device"]
+    raise InsufficientMemoryError(
+        f"'{key.image_model}' at {target} needs about {__format_size(required)} of system memory, "
+        f"but only {__format_size(memory)} is available{', even with VAE tiling' if video_memory is None else ''}."
+    )
+
+
+def get_max_batch_size(key: diffuser_pool.Key, width: int, height: int, batch_size_limit: int) -> int:
+    memory: int | None = memory_info.get_available_memory()
+    if memory is None:
+        return batch_size_limit
+    video_memory: int | None = memory_info.get_available_video_memory()
+
+    # A resident model's weights are already out of the free memory, so only the batch's working set still has to fit.
+    resident_usage: dict[str, int] = estimate(key, 0, 0) if diffuser_pool.is_resident(key) else {"device": 0, "host": 0}
+    for batch_size in range(batch_size_limit, 1, -1):
+        usage: dict[str, int] = estimate(key, width, height, batch_size)
+        if __fits({location: size - resident_usage[location] for location, size in usage.items()}, memory, video_memory):
+            return batch_size
+    return 1
+
+
+def __fits(usage: dict[str, int], memory: int, video_memory: int | None) -> bool:
+    if video_memory is None:
+        return usage["device"] + usage["host"] + constants.MEMORY_HEADROOM <= memory
+    return usage["device"] + constants.MEMORY_HEADROOM <= video_memory and usage["host"] + constants.MEMORY_HEADROOM <= memory
+
+
+def __describe_fallback(key: diffuser_pool.Key, candidate: diffuser_pool.Key) -> str:
+    changes: list[str] = []
+    if candidate.use_vae_tiling and not key.use_vae_tiling:
+        changes.append("VAE tiling")
+    if candidate.keep_vae_on_cpu and not key.keep_vae_on_cpu:
+        changes.append("the VAE on the CPU")
+    if candidate.keep_clip_on_cpu and not key.keep_clip_on_cpu:
+        changes.append("the text encoder on the CPU")
+    return " and ".join(changes)
+
+
+def __format_size(size: int) -> str:
+    return f"{size / 1024 ** 2:.0f} MiB"
@@ -0,0 +1,89 @@
+from typing import Any
+import json
+import time
+import threading
+import traceback
+
+from modules.core import constants
+
+
+__DESCRIPTIONS: dict[str, tuple[str, str]] = {
+    "cudiffusion_model_loads_total": ("counter", "Image model loads, by outcome."),
+    "cudiffusion_model_load_seconds": ("histogram", "Time to load an image model."),
+    "cudiffusion_text_encode_seconds": ("histogram", "Time from the backend call to the first sampling step, mostly prompt encoding."),
+    "cudiffusion_sampling_seconds": ("histogram", "Time spent in sampling steps."),
+    "cudiffusion_prompt_encodes_total": ("counter", "Backend calls, each of which encodes the prompts once for its whole batch."),
+    "cudiffusion_prompt_encodes_saved_total": ("counter", "Prompt encodings saved by sampling several seeds in one backend call instead of one call each."),
+    "cudiffusion_vae_decode_seconds": ("histogram", "Time from the last sampling step until the images are returned, mostly VAE decoding."),
+    "cudiffusion_generation_seconds": ("histogram", "Time to generate one batch, from planning to queueing the outputs for saving."),
+    "cudiffusion_images_generated_total": ("counter", "Images returned by generation requests, hires tiles included."),
+    "cudiffusion_image_save_seconds": ("histogram", "Time to encode and write one output image."),
+    "cudiffusion_image_save_failures_total": ("counter", "Output images that could not be written."),
+    "cudiffusion_job_wait_seconds": ("histogram", "Time jobs spend queued before a worker picks them up."),
+    "cudiffusion_job_latency_seconds": ("histogram", "Time from submitting a job until it finishes."),
+    "cudiffusion_jobs_total": ("counter", "Finished jobs, by outcome."),
+    "cudiffusion_result_cache_lookups_total": ("counter", "Result cache lookups, by memory hit, disk hit or miss."),
+    "cudiffusion_result_cache_stores_total": ("counter", "Results stored in the result cache."),
+}
+
+__series: dict[str, dict[tuple[tuple[str, str], ...], Any]] = {name: {} for name in __DESCRIPTIONS}
+__lock: threading.Lock = threading.Lock()
+
+
+def increment(name: str, labels: dict[str, str] | None = None, value: float = 1.0) -> None:
+    label_key: tuple[tuple[str, str], ...] = tuple(sorted((labels or {}).items()))
+    with __lock:
+        series: dict[tuple[tuple[str, str], ...], Any] = __series[name]
+        series[label_key] = series.get(label_key, 0.0) + value
+
+
+def observe(name: str, value: float, labels: dict[str, str] | None = None) -> None:
+    label_key: tuple[tuple[str, str], ...] = tuple(sorted((labels or {}).items()))
+    with __lock:
+        series: dict[tuple[tuple[str, str], ...], Any] = __series[name]
+        # Each series holds the per-bucket counts, then the running sum and count.
+        histogram: list[Any] | None = series.get(label_key)
+        if histogram is None:
+            histogram = [[0] * len(constants.METRICS_BUCKETS), 0.0, 0]
+            series[label_key] = histogram
+        for bucket_index, bucket in enumerate(constants.METRICS_BUCKETS):
+            if value <= bucket:
+                histogram[0][bucket_index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def render() -> str:
+    lines: list[str] = []
+    with __lock:
+        for name, (metric_type, description) in __DESCRIPTIONS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for label_key, value in __series[name].items():
+                if metric_type == "counter":
+                    lines.append(f"{name}{__format_labels(label_key)} {value}")
+                    continue
+                for bucket, bucket_count in zip(constants.METRICS_BUCKETS, value[0]):
+                    lines.append(f"{name}_bucket{__format_labels(label_key + (('le', str(bucket)),))} {bucket_count}")
+                lines.append(f"{name}_bucket{__format_labels(label_key + (('le', '+Inf'),))} {value[2]}")
+                lines.append(f"{name}_sum{__format_labels(label_key)} {value[1]}")
+                lines.append(f"{name}_count{__format_labels(label_key)} {value[2]}")
+    return "\n".join(lines) + "\n"
+
+
+def log_event(event: str, fields: dict[str, Any]) -> None:
+    print(json.dumps({"time": time.time(), "event": event, **fields}, default=str))
+
+
+def log_exception(event: str, exception: BaseException, fields: dict[str, Any]) -> None:
+    log_event(event, {**fields, "error": repr(exception), "traceback": "".join(traceback.format_exception(exception))})
+
+
+def __format_labels(label_key: tuple[tuple[str, str], ...]) -> str:
+    if len(label_key) == 0:
+        return ""
+    return "{" + ",".join(f'{name}="{__escape(value)}"' for name, value in label_key) + "}"
+
+
+def __escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
@@ -0,0 +1,33 @@
+from typing import Any, Callable
+import time
+import random
+
+from PIL import Image
+
+
+# Stands in for `stable_diffusion_cpp` when CUDIFFUSION_MOCK_BACKEND=1, so the UI, the API and the
+# benchmarks can run without a model or the native library.
+class StableDiffusion:
+    def __init__(self, model_path: str, **kwargs: Any) -> None:
+        self.model_path: str = model_path
+        self.kwargs: dict[str, Any] = kwargs
+        time.sleep(0.5)
+
+    def generate_image(self, prompt: str, width: int = 512, height: int = 512, sample_steps: int = 20, seed: int = 42, batch_count: int = 1, init_image: Image.Image | None = None, progress_callback: Callable[[int, int, float], None] | None = None, preview_interval: int = 1, preview_callback: Callable[[int, list[Image.Image], bool], None] | None = None, **kwargs: Any) -> list[Image.Image]:
+        images: list[Image.Image] = []
+        for batch_index in range(batch_count):
+            generator: random.Random = random.Random(f"{prompt}:{seed + batch_index}")
+            color: tuple[int, int, int] = (generator.randrange(256), generator.randrange(256), generator.randrange(256))
+            for step in range(1, sample_steps + 1):
+                step_time: float = width * height / (512 * 512) * 0.01
+                time.sleep(step_time)
+                if progress_callback is not None:
+                    progress_callback(step, sample_steps, step_time)
+                if preview_callback is not None and step % preview_interval == 0:
+                    preview_callback(step, [Image.new("RGB", (width // 8, height // 8), color)], True)
+            if init_image is not None:
+                image: Image.Image = init_image.convert("RGB").resize((width, height))
+            else:
+                image = Image.new("RGB", (width, height), color)
+            images.append(image)
+        return images
@@ -0,0 +1,278 @@
+from typing import Any
+import os
+import json
+import hashlib
+import mmap
+import struct
+import threading
+
+from modules.core import constants
+
+
+__GGUF_VALUE_FORMATS: dict[int, str] = {
+    0: "<B",
+    1: "<b",
+    2: "<H",
+    3: "<h",
+    4: "<I",
+    5: "<i",
+    6: "<f",
+    7: "<?",
+    10: "<Q",
+    11: "<q",
+    12: "<d",
+}
+__GGUF_STRING_TYPE: int = 8
+__GGUF_ARRAY_TYPE: int = 9
+__GGML_TYPE_NAMES: dict[int, str] = {
+    0: "F32",
+    1: "F16",
+    2: "Q4_0",
+    3: "Q4_1",
+    6: "Q5_0",
+    7: "Q5_1",
+    8: "Q8_0",
+    9: "Q8_1",
+    10: "Q2_K",
+    11: "Q3_K",
+    12: "Q4_K",
+    13: "Q5_K",
+    14: "Q6_K",
+    15: "Q8_K",
+    16: "IQ2_XXS",
+    17: "IQ2_XS",
+    18: "IQ3_XXS",
+    19: "IQ1_S",
+    20: "IQ4_NL",
+    21: "IQ3_S",
+    22: "IQ2_S",
+    23: "IQ4_XS",
+    24: "I8",
+    25: "I16",
+    26: "I32",
+    27: "I64",
+    28: "F64",
+    29: "IQ1_M",
+    30: "BF16",
+    34: "TQ1_0",
+    35: "TQ2_0",
+}
+
+__entries: dict[str, dict[str, Any]] | None = None
+__lock: threading.Lock = threading.Lock()
+
+
+def get_info(image_model: str) -> dict[str, Any]:
+    global __entries
+
+    path: str = f"{constants.IMAGE_MODEL_DIR_PATH}{image_model}"
+    try:
+        stat: os.stat_result = os.stat(path)
+    except OSError:
+        return __get_unknown_info(0)
+
+    with __lock:
+        if __entries is None:
+            __entries = __load_index()
+
+        # An entry is only reused while the file keeps its size and mtime, so replaced models are parsed again.
+        entry: dict[str, Any] | None = __entries.get(path)
+        if entry is not None and entry["file_size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            return dict(entry)
+
+        try:
+            entry = __read_gguf(path) if image_model.endswith(".gguf") else __read_safetensors(path)
+        except (OSError, ValueError, KeyError, TypeError, struct.error, UnicodeDecodeError) as exception:
+            print(f"Error reading the header of image model '{image_model}': {exception}")
+            entry = __get_unknown_info(stat.st_size)
+        entry["file_size"] = stat.st_size
+        entry["mtime"] = stat.st_mtime_ns
+        __entries[path] = entry
+        __save_index(__entries)
+        return dict(entry)
+
+
+def get_choices(image_models: list[str]) -> list[tuple[str, str]]:
+    return [(format_label(image_model), image_model) for image_model in image_models]
+
+
+def format_label(image_model: str) -> str:
+    info: dict[str, Any] = get_info(image_model)
+    details: list[str] = [info["architecture"], info["dtype"]]
+    if info["parameter_count"] > 0:
+        details.append(f"{info['parameter_count'] / 1e9:.1f}B")
+    details.append(f"{info['file_size'] / 1024 ** 3:.1f} GiB")
+    return f"{image_model} ({', '.join(details)})"
+
+
+def get_default_resolution(image_model: str) -> int:
+    return constants.ARCHITECTURE_RESOLUTIONS.get(get_info(image_model)["architecture"], 512)
+
+
+def get_signature(image_model: str) -> tuple[int, int] | None:
+    try:
+        stat: os.stat_result = os.stat(f"{constants.IMAGE_MODEL_DIR_PATH}{image_model}")
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def get_digest(image_model: str) -> str | None:
+    # Evenly spaced samples tell a retrained or replaced checkpoint apart from a merely touched or copied one
+    # without reading gigabytes; any two different sets of weights differ throughout the file.
+    path: str = f"{constants.IMAGE_MODEL_DIR_PATH}{image_model}"
+    try:
+        with open(path, "rb") as file:
+            file_size: int = os.fstat(file.fileno()).st_size
+            hasher: Any = hashlib.blake2b(str(file_size).encode(), digest_size=16)
+            stride: int = max(file_size // constants.MODEL_DIGEST_SAMPLES, constants.MODEL_DIGEST_SAMPLE_SIZE)
+            for offset in range(0, file_size, stride):
+                file.seek(offset)
+                hasher.update(file.read(constants.MODEL_DIGEST_SAMPLE_SIZE))
+    except OSError:
+        return None
+    return hasher.hexdigest()
+
+
+def __get_unknown_info(file_size: int) -> dict[str, Any]:
+    return {
+        "architecture": "unknown",
+        "dtype": "unknown",
+        "parameter_count": 0,
+        "file_size": file_size,
+    }
+
+
+def __read_safetensors(path: str) -> dict[str, Any]:
+    # The file starts with the JSON header's length, so only that header is read and the tensor data never is.
+    with open(path, "rb") as file:
+        header_size: int = struct.unpack("<Q", file.read(8))[0]
+        if header_size > constants.MAX_MODEL_HEADER_SIZE:
+            raise ValueError(f"header of {header_size} bytes is too large")
+        header: dict[str, Any] = json.loads(file.read(header_size))
+
+    metadata: dict[str, Any] = header.pop("__metadata__", None) or {}
+    tensors: dict[str, tuple[str, int]] = {}
+    for name, tensor in header.items():
+        tensors[name] = (tensor["dtype"], __get_element_count(tensor["shape"]))
+    return __summarize(tensors, str(metadata.get("modelspec.architecture", "")))
+
+
+def __read_gguf(path: str) -> dict[str, Any]:
+    # Mapping the file only pages in the key/value and tensor info sections that are actually parsed.
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        if view[:4] != b"GGUF":
+            raise ValueError("missing GGUF magic")
+        version: int = struct.unpack_from("<I", view, 4)[0]
+        # Version 1 used 32-bit counts and lengths, later versions use 64-bit ones.
+        count_format: str = "<I" if version == 1 else "<Q"
+        count_size: int = struct.calcsize(count_format)
+        tensor_count: int = struct.unpack_from(count_format, view, 8)[0]
+        key_value_count: int = struct.unpack_from(count_format, view, 8 + count_size)[0]
+        offset: int = 8 + count_size * 2
+
+        architecture_hint: str = ""
+        for _ in range(key_value_count):
+            key, offset = __read_gguf_string(view, offset, count_format)
+            value_type: int = struct.unpack_from("<I", view, offset)[0]
+            value, offset = __read_gguf_value(view, offset + 4, value_type, count_format)
+            if key == "general.architecture" and isinstance(value, str):
+                architecture_hint = value
+
+        tensors: dict[str, tuple[str, int]] = {}
+        for _ in range(tensor_count):
+            name, offset = __read_gguf_string(view, offset, count_format)
+            dimension_count: int = struct.unpack_from("<I", view, offset)[0]
+            shape: tuple[int, ...] = struct.unpack_from(f"<{dimension_count}{count_format[1]}", view, offset + 4)
+            offset += 4 + dimension_count * count_size
+            tensor_type: int = struct.unpack_from("<I", view, offset)[0]
+            offset += 12
+            tensors[name] = (__GGML_TYPE_NAMES.get(tensor_type, f"type_{tensor_type}"), __get_element_count(shape))
+    return __summarize(tensors, architecture_hint)
+
+
+def __read_gguf_string(view: mmap.mmap, offset: int, count_format: str) -> tuple[str, int]:
+    length: int = struct.unpack_from(count_format, view, offset)[0]
+    offset += struct.calcsize(count_format)
+    return bytes(view[offset:offset + length]).decode("utf-8"), offset + length
+
+
+def __read_gguf_value(view: mmap.mmap, offset: int, value_type: int, count_format: str) -> tuple[Any, int]:
+    if value_type == __GGUF_STRING_TYPE:
+        return __read_gguf_string(view, offset, count_format)
+    if value_type == __GGUF_ARRAY_TYPE:
+        item_type: int = struct.unpack_from("<I", view, offset)[0]
+        item_count: int = struct.unpack_from(count_format, view, offset + 4)[0]
+        offset += 4 + struct.calcsize(count_format)
+        # Arrays such as tokenizer vocabularies can be large and are never needed, so fixed-size items are skipped over.
+        if item_type in __GGUF_VALUE_FORMATS:
+            return None, offset + item_count * struct.calcsize(__GGUF_VALUE_FORMATS[item_type])
+        for _ in range(item_count):
+            _, offset = __read_gguf_value(view, offset, item_type, count_format)
+        return None, offset
+    value_format: str = __GGUF_VALUE_FORMATS[value_type]
+    return struct.unpack_from(value_format, view, offset)[0], offset + struct.calcsize(value_format)
+
+
+def __get_element_count(shape: Any) -> int:
+    count: int = 1
+    for dimension in shape:
+        count *= int(dimension)
+    return count
+
+
+def __summarize(tensors: dict[str, tuple[str, int]], architecture_hint: str) -> dict[str, Any]:
+    parameter_counts: dict[str, int] = {}
+    for dtype, element_count in tensors.values():
+        parameter_counts[dtype] = parameter_counts.get(dtype, 0) + element_count
+
+    # Quantized files keep norms and biases in F32, so the type holding the most parameters is the one reported.
+    return {
+        "architecture": __detect_architecture(tensors.keys(), architecture_hint.lower()),
+        "dtype": max(parameter_counts, key=lambda dtype: parameter_counts[dtype]) if len(parameter_counts) > 0 else "unknown",
+        "parameter_count": sum(parameter_counts.values()),
+    }
+
+
+def __detect_architecture(names: Any, architecture_hint: str) -> str:
+    if "flux" in architecture_hint:
+        return "Flux"
+    if "xl" in architecture_hint:
+        return "SDXL"
+
+    names = list(names)
+    if any("double_blocks." in name for name in names):
+        return "Flux"
+    if any("joint_blocks." in name for name in names):
+        return "SD3"
+    if any("conditioner.embedders.1." in name or "label_emb." in name for name in names):
+        return "SDXL"
+    if any("cond_stage_model.model." in name for name in names):
+        return "SD2.x"
+    if any("cond_stage_model.transformer." in name or "diffusion_model.input_blocks." in name for name in names):
+        return "SD1.x"
+    return "unknown"
+
+
+def __load_index() -> dict[str, dict[str, Any]]:
+    index_path: str = f"{constants.DATA_DIR_PATH}{constants.MODEL_CATALOG_FILENAME}"
+    try:
+        with open(index_path, "rt") as file:
+            entries: Any = json.load(file)
+        return entries if isinstance(entries, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except (json.JSONDecodeError, OSError) as exception:
+        print(f"Error loading the model catalog from '{index_path}': {exception}")
+        return {}
+
+
+def __save_index(entries: dict[str, dict[str, Any]]) -> None:
+    index_path: str = f"{constants.DATA_DIR_PATH}{constants.MODEL_CATALOG_FILENAME}"
+    os.makedirs(constants.DATA_DIR_PATH, exist_ok=True)
+    try:
+        with open(f"{index_path}.tmp", "wt") as file:
+            json.dump(entries, file, indent=4)
+        os.replace(f"{index_path}.tmp", index_path)
+    except OSError as exception:
+        print(f"Error saving the model catalog to '{index_path}': {exception}")
@@ -0,0 +1,145 @@
+from typing import Any
+import os
+import json
+import uuid
+import sqlite3
+import weakref
+import datetime
+import threading
+import concurrent.futures
+
+from PIL import Image
+
+from modules.core import constants
+from modules import image_writer
+
+
+__connection: sqlite3.Connection | None = None
+__lock: threading.Lock = threading.Lock()
+# Pending and finished writes by image, so whoever shows or sends an image can reuse its encoded file.
+__saved_paths: dict[int, concurrent.futures.Future[str | None]] = {}
+
+
+def save(image: Image.Image, metadata: dict[str, Any]) -> concurrent.futures.Future[str | None]:
+    model_string: str = os.path.splitext(metadata["model"])[0]
+    time_string: str = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
+    # The random suffix keeps names unique across worker threads and processes saving in the same microsecond.
+    path_without_extension: str = f"{constants.IMAGE_OUTPUT_DIR_PATH}{model_string}_{time_string}_{metadata['seed']}_{uuid.uuid4().hex[:8]}"
+
+    text: dict[str, str] = {key: str(value) for key, value in metadata.items()}
+    text["parameters"] = format_parameters(metadata)
+
+    os.makedirs(constants.IMAGE_OUTPUT_DIR_PATH, exist_ok=True)
+    return __track(image, image_writer.submit(image, path_without_extension, text, lambda path: __index(path, metadata)))
+
+
+def save_grid(image: Image.Image, description: dict[str, Any]) -> concurrent.futures.Future[str | None]:
+    time_string: str = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
+    path_without_extension: str = f"{constants.IMAGE_OUTPUT_DIR_PATH}grid_{time_string}_{uuid.uuid4().hex[:8]}"
+    os.makedirs(constants.IMAGE_OUTPUT_DIR_PATH, exist_ok=True)
+    # Grids are not indexed, since they do not have a single prompt and seed to search by.
+    return __track(image, image_writer.submit(image, path_without_extension, {"parameters": json.dumps(description)}))
+
+
+def get_future(image: Image.Image) -> concurrent.futures.Future[str | None] | None:
+    return __saved_paths.get(id(image))
+
+
+def get_path(image: Image.Image, timeout: float | None = constants.OUTPUT_WAIT_TIMEOUT) -> str | None:
+    future: concurrent.futures.Future[str | None] | None = get_future(image)
+    if future is None:
+        return None
+    try:
+        return future.result(timeout)
+    except Exception:
+        # Timeouts and writer errors alike leave the image to be encoded by the caller.
+        return None
+
+
+def format_parameters(metadata: dict[str, Any]) -> str:
+    return (
+        f"{metadata['prompt']}\n"
+        f"Negative prompt: {metadata['negative_prompt']}\n"
+        f"Steps: {metadata['steps']}, Sampler: {metadata['sampler']}, CFG scale: {metadata['cfg_scale']}, "
+        f"Seed: {metadata['seed']}, Size: {metadata['width']}x{metadata['height']}, Model: {metadata['model']}, "
+        f"Clip skip: {metadata['clip_skip']}, Schedule type: {metadata['scheduler']}"
+    )
+
+
+def search(prompt: str | None = None, prompt_contains: str | None = None, model: str | None = None, seed: int | None = None, limit: int = 100) -> list[dict[str, Any]]:
+    conditions: list[str] = []
+    parameters: list[Any] = []
+    if prompt is not None:
+        conditions.append("prompt = ?")
+        parameters.append(prompt)
+    if prompt_contains is not None:
+        conditions.append("prompt LIKE ?")
+        parameters.append(f"%{prompt_contains}%")
+    if model is not None:
+        conditions.append("model = ?")
+        parameters.append(model)
+    if seed is not None:
+        conditions.append("seed = ?")
+        parameters.append(seed)
+    where_clause: str = f"WHERE {' AND '.join(conditions)}" if len(conditions) > 0 else ""
+    parameters.append(limit)
+
+    with __lock:
+        rows: list[sqlite3.Row] = __get_connection().execute(
+            f"SELECT path, created_at, metadata FROM outputs {where_clause} ORDER BY id DESC LIMIT ?",
+            parameters,
+        ).fetchall()
+    return [{"path": row["path"], "created_at": row["created_at"], **json.loads(row["metadata"])} for row in rows]
+
+
+def __track(image: Image.Image, future: concurrent.futures.Future[str | None]) -> concurrent.futures.Future[str | None]:
+    # Ids are only unique among live objects, so the entry goes away together with the image.
+    __saved_paths[id(image)] = future
+    weakref.finalize(image, __saved_paths.pop, id(image), None)
+    return future
+
+
+def __index(path: str, metadata: dict[str, Any]) -> None:
+    try:
+        with __lock:
+            connection: sqlite3.Connection = __get_connection()
+            connection.execute(
+                "INSERT INTO outputs (path, created_at, model, prompt, seed, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    datetime.datetime.now().isoformat(),
+                    metadata["model"],
+                    metadata["prompt"],
+                    metadata["seed"],
+                    json.dumps(metadata),
+                ),
+            )
+            connection.commit()
+    except sqlite3.Error as exception:
+        print(f"Error indexing image '{path}': {exception}")
+
+
+def __get_connection() -> sqlite3.Connection:
+    global __connection
+
+    if __connection is None:
+        os.makedirs(constants.DATA_DIR_PATH, exist_ok=True)
+        __connection = sqlite3.connect(f"{constants.DATA_DIR_PATH}{constants.OUTPUT_INDEX_FILENAME}", check_same_thread=False)
+        __connection.row_factory = sqlite3.Row
+        __connection.execute("PRAGMA journal_mode=WAL")
+        __connection.execute("""
+            CREATE TABLE IF NOT EXISTS outputs (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                seed INTEGER NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+        __connection.execute("CREATE INDEX IF NOT EXISTS outputs_model ON outputs (model)")
+        __connection.execute("CREATE INDEX IF NOT EXISTS outputs_seed ON outputs (seed)")
+        __connection.execute("CREATE INDEX IF NOT EXISTS outputs_prompt ON outputs (prompt)")
+        __connection.commit()
+    return __connection
@@ -0,0 +1,84 @@
+import time
+import threading
+
+from modules.core import constants
+from modules import settings
+from modules import diffuser_pool
+from modules import job_queue
+from modules import generation
+from modules import im_backend
+from modules import model_catalog
+from modules import memory_planner
+from modules import thread_tuner
+
+
+__state: str = "idle"
+__lock: threading.Lock = threading.Lock()
+
+
+def start() -> job_queue.Job | None:
+    image_model: str = settings.get_key("image_model/default_model", constants.DEFAULT_SETTINGS["image_model"]["default_model"])
+    if image_model == "":
+        return None
+    if image_model not in im_backend.get_image_models():
+        print(f"Default image model '{image_model}' not found in '{constants.IMAGE_MODEL_DIR_PATH}'.")
+        __set_state("failed")
+        return None
+
+    diffuser_key: diffuser_pool.Key = diffuser_pool.Key(
+        image_model,
+        settings.get_key("image_model/use_vae_tiling", constants.DEFAULT_SETTINGS["image_model"]["use_vae_tiling"]),
+        settings.get_key("image_model/scheduler", constants.DEFAULT_SETTINGS["image_model"]["scheduler"]),
+        settings.get_key("image_model/rng_type", constants.DEFAULT_SETTINGS["image_model"]["rng_type"]),
+        n_threads=thread_tuner.get_thread_count(image_model),
+    )
+    __set_state("loading")
+    # Going through the job queue runs the load on the worker thread while Gradio starts,
+    # and requests that arrive in the meantime simply queue up behind it.
+    return job_queue.submit(lambda: __preload(diffuser_key), kind="load", owner="startup")
+
+
+def get_state() -> str:
+    with __lock:
+        return __state
+
+
+def is_busy() -> bool:
+    return get_state() in ("loading", "warming")
+
+
+def __set_state(state: str) -> None:
+    global __state
+
+    with __lock:
+        __state = state
+
+
+def __preload(diffuser_key: diffuser_pool.Key) -> None:
+    start_time: float = time.perf_counter()
+    try:
+        resolution: int = model_catalog.get_default_resolution(diffuser_key.image_model)
+        diffuser_key = memory_planner.plan(diffuser_key, resolution, resolution)
+        diffuser_pool.acquire(diffuser_key)
+
+        if settings.get_key("image_model/warm_up", constants.DEFAULT_SETTINGS["image_model"]["warm_up"]):
+            __set_state("warming")
+            # A tiny generation makes the backend allocate its buffers and pick its kernels before the first real request.
+            generation.run(generation.Request(
+                diffuser_key=diffuser_key,
+                clip_skip=0,
+                positive_prompt="warm-up",
+                negative_prompt="",
+                seed=0,
+                steps=constants.WARM_UP_STEPS,
+                sampler="euler",
+                cfg_scale=1.0,
+                width=constants.WARM_UP_RESOLUTION,
+                height=constants.WARM_UP_RESOLUTION,
+                save_outputs=False,
+            ))
+    except BaseException:
+        __set_state("failed")
+        raise
+    __set_state("ready")
+    print(f"Default image model '{diffuser_key.image_model}' ready in {time.perf_counter() - start_time:.2f}s.")
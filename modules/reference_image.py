@@ -0,0 +1,83 @@
+import io
+import math
+import hashlib
+import threading
+import collections
+import dataclasses
+
+from PIL import Image, ImageOps
+
+from modules.core import constants
+
+
+@dataclasses.dataclass(frozen=True)
+class PreparedImage:
+    image: Image.Image
+    source_size: tuple[int, int]
+    resampled: bool
+
+
+__EXIF_ORIENTATION_TAG: int = 0x0112
+__TRANSPOSED_ORIENTATIONS: tuple[int, ...] = (5, 6, 7, 8)
+
+__entries: collections.OrderedDict[tuple[str, int, int, str], PreparedImage] = collections.OrderedDict()
+__lock: threading.Lock = threading.Lock()
+
+
+def prepare(source: str | bytes, width: int, height: int, resize_mode: str) -> PreparedImage:
+    if isinstance(source, str):
+        with open(source, "rb") as file:
+            source = file.read()
+
+    # Retries of the same upload hit this cache instead of decoding and resampling the file again.
+    cache_key: tuple[str, int, int, str] = (hashlib.blake2b(source, digest_size=16).hexdigest(), width, height, resize_mode)
+    with __lock:
+        prepared_image: PreparedImage | None = __entries.get(cache_key)
+        if prepared_image is not None:
+            __entries.move_to_end(cache_key)
+            return prepared_image
+
+    try:
+        prepared_image = __prepare(source, width, height, resize_mode)
+    except Image.DecompressionBombError as exception:
+        # Pillow's guard against oversized images is not an OSError; callers treat every unreadable image as one.
+        raise OSError(str(exception)) from exception
+    with __lock:
+        __entries[cache_key] = prepared_image
+        while len(__entries) > constants.REFERENCE_IMAGE_CACHE_SIZE:
+            __entries.popitem(last=False)
+    return prepared_image
+
+
+def __prepare(source: bytes, width: int, height: int, resize_mode: str) -> PreparedImage:
+    image: Image.Image = Image.open(io.BytesIO(source))
+    source_width, source_height = image.size
+    is_transposed: bool = image.getexif().get(__EXIF_ORIENTATION_TAG) in __TRANSPOSED_ORIENTATIONS
+    if is_transposed:
+        source_width, source_height = source_height, source_width
+
+    scale_x: float = width / source_width
+    scale_y: float = height / source_height
+    if resize_mode == "crop":
+        scale_x = scale_y = max(scale_x, scale_y)
+    elif resize_mode == "pad":
+        scale_x = scale_y = min(scale_x, scale_y)
+    resized_width: int = max(round(source_width * scale_x), 1)
+    resized_height: int = max(round(source_height * scale_y), 1)
+
+    # JPEG decoding can downscale by up to 8x on its own, so a phone photo never gets fully decoded for a small target.
+    draft_size: tuple[int, int] = (math.ceil(source_width * scale_x), math.ceil(source_height * scale_y))
+    image.draft("RGB", draft_size[::-1] if is_transposed else draft_size)
+    image = ImageOps.exif_transpose(image).convert("RGB")
+
+    if image.size != (resized_width, resized_height):
+        image = image.resize((resized_width, resized_height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    if resize_mode == "crop":
+        left: int = (resized_width - width) // 2
+        top: int = (resized_height - height) // 2
+        image = image.crop((left, top, left + width, top + height))
+    elif resize_mode == "pad":
+        padded_image: Image.Image = Image.new("RGB", (width, height))
+        padded_image.paste(image, ((width - resized_width) // 2, (height - resized_height) // 2))
+        image = padded_image
+    return PreparedImage(image, (source_width, source_height), (source_width, source_height) != (resized_width, resized_height))
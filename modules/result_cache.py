@@ -0,0 +1,126 @@
+from typing import Any
+import os
+import json
+import hashlib
+import threading
+import collections
+
+from PIL import Image
+
+from modules.core import constants
+from modules import settings
+from modules import image_writer
+from modules import metrics
+
+
+__memory_entries: collections.OrderedDict[str, list[Image.Image]] = collections.OrderedDict()
+__memory_size: int = 0
+__disk_size: int | None = None
+__lock: threading.RLock = threading.RLock()
+
+
+def is_enabled() -> bool:
+    return settings.get_key("result_cache/enabled", constants.DEFAULT_SETTINGS["result_cache"]["enabled"])
+
+
+def get_key(parameters: dict[str, Any], reference_image: Image.Image | None) -> str:
+    hasher: Any = hashlib.sha256(json.dumps(parameters, sort_keys=True).encode())
+    if reference_image is not None:
+        hasher.update(hash_image(reference_image).encode())
+    return hasher.hexdigest()
+
+
+def hash_image(image: Image.Image) -> str:
+    hasher: Any = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:".encode())
+    hasher.update(image.tobytes())
+    return hasher.hexdigest()
+
+
+def get(key: str, count: int) -> list[Image.Image] | None:
+    with __lock:
+        images: list[Image.Image] | None = __memory_entries.get(key)
+        if images is not None:
+            __memory_entries.move_to_end(key)
+            metrics.increment("cudiffusion_result_cache_lookups_total", {"result": "memory_hit"})
+            return list(images)
+
+        images = __read_from_disk(key, count)
+        if images is None:
+            metrics.increment("cudiffusion_result_cache_lookups_total", {"result": "miss"})
+            return None
+        metrics.increment("cudiffusion_result_cache_lookups_total", {"result": "disk_hit"})
+        __store_in_memory(key, images)
+        return list(images)
+
+
+def put(key: str, images: list[Image.Image]) -> None:
+    metrics.increment("cudiffusion_result_cache_stores_total")
+    with __lock:
+        __store_in_memory(key, images)
+
+    os.makedirs(constants.RESULT_CACHE_DIR_PATH, exist_ok=True)
+    for index, image in enumerate(images):
+        # The disk tier must round-trip pixels exactly, so it is always lossless PNG regardless of the output format.
+        image_writer.submit(image, f"{constants.RESULT_CACHE_DIR_PATH}{key}_{index}", {}, __on_disk_entry_saved, image_format="png")
+
+
+def __get_image_size(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+def __store_in_memory(key: str, images: list[Image.Image]) -> None:
+    global __memory_size
+
+    if key in __memory_entries:
+        __memory_entries.move_to_end(key)
+        return
+    __memory_entries[key] = list(images)
+    __memory_size += sum(__get_image_size(image) for image in images)
+
+    budget: int = settings.get_key("result_cache/memory_budget", constants.DEFAULT_SETTINGS["result_cache"]["memory_budget"]) * 1024 ** 2
+    while __memory_size > budget and len(__memory_entries) > 0:
+        _, evicted_images = __memory_entries.popitem(last=False)
+        __memory_size -= sum(__get_image_size(image) for image in evicted_images)
+
+
+def __read_from_disk(key: str, count: int) -> list[Image.Image] | None:
+    images: list[Image.Image] = []
+    for index in range(count):
+        path: str = f"{constants.RESULT_CACHE_DIR_PATH}{key}_{index}.png"
+        try:
+            with Image.open(path) as image:
+                image.load()
+                images.append(image.copy())
+            # Touching the file makes the disk tier evict by last use instead of by creation.
+            os.utime(path)
+        except OSError:
+            return None
+    return images
+
+
+def __on_disk_entry_saved(path: str) -> None:
+    global __disk_size
+
+    with __lock:
+        if __disk_size is None:
+            __disk_size = sum(entry.stat().st_size for entry in os.scandir(constants.RESULT_CACHE_DIR_PATH) if entry.is_file())
+        else:
+            __disk_size += os.path.getsize(path)
+
+        budget: int = settings.get_key("result_cache/disk_budget", constants.DEFAULT_SETTINGS["result_cache"]["disk_budget"]) * 1024 ** 2
+        if __disk_size <= budget:
+            return
+
+        entries: list[os.DirEntry[str]] = sorted(
+            (entry for entry in os.scandir(constants.RESULT_CACHE_DIR_PATH) if entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in entries:
+            if __disk_size <= budget:
+                break
+            try:
+                size: int = entry.stat().st_size
+                os.remove(entry.path)
+                __disk_size -= size
+            except OSError:
+                pass
@@ -2,50 +2,112 @@ from typing import Any
 import os
 import json
 import copy
+import atexit
+import functools
+import threading
 
 from modules.core import constants
 
 
 __data: dict[str, Any] = {}
+__is_dirty: bool = False
+__save_timer: threading.Timer | None = None
+__file_signature: tuple[int, int] | None = None
+__rejected_file_signature: tuple[int, int] | None = None
+__lock: threading.RLock = threading.RLock()
+__save_lock: threading.Lock = threading.Lock()
 
 
 def load() -> None:
-    global __data
+    global __data, __is_dirty, __file_signature
 
     settings_path: str = f"{constants.DATA_DIR_PATH}{constants.SETTINGS_FILENAME}"
+    file_signature: tuple[int, int] | None = __get_file_signature(settings_path)
 
     if os.path.exists(settings_path):
         try:
-            with open(settings_path, "rt") as file:
-                __data = __validate_and_fix_types(json.load(file), constants.DEFAULT_SETTINGS)
+            data: dict[str, Any] = __read(settings_path)
         except (json.JSONDecodeError, IOError) as exception:
-            __data = copy.deepcopy(constants.DEFAULT_SETTINGS)
+            data = copy.deepcopy(constants.DEFAULT_SETTINGS)
             print(f"Error loading settings from '{settings_path}': {exception}")
             print("Using default settings.")
     else:
-        __data = copy.deepcopy(constants.DEFAULT_SETTINGS)
+        data = copy.deepcopy(constants.DEFAULT_SETTINGS)
         print(f"Settings file '{settings_path}' not found. Using default settings.")
 
+    with __lock:
+        __data = data
+        __is_dirty = False
+        __file_signature = file_signature
+
+
+def reload_if_changed() -> bool:
+    settings_path: str = f"{constants.DATA_DIR_PATH}{constants.SETTINGS_FILENAME}"
+    global __data, __file_signature, __rejected_file_signature
+
+    with __lock:
+        # Changes made here and not yet written win over the file, which they are about to replace anyway.
+        file_signature: tuple[int, int] | None = __get_file_signature(settings_path)
+        if __is_dirty or file_signature in (__file_signature, __rejected_file_signature, None):
+            return False
+        try:
+            data: dict[str, Any] = __read(settings_path)
+        except (json.JSONDecodeError, IOError) as exception:
+            # A file caught mid-write or broken by hand must not replace the settings in use, or the defaults would
+            # reach the UI and be saved over the user's file. The next change to the file is tried again.
+            print(f"Error reloading settings from '{settings_path}': {exception}")
+            __rejected_file_signature = file_signature
+            return False
+        __data = data
+        __file_signature = file_signature
+    return True
+
 
 def save() -> None:
+    global __is_dirty, __file_signature
+
     settings_path: str = f"{constants.DATA_DIR_PATH}{constants.SETTINGS_FILENAME}"
 
+    with __lock:
+        text: str = json.dumps(__data, indent=4)
+        __is_dirty = False
+
     os.makedirs(constants.DATA_DIR_PATH, exist_ok=True)
 
-    try:
-        with open(settings_path, "wt") as file:
-            json.dump(__data, file, indent=4)
-    except IOError as exception:
-        print(f"Error saving settings to '{settings_path}': {exception}")
+    # Writing a temporary file and renaming it over the old one means a crash mid-write never leaves a truncated file.
+    with __save_lock:
+        try:
+            with open(f"{settings_path}.tmp", "wt") as file:
+                file.write(text)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(f"{settings_path}.tmp", settings_path)
+            with __lock:
+                __file_signature = __get_file_signature(settings_path)
+        except IOError as exception:
+            print(f"Error saving settings to '{settings_path}': {exception}")
+
+    with __lock:
+        # A change that arrived during the write found this save's timer still alive and scheduled nothing, so it is picked up here.
+        if __is_dirty:
+            __schedule_save()
+
+
+def flush() -> None:
+    with __lock:
+        if __save_timer is not None and __save_timer is not threading.current_thread():
+            __save_timer.cancel()
+        if not __is_dirty:
+            return
+    save()
 
 
 def get_key(path: str, default_value: Any = None) -> Any:
-    keys: list[str] = path.split("/")
-    current: dict[str, Any] = __data
-
     try:
-        for key in keys:
-            current = current[key]
+        with __lock:
+            current: Any = __data
+            for key in __split_path(path):
+                current = current[key]
         return current
     except (KeyError, TypeError):
         print(f"Malformed setting '{path}'.")
@@ -53,26 +115,59 @@ def get_key(path: str, default_value: Any = None) -> Any:
 
 
 def set_key(path: str, value: Any) -> None:
-    keys: list[str] = path.split("/")
-    current: dict[str, Any] = __data
+    global __is_dirty
 
-    try:
-        for key in keys[:-1]:
-            if key not in current:
-                current[key] = {}
-            elif not isinstance(current[key], dict):
-                return
-            current = current[key]
-
-        final_key = keys[-1]
-        current[final_key] = value
+    keys: tuple[str, ...] = __split_path(path)
 
-        save()
+    try:
+        with __lock:
+            current: dict[str, Any] = __data
+            for key in keys[:-1]:
+                if key not in current:
+                    current[key] = {}
+                elif not isinstance(current[key], dict):
+                    return
+                current = current[key]
+
+            final_key = keys[-1]
+            current[final_key] = value
+
+            # A burst of changes is written once, when the pending timer fires.
+            __is_dirty = True
+            __schedule_save()
     except (KeyError, TypeError, IndexError):
         print(f"Failed to set setting '{path}'.")
         pass
 
 
+def __schedule_save() -> None:
+    global __save_timer
+
+    with __lock:
+        if __save_timer is None or not __save_timer.is_alive() or __save_timer is threading.current_thread():
+            __save_timer = threading.Timer(constants.SETTINGS_SAVE_DELAY, flush)
+            __save_timer.daemon = True
+            __save_timer.start()
+
+
+def __read(settings_path: str) -> dict[str, Any]:
+    with open(settings_path, "rt") as file:
+        return __validate_and_fix_types(json.load(file), constants.DEFAULT_SETTINGS)
+
+
+def __get_file_signature(path: str) -> tuple[int, int] | None:
+    try:
+        stat: os.stat_result = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+@functools.cache
+def __split_path(path: str) -> tuple[str, ...]:
+    return tuple(path.split("/"))
+
+
 def __validate_and_fix_types(loaded_data: dict[str, Any], default_data: dict[str, Any]) -> dict[str, Any]:
     result: dict[str, Any] = {}
 
@@ -80,8 +175,12 @@ def __validate_and_fix_types(loaded_data: dict[str, Any], default_data: dict[str
         if key in loaded_data:
             loaded_value: Any = loaded_data[key]
 
+            # An empty default dictionary holds user-defined keys, so it is taken as loaded.
+            if isinstance(default_value, dict) and isinstance(loaded_value, dict) and len(default_value) == 0:  # type: ignore
+                result[key] = loaded_value
+
             # If both are dictionaries, recurse.
-            if isinstance(default_value, dict) and isinstance(loaded_value, dict):
+            elif isinstance(default_value, dict) and isinstance(loaded_value, dict):
                 result[key] = __validate_and_fix_types(loaded_value, default_value)  # type: ignore
 
             # If types match, use loaded value.
@@ -90,9 +189,12 @@ def __validate_and_fix_types(loaded_data: dict[str, Any], default_data: dict[str
             else:
                 # Type mismatch, use default and log warning.
                 print(f"Type mismatch for setting '{key}': expected {type(default_value).__name__}, "f"got {type(loaded_value).__name__}. Using default value.")  # type: ignore
-                result[key] = default_value
+                result[key] = copy.deepcopy(default_value)
         else:
             # Key missing in loaded data, use default
-            result[key] = default_value
+            result[key] = copy.deepcopy(default_value)
 
     return result
+
+
+atexit.register(flush)
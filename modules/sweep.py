@@ -0,0 +1,176 @@
+from typing import Any
+import math
+import time
+import itertools
+import dataclasses
+
+from PIL import Image, ImageDraw, ImageFont
+
+from modules.core import constants
+from modules import generation
+from modules import output_store
+from modules import metrics
+
+
+def parse_values(axis: str, text: str) -> list[Any]:
+    values: list[Any] = []
+    for item in text.split(","):
+        item = item.strip()
+        if item == "":
+            continue
+        try:
+            value: Any
+            if axis in ("seed", "steps", "clip_skip"):
+                value = int(item)
+            elif axis == "cfg_scale":
+                value = float(item)
+            elif axis == "size":
+                width, height = (int(part) for part in item.lower().split("x"))
+                if width % 64 != 0 or height % 64 != 0 or not 64 <= width <= 2048 or not 64 <= height <= 2048:
+                    raise ValueError
+                value = (width, height)
+            else:
+                value = item
+            # Values are checked here, before anything is queued, rather than failing deep inside the job.
+            if axis == "sampler" and value not in constants.SAMPLERS:
+                raise ValueError
+            if axis in constants.SWEEP_AXIS_RANGES and not constants.SWEEP_AXIS_RANGES[axis][0] <= value <= constants.SWEEP_AXIS_RANGES[axis][1]:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"'{item}' is not a valid {constants.SWEEP_AXES[axis]} value.")
+        if value not in values:
+            values.append(value)
+    return values
+
+
+def get_cell_count(axes: dict[str, list[Any]]) -> int:
+    return math.prod(max(len(values), 1) for values in axes.values())
+
+
+def validate(axes: dict[str, list[Any]]) -> None:
+    cell_count: int = get_cell_count(axes)
+    if cell_count > constants.MAX_SWEEP_CELLS:
+        raise ValueError(f"The sweep has {cell_count} cells, the limit is {constants.MAX_SWEEP_CELLS}.")
+
+
+def run(request: generation.Request, axes: dict[str, list[Any]]) -> tuple[Image.Image, list[dict[str, Any]]]:
+    validate(axes)
+    axis_values: dict[str, list[Any]] = {axis: axes.get(axis) or [__get_value(request, axis)] for axis in constants.SWEEP_AXES}
+    start_time: float = time.perf_counter()
+
+    # The product varies the cheapest axis fastest, so the backend is reconfigured as rarely as possible,
+    # and runs of consecutive seeds with otherwise equal settings go into a single call that encodes the prompts once.
+    cells: list[dict[str, Any]] = []
+    calls: list[list[dict[str, Any]]] = []
+    for values in itertools.product(*axis_values.values()):
+        cell: dict[str, Any] = {"values": dict(zip(axis_values, values))}
+        cells.append(cell)
+        previous_cell: dict[str, Any] | None = calls[-1][-1] if len(calls) > 0 else None
+        if previous_cell is not None and __is_next_seed(previous_cell["values"], cell["values"]):
+            calls[-1].append(cell)
+        else:
+            calls.append([cell])
+
+    for call in calls:
+        values = call[0]["values"]
+        call_request: generation.Request = dataclasses.replace(
+            request,
+            seed=values["seed"],
+            steps=values["steps"],
+            cfg_scale=values["cfg_scale"],
+            sampler=values["sampler"],
+            clip_skip=values["clip_skip"],
+            width=values["size"][0],
+            height=values["size"][1],
+            batch_size=len(call),
+            use_cache=False,
+            hires=None,
+        )
+        call_start_time: float = time.perf_counter()
+        images: list[Image.Image] = generation.run(call_request)
+        cell_time: float = (time.perf_counter() - call_start_time) / len(call)
+        for cell, image in zip(call, images):
+            cell["image"] = image
+            cell["seconds"] = cell_time
+
+    grid: Image.Image = __assemble_grid(cells, {axis: values for axis, values in axes.items() if len(values) > 0})
+    description: dict[str, Any] = {
+        "prompt": request.positive_prompt,
+        "negative_prompt": request.negative_prompt,
+        "model": request.diffuser_key.image_model,
+        "cells": [{**cell["values"], "seconds": round(cell["seconds"], 3)} for cell in cells],
+    }
+    output_store.save_grid(grid, description)
+    metrics.log_event("sweep", {
+        "model": request.diffuser_key.image_model,
+        "cells": len(cells),
+        "calls": len(calls),
+        "total_seconds": round(time.perf_counter() - start_time, 4),
+    })
+    return grid, cells
+
+
+def format_cell(cell: dict[str, Any], axes: dict[str, list[Any]]) -> str:
+    labels: list[str] = [__format_label(axis, cell["values"][axis]) for axis in axes if len(axes[axis]) > 1]
+    labels.append(f"{cell['seconds']:.2f}s")
+    return ", ".join(labels)
+
+
+def __get_value(request: generation.Request, axis: str) -> Any:
+    if axis == "size":
+        return request.width, request.height
+    return getattr(request, axis)
+
+
+def __is_next_seed(previous_values: dict[str, Any], values: dict[str, Any]) -> bool:
+    return values["seed"] == previous_values["seed"] + 1 and all(values[axis] == previous_values[axis] for axis in values if axis != "seed")
+
+
+def __format_label(axis: str, value: Any) -> str:
+    if axis == "size":
+        return f"{constants.SWEEP_AXES[axis]} {value[0]}x{value[1]}"
+    return f"{constants.SWEEP_AXES[axis]} {value}"
+
+
+def __assemble_grid(cells: list[dict[str, Any]], axes: dict[str, list[Any]]) -> Image.Image:
+    # The first swept axis in the order the user sees them runs across, every other one down.
+    swept_axes: list[str] = [axis for axis in reversed(constants.SWEEP_AXES) if len(axes.get(axis, [])) > 1]
+    column_axis: str | None = swept_axes[0] if len(swept_axes) > 0 else None
+    row_axes: list[str] = swept_axes[1:]
+    column_values: list[Any] = axes[column_axis] if column_axis is not None else [None]
+    row_values: list[tuple[Any, ...]] = list(itertools.product(*(axes[axis] for axis in row_axes)))
+
+    font: ImageFont.ImageFont | ImageFont.FreeTypeFont = ImageFont.load_default(size=constants.SWEEP_GRID_FONT_SIZE)
+    padding: int = constants.SWEEP_GRID_PADDING
+    line_height: int = constants.SWEEP_GRID_FONT_SIZE + padding
+    cell_width: int = max(cell["image"].width for cell in cells)
+    cell_height: int = max(cell["image"].height for cell in cells)
+    cell_scale: float = min(math.sqrt(constants.MAX_SWEEP_GRID_PIXELS / (len(column_values) * len(row_values) * cell_width * cell_height)), 1.0)
+    cell_width = max(int(cell_width * cell_scale), 1)
+    cell_height = max(int(cell_height * cell_scale), 1)
+    row_labels: list[str] = [", ".join(__format_label(axis, value) for axis, value in zip(row_axes, values)) for values in row_values]
+    measure: ImageDraw.ImageDraw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    label_width: int = max((int(measure.textlength(label, font=font)) + padding * 2 for label in row_labels if label != ""), default=0)
+    header_height: int = line_height if column_axis is not None else 0
+
+    grid: Image.Image = Image.new("RGB", (label_width + len(column_values) * (cell_width + padding), header_height + len(row_values) * (cell_height + line_height)), "white")
+    draw: ImageDraw.ImageDraw = ImageDraw.Draw(grid)
+    for column_index, column_value in enumerate(column_values):
+        if column_axis is not None:
+            draw.text((label_width + column_index * (cell_width + padding) + padding // 2, padding // 2), __format_label(column_axis, column_value), fill="black", font=font)
+    for row_index, (values, row_label) in enumerate(zip(row_values, row_labels)):
+        top: int = header_height + row_index * (cell_height + line_height)
+        draw.text((padding, top + cell_height // 2), row_label, fill="black", font=font, anchor="lm")
+        for column_index, column_value in enumerate(column_values):
+            wanted: dict[str, Any] = dict(zip(row_axes, values))
+            if column_axis is not None:
+                wanted[column_axis] = column_value
+            cell: dict[str, Any] = next(cell for cell in cells if all(cell["values"][axis] == value for axis, value in wanted.items()))
+            left: int = label_width + column_index * (cell_width + padding)
+            image: Image.Image = cell["image"]
+            if cell_scale < 1.0:
+                image = image.resize((max(int(image.width * cell_scale), 1), max(int(image.height * cell_scale), 1)), Image.Resampling.LANCZOS)
+            grid.paste(image, (left + (cell_width - image.width) // 2, top + (cell_height - image.height) // 2))
+            # Every cell carries its own time, so the grid doubles as a speed comparison.
+            draw.text((left + padding // 2, top + cell_height + padding // 2), f"{cell['seconds']:.2f}s", fill="black", font=font)
+    return grid
@@ -0,0 +1,72 @@
+import statistics
+
+from modules.core import constants
+from modules import settings
+from modules import diffuser_pool
+from modules import generation
+from modules import worker_pool
+
+
+def get_thread_count(image_model: str) -> int:
+    n_threads: int = settings.get_key("image_model/n_threads", constants.DEFAULT_SETTINGS["image_model"]["n_threads"])
+    if n_threads > 0:
+        return n_threads
+    # Without an explicit count, the tuned count for this model wins over the library default.
+    tuned_threads: dict[str, int] = settings.get_key("image_model/tuned_threads", constants.DEFAULT_SETTINGS["image_model"]["tuned_threads"])
+    tuned_count: int | None = tuned_threads.get(image_model)
+    if not isinstance(tuned_count, int) or tuned_count <= 0:
+        return -1
+    # Every worker process gets the same count, so a count tuned with fewer workers is capped to one worker's share of the cores.
+    return min(tuned_count, worker_pool.get_cpu_share())
+
+
+def get_candidates() -> list[int]:
+    # Tuning times one generation at a time, so with worker processes it searches one worker's share of the cores.
+    cpu_count: int = worker_pool.get_cpu_share()
+    return sorted({max(cpu_count * eighths // 8, 1) for eighths in (1, 2, 4, 6, 8)})
+
+
+def tune(diffuser_key: diffuser_pool.Key) -> int:
+    best_key: diffuser_pool.Key | None = None
+    best_step_time: float = 0.0
+    best_key_was_resident: bool = False
+    for n_threads in get_candidates():
+        # Candidates load through the same memory check as generation, which may fall back to VAE tiling or offloading.
+        key: diffuser_pool.Key = generation.plan(diffuser_key._replace(n_threads=n_threads), constants.THREAD_TUNING_RESOLUTION, constants.THREAD_TUNING_RESOLUTION)
+        was_resident: bool = diffuser_pool.is_resident(key)
+        diffuser_pool.acquire(key)
+
+        request: generation.Request = generation.Request(
+            diffuser_key=key,
+            clip_skip=0,
+            positive_prompt="thread tuning",
+            negative_prompt="",
+            seed=0,
+            steps=constants.THREAD_TUNING_STEPS,
+            sampler="euler",
+            cfg_scale=7.0,
+            width=constants.THREAD_TUNING_RESOLUTION,
+            height=constants.THREAD_TUNING_RESOLUTION,
+            save_outputs=False,
+        )
+        # The first run pays for buffer allocation, so only the second one is timed.
+        generation.run(request)
+        step_times: list[float] = []
+        generation.run(request, lambda step, steps, step_time: step_times.append(step_time))
+        step_time: float = statistics.median(step_times) if len(step_times) > 0 else float("inf")
+        print(f"Thread tuning '{key.image_model}': {n_threads} thread(s), {step_time:.3f}s per step.")
+
+        # Only the fastest candidate so far stays loaded, so tuning never holds more than two copies of the model.
+        if best_key is None or step_time < best_step_time:
+            if best_key is not None and not best_key_was_resident:
+                diffuser_pool.evict(best_key)
+            best_key, best_step_time, best_key_was_resident = key, step_time, was_resident
+        elif not was_resident:
+            diffuser_pool.evict(key)
+
+    if best_key is None:
+        return -1
+    diffuser_pool.acquire(best_key)
+    settings.set_key(f"image_model/tuned_threads/{best_key.image_model}", best_key.n_threads)
+    print(f"Thread tuning '{best_key.image_model}': {best_key.n_threads} thread(s) is fastest, saved to the settings.")
+    return best_key.n_threads
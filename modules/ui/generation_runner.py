@@ -0,0 +1,104 @@
+from typing import Any, Iterator
+import time
+import dataclasses
+
+import gradio as gr
+from PIL import Image
+
+from modules.core import constants
+from modules import settings
+from modules import job_queue
+from modules import job_journal
+from modules import output_store
+from modules import generation
+from modules import memory_planner
+
+
+def stream_batch(generation_request: generation.Request, batch_count: int, seed_mode: str, owner: str, coalesce: bool | None = None) -> Iterator[tuple[Any, str]]:
+    if coalesce is None:
+        coalesce = settings.get_key("generation/coalesce_seed_sweeps", constants.DEFAULT_SETTINGS["generation"]["coalesce_seed_sweeps"])
+    batch_sizes: list[int] = [generation_request.batch_size] * batch_count
+    # Incrementing seeds are consecutive across batches, so the sweep can run as fewer, larger backend calls that
+    # each encode the prompts once; the planner caps a call at what fits in memory next to the model.
+    if coalesce and seed_mode == "increment" and batch_count > 1:
+        image_count: int = generation_request.batch_size * batch_count
+        call_size: int = memory_planner.get_max_batch_size(generation_request.diffuser_key, generation_request.width, generation_request.height, image_count)
+        batch_sizes = [min(call_size, image_count - offset) for offset in range(0, image_count, call_size)]
+        batch_count = len(batch_sizes)
+
+    seeds: list[int] = generation.resolve_seeds(generation_request.seed, batch_count, batch_sizes[0], seed_mode)
+    jobs: list[job_queue.Job] = []
+    for batch_index, seed in enumerate(seeds):
+        # Only seeds the user can ask for again are worth caching; fresh random seeds never repeat.
+        use_cache: bool = generation_request.seed >= 0 and (seed_mode == "increment" or batch_index == 0)
+        batch_request: generation.Request = dataclasses.replace(generation_request, seed=seed, batch_size=batch_sizes[batch_index], use_cache=use_cache)
+        cached_images: list[Image.Image] | None = generation.get_cached(batch_request)
+        if cached_images is not None:
+            jobs.append(job_journal.complete(batch_request, cached_images, owner=owner))
+        else:
+            jobs.append(job_journal.submit(batch_request, owner=owner))
+
+    gallery: list[tuple[Image.Image, str]] = []
+    start_time: float = time.perf_counter()
+    # Journaled jobs outlive the page, so leaving it no longer cancels them; the Cancel button still does.
+    job_ids: str = ", ".join(f"`{job.id}`" for job in jobs)
+    # Random seeds are resolved before anything runs, so the seed is known (and reusable) from the first update on.
+    seed_string: str = format_seeds(seeds, batch_sizes, seed_mode)
+    yield [], f"{job_queue.format_status(jobs[0])} {seed_string}. Job ID(s): {job_ids}."
+    for batch_index, (seed, job) in enumerate(zip(seeds, jobs)):
+        shown_preview: Image.Image | None = None
+        for status in job_queue.stream(job, cancel_on_close=False):
+            if job.preview is not None and job.preview is not shown_preview:
+                shown_preview = job.preview
+                yield gallery + [(shown_preview, f"Preview (step {job.step})")], f"Batch {batch_index + 1}/{batch_count}: {status}"
+            else:
+                yield gr.update(), f"Batch {batch_index + 1}/{batch_count}: {status}"
+
+        if job.status == "failed":
+            gr.Warning(str(job.exception) if isinstance(job.exception, memory_planner.InsufficientMemoryError) else constants.WARNING_GENERIC)
+        if job.status != "done":
+            for remaining_job in jobs[batch_index + 1:]:
+                job_queue.cancel(remaining_job.id)
+            break
+        for image_index, image in enumerate(job.result):
+            gallery.append((output_store.get_path(image) or image, f"Seed {seed + image_index}"))
+        yield gallery, f"Batch {batch_index + 1}/{batch_count}: {job_queue.format_status(job)}"
+
+    elapsed_time: float = time.perf_counter() - start_time
+    if len(gallery) > 0:
+        images_per_minute: float = len(gallery) / elapsed_time * 60.0
+        yield gallery, f"Generated {len(gallery)} image(s) in {elapsed_time:.2f}s ({images_per_minute:.1f} images/min). {seed_string}."
+    else:
+        yield gallery, job_queue.format_status(next((job for job in jobs if job.status != "done"), jobs[-1]))
+
+
+def format_seeds(seeds: list[int], batch_sizes: list[int], seed_mode: str) -> str:
+    if seed_mode == "increment" and sum(batch_sizes) > 1:
+        return f"Seeds `{seeds[0]}`-`{seeds[0] + sum(batch_sizes) - 1}`"
+    if sum(batch_sizes) > 1:
+        return "Seeds " + ", ".join(f"`{seed}`-`{seed + batch_size - 1}`" if batch_size > 1 else f"`{seed}`" for seed, batch_size in zip(seeds, batch_sizes))
+    return f"Seed `{seeds[0]}`"
+
+
+def on_gallery_select(event: gr.SelectData):
+    # Picking an image puts its seed back into the seed field, so a variation the user likes can be reproduced or refined.
+    caption: str | None = event.value.get("caption") if isinstance(event.value, dict) else None
+    if caption is None or not caption.startswith("Seed "):
+        return gr.update()
+    return int(caption.removeprefix("Seed "))
+
+
+def retrieve_job(job_id: str) -> tuple[Any, str]:
+    job_id = job_id.strip().strip("`")
+    job: job_queue.Job | None = job_queue.get_job(job_id)
+    if job is not None:
+        if job.status != "done":
+            return gr.update(), f"Job `{job_id}`: {job_queue.format_status(job)}"
+        return [(output_store.get_path(image) or image, f"Image {image_index + 1}") for image_index, image in enumerate(job_journal.get_images(job))], f"Job `{job_id}`: {job_queue.format_status(job)}"
+
+    entry: dict[str, Any] | None = job_journal.get(job_id)
+    if entry is None:
+        raise gr.Error("Unknown job ID.", print_exception=False)
+    if entry["status"] != "done":
+        return gr.update(), f"Job `{job_id}`: {entry['status'].capitalize()}."
+    return [(path, f"Image {image_index + 1}") for image_index, path in enumerate(entry["paths"])], f"Job `{job_id}`: Done."
@@ -13,6 +13,8 @@ class SettingComponent:
         self.instance: gr.Component | None = None
         self.event: Any = None
         self._unique_id: int = 0
+        self._key: str = key
+        self._default_value: Any = default_value
 
         while self._unique_id in self.__used_ids:
             self._unique_id += 1
@@ -23,6 +25,7 @@ class SettingComponent:
             raise ReferenceError
         shared.setting_components.append(self.instance)
         shared.setting_component_values[self._unique_id] = self.instance.value
+        shared.setting_component_keys[self._unique_id] = (self._key, self._default_value)
 
     @staticmethod
     def _on_change(unique_id: int, key: str, value: Any) -> None:
@@ -1,9 +1,14 @@
+from typing import Any
+
 import gradio as gr
-import stable_diffusion_cpp  # type: ignore
 
 from modules.core import constants
-from modules.core import shared
 from modules import im_backend
+from modules import diffuser_pool
+from modules import job_queue
+from modules import model_catalog
+from modules import memory_planner
+from modules import thread_tuner
 from modules.ui import setting_components
 
 
@@ -19,7 +24,7 @@ class Element:
             </h2>
             """)
             self.image_model_dropdown: gr.Dropdown = gr.Dropdown(
-                choices=im_backend.get_image_models(),
+                choices=im_backend.get_image_model_choices(),
                 label="Image Model",
                 interactive=True,
             )
@@ -58,34 +63,146 @@ class Element:
                 variant="primary",
                 interactive=True,
             )
-
-    def on_load_image_button_click(self, image_model: str, use_vae_tiling: bool, scheduler: str, rng_type: str, is_diffuser_busy: bool):
-        if is_diffuser_busy:
-            yield (
-                gr.update(),
-                gr.update(),
-                gr.update(),
+            self.n_threads_dropdown: setting_components.Dropdown = setting_components.Dropdown(
+                key="image_model/n_threads",
+                default_value=constants.DEFAULT_SETTINGS["image_model"]["n_threads"],
+                choices=[("Auto", -1)] + [(str(n_threads), n_threads) for n_threads in thread_tuner.get_candidates()],
+                label="Threads",
+                info="Auto = tuned count for the model, else the library default",
+                interactive=True,
+            )
+            self.tune_threads_button: gr.Button = gr.Button(
+                value="Auto-Tune Threads",
+                variant="secondary",
+                interactive=True,
+            )
+            self.default_image_model_dropdown: setting_components.Dropdown = setting_components.Dropdown(
+                key="image_model/default_model",
+                default_value=constants.DEFAULT_SETTINGS["image_model"]["default_model"],
+                choices=[("None", "")] + im_backend.get_image_model_choices(),
+                label="Startup Model",
+                info="Loaded in the background on startup",
+                interactive=True,
+            )
+            self.warm_up_checkbox: setting_components.Checkbox = setting_components.Checkbox(
+                key="image_model/warm_up",
+                default_value=constants.DEFAULT_SETTINGS["image_model"]["warm_up"],
+                label="Warm Up Startup Model",
+                interactive=True,
+            )
+            self.queue_ordering_dropdown: setting_components.Dropdown = setting_components.Dropdown(
+                key="queue/ordering",
+                default_value=constants.DEFAULT_SETTINGS["queue"]["ordering"],
+                choices=(
+                    "fifo",
+                    "priority",
+                ),
+                label="Queue Ordering",
+                interactive=True,
+            )
+            self.worker_count_dropdown: setting_components.Dropdown = setting_components.Dropdown(
+                key="workers/count",
+                default_value=constants.DEFAULT_SETTINGS["workers"]["count"],
+                choices=(
+                    0,
+                    1,
+                    2,
+                    4,
+                    8,
+                ),
+                label="Worker Processes",
+                info="`0` = in-process, applies after a restart",
+                interactive=True,
+            )
+            self.cpu_affinity_checkbox: setting_components.Checkbox = setting_components.Checkbox(
+                key="workers/cpu_affinity",
+                default_value=constants.DEFAULT_SETTINGS["workers"]["cpu_affinity"],
+                label="Pin Workers to Cores",
+                info="Gives each worker process its own share of cores, applies after a restart",
+                interactive=True,
+            )
+            self.preview_interval_dropdown: setting_components.Dropdown = setting_components.Dropdown(
+                key="generation/preview_interval",
+                default_value=constants.DEFAULT_SETTINGS["generation"]["preview_interval"],
+                choices=(
+                    0,
+                    1,
+                    2,
+                    5,
+                    10,
+                ),
+                label="Preview Interval",
+                info="Steps between live previews, `0` = off",
+                interactive=True,
+            )
+            self.coalesce_seed_sweeps_checkbox: setting_components.Checkbox = setting_components.Checkbox(
+                key="generation/coalesce_seed_sweeps",
+                default_value=constants.DEFAULT_SETTINGS["generation"]["coalesce_seed_sweeps"],
+                label="Coalesce Seed Sweeps",
+                info="Merge increment-seed batches into fewer calls that encode the prompts once; images appear per call",
+                interactive=True,
+            )
+            self.output_format_dropdown: setting_components.Dropdown = setting_components.Dropdown(
+                key="output/format",
+                default_value=constants.DEFAULT_SETTINGS["output"]["format"],
+                choices=(
+                    "png",
+                    "webp",
+                    "jpeg",
+                    "avif",
+                ),
+                label="Output Format",
+                interactive=True,
             )
-            return
 
-        if shared.diffuser["id"] != image_model:
+    def on_load_image_button_click(self, image_model: str, use_vae_tiling: bool, scheduler: str, rng_type: str, width: int, height: int, request: gr.Request):
+        diffuser_key: diffuser_pool.Key = diffuser_pool.Key(image_model, use_vae_tiling, scheduler, rng_type, n_threads=thread_tuner.get_thread_count(image_model))
+        previous_key: diffuser_pool.Key | None = diffuser_pool.get_active_key()
+        resolution_update: Any = gr.update()
+        if previous_key != diffuser_key:
             yield (
                 gr.update(value="Loading...", interactive=False),
                 gr.update(interactive=False),
                 gr.update(interactive=False),
-            )
-            try:
-                shared.diffuser["id"] = image_model
-                shared.diffuser["ref"] = stable_diffusion_cpp.StableDiffusion(
-                    model_path=f"{constants.IMAGE_MODEL_DIR_PATH}{image_model}",
-                    vae_tiling=use_vae_tiling,
-                    rng_type=rng_type,
-                    schedule=scheduler,
-                )
-            except:
+            ) + (gr.update(),) * 4
+            job: job_queue.Job = job_queue.submit(lambda: diffuser_pool.acquire(memory_planner.plan(diffuser_key, width, height)), kind="load", owner=request.session_hash or "")
+            for _ in job_queue.stream(job):
+                pass
+            if job.status == "done":
+                print(diffuser_pool.format_stats())
+                # Switching to a model of another architecture moves the sizes to that architecture's native resolution.
+                resolution: int = model_catalog.get_default_resolution(image_model)
+                if previous_key is None or model_catalog.get_default_resolution(previous_key.image_model) != resolution:
+                    resolution_update = gr.update(value=resolution)
+            elif isinstance(job.exception, memory_planner.InsufficientMemoryError):
+                gr.Warning(str(job.exception))
+            else:
                 gr.Warning(constants.WARNING_GENERIC)
         yield (
             gr.update(value="Load", interactive=True),
-            gr.update(interactive=True),
-            gr.update(interactive=True),
+            gr.update(interactive=im_backend.is_diffuser_loaded()),
+            gr.update(interactive=im_backend.is_diffuser_loaded()),
+        ) + (resolution_update,) * 4
+
+    def on_tune_threads_button_click(self, image_model: str, use_vae_tiling: bool, scheduler: str, rng_type: str, request: gr.Request):
+        if image_model is None:
+            raise gr.Error("You must select an image model.", print_exception=False)
+
+        diffuser_key: diffuser_pool.Key = diffuser_pool.Key(image_model, use_vae_tiling, scheduler, rng_type)
+        yield (
+            gr.update(value="Tuning...", interactive=False),
+            gr.update(interactive=False),
+            gr.update(interactive=False),
+        )
+        job: job_queue.Job = job_queue.submit(lambda: thread_tuner.tune(diffuser_key), kind="tune", owner=request.session_hash or "")
+        for _ in job_queue.stream(job):
+            pass
+        if job.status == "done":
+            gr.Info(f"{job.result} thread(s) is fastest for '{image_model}'.")
+        elif job.status == "failed":
+            gr.Warning(str(job.exception) if isinstance(job.exception, memory_planner.InsufficientMemoryError) else constants.WARNING_GENERIC)
+        yield (
+            gr.update(value="Auto-Tune Threads", interactive=True),
+            gr.update(interactive=im_backend.is_diffuser_loaded()),
+            gr.update(interactive=im_backend.is_diffuser_loaded()),
         )
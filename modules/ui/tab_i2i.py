@@ -1,41 +1,41 @@
 import gradio as gr
-from PIL import Image
 
-from modules.core import constants
-from modules.core import shared
-from modules import im_backend
+from modules import diffuser_pool
+from modules import generation
+from modules import reference_image
+from modules.ui import generation_runner
 
 
-def image_to_image(clip_skip: int, positive_prompt: str, negative_prompt: str, seed: int, steps: int, sampler: str, cfg_scale: float, width: int, height: int, reference_image: Image.Image):
-    if not im_backend.is_diffuser_loaded():
+def image_to_image(clip_skip: int, positive_prompt: str, negative_prompt: str, seed: int, steps: int, sampler: str, cfg_scale: float, width: int, height: int, batch_count: int, batch_size: int, seed_mode: str, reference_image_path: str, resize_mode: str, strength: float, request: gr.Request):
+    diffuser_key: diffuser_pool.Key | None = diffuser_pool.get_active_key()
+    if diffuser_key is None:
         raise gr.Error(visible=False, print_exception=False)
 
-    yield None
     try:
-        images: list[Image.Image] = shared.diffuser["ref"].generate_image(  # type: ignore
-            prompt=positive_prompt,
-            negative_prompt=negative_prompt,
-            clip_skip=clip_skip,
-            cfg_scale=cfg_scale,
-            min_cfg=0.0,
-            init_image=reference_image,
-            width=width,
-            height=height,
-            sample_method=sampler,
-            sample_steps=steps,
-            seed=seed,
-        )
-        image: Image.Image = images[0]
-        im_backend.save_image(image)
-        yield image
-    except:
-        gr.Warning(constants.WARNING_GENERIC)
-        yield None
+        prepared_image: reference_image.PreparedImage = reference_image.prepare(reference_image_path, width, height, resize_mode)
+    except OSError:
+        raise gr.Error("The reference image could not be read.", print_exception=False)
+    if prepared_image.resampled:
+        gr.Info(f"The reference image was resampled from {prepared_image.source_size[0]}x{prepared_image.source_size[1]} to fit {width}x{height}.")
 
+    generation_request: generation.Request = generation.Request(
+        diffuser_key=diffuser_key,
+        clip_skip=clip_skip,
+        positive_prompt=positive_prompt,
+        negative_prompt=negative_prompt,
+        seed=seed,
+        steps=steps,
+        sampler=sampler,
+        cfg_scale=cfg_scale,
+        width=width,
+        height=height,
+        reference_image=prepared_image.image,
+        strength=strength,
+        batch_size=batch_size,
+    )
+    yield from generation_runner.stream_batch(generation_request, batch_count, seed_mode, request.session_hash or "")
 
-def on_generate_button_click(image: Image.Image | None, is_diffuser_busy: bool):
-    if image is None:
-        raise gr.Error("You must provide a reference image.", print_exception=False)
 
-    if is_diffuser_busy:
-        raise gr.Error(visible=False, print_exception=False)
+def on_generate_button_click(reference_image_path: str | None):
+    if reference_image_path is None:
+        raise gr.Error("You must provide a reference image.", print_exception=False)
@@ -1,40 +1,103 @@
+from typing import Any
+
 import gradio as gr
-from PIL import Image
 
 from modules.core import constants
-from modules.core import shared
-from modules import im_backend
+from modules import diffuser_pool
+from modules import generation
+from modules import job_queue
+from modules import job_journal
+from modules import memory_planner
+from modules import sweep
+from modules import output_store
+from modules.ui import generation_runner
 
 
-def text_to_image(clip_skip: int, positive_prompt: str, negative_prompt: str, seed: int, steps: int, sampler: str, cfg_scale: float, width: int, height: int):
-    if not im_backend.is_diffuser_loaded():
+def text_to_image(clip_skip: int, positive_prompt: str, negative_prompt: str, seed: int, steps: int, sampler: str, cfg_scale: float, width: int, height: int, batch_count: int, batch_size: int, seed_mode: str, use_hires: bool, hires_scale: float, hires_tile_size: int, hires_tile_overlap: int, hires_strength: float, request: gr.Request):
+    diffuser_key: diffuser_pool.Key | None = diffuser_pool.get_active_key()
+    if diffuser_key is None:
         raise gr.Error(visible=False, print_exception=False)
 
-    yield None
-    try:
-        images: list[Image.Image] = shared.diffuser["ref"].generate_image(  # type: ignore
-            prompt=positive_prompt,
-            negative_prompt=negative_prompt,
-            clip_skip=clip_skip,
-            cfg_scale=cfg_scale,
-            min_cfg=0.0,
-            width=width,
-            height=height,
-            sample_method=sampler,
-            sample_steps=steps,
-            seed=seed,
-        )
-        image: Image.Image = images[0]
-        im_backend.save_image(image)
-        yield image
-    except:
-        gr.Warning(constants.WARNING_GENERIC)
-        yield None
-
-
-def on_generate_button_click(positive_prompt: str, is_diffuser_busy: bool):
+    generation_request: generation.Request = generation.Request(
+        diffuser_key=diffuser_key,
+        clip_skip=clip_skip,
+        positive_prompt=positive_prompt,
+        negative_prompt=negative_prompt,
+        seed=seed,
+        steps=steps,
+        sampler=sampler,
+        cfg_scale=cfg_scale,
+        width=width,
+        height=height,
+        hires=generation.HiresOptions(hires_scale, hires_tile_size, hires_tile_overlap, hires_strength) if use_hires else None,
+        batch_size=batch_size,
+    )
+    yield from generation_runner.stream_batch(generation_request, batch_count, seed_mode, request.session_hash or "")
+
+
+def generate_variations(clip_skip: int, positive_prompt: str, negative_prompt: str, seed: int, steps: int, sampler: str, cfg_scale: float, width: int, height: int, variation_count: int, request: gr.Request):
+    diffuser_key: diffuser_pool.Key | None = diffuser_pool.get_active_key()
+    if diffuser_key is None:
+        raise gr.Error(visible=False, print_exception=False)
+
+    generation_request: generation.Request = generation.Request(
+        diffuser_key=diffuser_key,
+        clip_skip=clip_skip,
+        positive_prompt=positive_prompt,
+        negative_prompt=negative_prompt,
+        seed=seed,
+        steps=steps,
+        sampler=sampler,
+        cfg_scale=cfg_scale,
+        width=width,
+        height=height,
+    )
+    # Variations share backend calls, so the model, the prompt conditioning and the sigma schedule are set up once
+    # per call and only the initial noise differs between images; the planner caps a call at what fits in memory.
+    yield from generation_runner.stream_batch(generation_request, min(variation_count, constants.MAX_VARIATIONS), "increment", request.session_hash or "", coalesce=True)
+
+
+def on_generate_button_click(positive_prompt: str):
     if positive_prompt.rstrip() == "":
         raise gr.Error("You must specify a positive prompt.", print_exception=False)
 
-    if is_diffuser_busy:
+
+def run_sweep(clip_skip: int, positive_prompt: str, negative_prompt: str, seed: int, steps: int, sampler: str, cfg_scale: float, width: int, height: int, seeds: str, steps_values: str, cfg_scales: str, samplers: str, clip_skips: str, sizes: str, request: gr.Request):
+    diffuser_key: diffuser_pool.Key | None = diffuser_pool.get_active_key()
+    if diffuser_key is None:
         raise gr.Error(visible=False, print_exception=False)
+
+    axes: dict[str, list[Any]] = {}
+    try:
+        for axis, text in zip(("seed", "steps", "cfg_scale", "sampler", "clip_skip", "size"), (seeds, steps_values, cfg_scales, samplers, clip_skips, sizes)):
+            axes[axis] = sweep.parse_values(axis, text)
+        sweep.validate(axes)
+    except ValueError as exception:
+        raise gr.Error(str(exception), print_exception=False)
+    cell_count: int = sweep.get_cell_count(axes)
+
+    generation_request: generation.Request = generation.Request(
+        diffuser_key=diffuser_key,
+        clip_skip=clip_skip,
+        positive_prompt=positive_prompt,
+        negative_prompt=negative_prompt,
+        seed=generation.resolve_seeds(seed, 1, 1, "increment")[0],
+        steps=steps,
+        sampler=sampler,
+        cfg_scale=cfg_scale,
+        width=width,
+        height=height,
+    )
+    job: job_queue.Job = job_journal.submit(generation_request, owner=request.session_hash or "", sweep_axes=axes)
+    # Like other journaled jobs, a sweep keeps running if the page is closed, and can be retrieved by its ID.
+    for status in job_queue.stream(job, cancel_on_close=False):
+        yield gr.update(), f"Sweep of {cell_count} cell(s): {status} Job ID: `{job.id}`."
+
+    if job.status == "failed":
+        gr.Warning(str(job.exception) if isinstance(job.exception, memory_planner.InsufficientMemoryError) else constants.WARNING_GENERIC)
+    if job.status != "done":
+        yield gr.update(), job_queue.format_status(job)
+        return
+    grid, cells = job.result
+    total_time: float = sum(cell["seconds"] for cell in cells)
+    yield [(output_store.get_path(grid) or grid, "Grid")] + [(output_store.get_path(cell["image"]) or cell["image"], sweep.format_cell(cell, axes)) for cell in cells], f"Swept {len(cells)} cell(s) in {total_time:.2f}s ({total_time / len(cells):.2f}s per cell)."
@@ -0,0 +1,388 @@
+from typing import Any, Callable
+import os
+import time
+import uuid
+import queue
+import signal
+import atexit
+import inspect
+import weakref
+import itertools
+import threading
+import multiprocessing
+import multiprocessing.connection
+import multiprocessing.shared_memory
+
+from PIL import Image
+
+from modules.core import constants
+from modules import settings
+from modules import memory_info
+
+
+class WorkerCrashedError(RuntimeError):
+    pass
+
+
+# Stands in for `stable_diffusion_cpp` when worker processes are enabled: every worker process loads its own copy
+# of the model, and each generation runs on whichever worker is idle.
+class StableDiffusion:
+    def __init__(self, **kwargs: Any) -> None:
+        self.model_id: int
+        # The load happens in the workers, so this process's memory says nothing about it; each worker measures its own.
+        self.peak_rss: int
+        self.model_id, self.peak_rss = load(kwargs)
+        weakref.finalize(self, unload, self.model_id)
+
+    def generate_image(self, progress_callback: Callable[[int, int, float], None] | None = None, preview_callback: Callable[[int, list[Image.Image], bool], None] | None = None, **kwargs: Any) -> list[Image.Image]:
+        return generate(self.model_id, kwargs, progress_callback, preview_callback)
+
+
+# Workers fork from a fork server, so each restart skips re-importing the interpreter state; a plain fork is unsafe
+# once threads and CUDA are up. Windows only has spawn.
+__context: Any = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+__workers: list[dict[str, Any]] = []
+__started: bool = False
+__worker_count: int | None = None
+__models: dict[int, dict[str, Any]] = {}
+__requests: dict[str, queue.Queue[tuple[str, Any]]] = {}
+__request_workers: dict[str, dict[str, Any]] = {}
+__model_ids: Any = itertools.count()
+__condition: threading.Condition = threading.Condition()
+
+
+def configure() -> None:
+    global __worker_count
+
+    # The count is fixed for the whole run: the backend choice, the process count and the job queue's dispatch
+    # threads must all agree, and in-process models must never see more than one generation at a time.
+    with __condition:
+        if __worker_count is None:
+            __worker_count = max(settings.get_key("workers/count", constants.DEFAULT_SETTINGS["workers"]["count"]), 0)
+
+
+def is_enabled() -> bool:
+    return get_worker_count() > 0
+
+
+def is_started() -> bool:
+    with __condition:
+        return __started
+
+
+def get_worker_count() -> int:
+    configure()
+    assert __worker_count is not None
+    return __worker_count
+
+
+def get_cpu_share() -> int:
+    # Splitting the cores keeps N concurrent generations from oversubscribing the CPU; in-process, one generation gets them all.
+    return max(len(__get_cpus()) // max(get_worker_count(), 1), 1)
+
+
+def load(kwargs: dict[str, Any]) -> tuple[int, int]:
+    __start()
+    model_id: int = next(__model_ids)
+    with __condition:
+        __models[model_id] = kwargs
+        waiters: list[tuple[str, queue.Queue[tuple[str, Any]]]] = []
+        for worker in __workers:
+            request_id: str = __send(worker, ("load", model_id, kwargs))
+            __requests[request_id] = queue.Queue()
+            waiters.append((request_id, __requests[request_id]))
+
+    # Every worker loads in parallel; the model is only usable once all of them have it.
+    errors: list[str] = []
+    peak_rss: int = 0
+    for waiter_request_id, messages in waiters:
+        kind, payload = messages.get()
+        with __condition:
+            __requests.pop(waiter_request_id, None)
+        if kind != "done":
+            errors.append(str(payload))
+        else:
+            peak_rss = max(peak_rss, payload)
+    if len(errors) > 0:
+        unload(model_id)
+        raise RuntimeError(f"Loading in the worker processes failed: {errors[0]}")
+    return model_id, peak_rss
+
+
+def unload(model_id: int) -> None:
+    with __condition:
+        if __models.pop(model_id, None) is None:
+            return
+        for worker in __workers:
+            __try_send(worker, ("unload", None, model_id, None))
+
+
+def generate(model_id: int, kwargs: dict[str, Any], progress_callback: Callable[[int, int, float], None] | None, preview_callback: Callable[[int, list[Image.Image], bool], None] | None) -> list[Image.Image]:
+    kwargs = dict(kwargs)
+    kwargs["send_previews"] = preview_callback is not None
+
+    with __condition:
+        while True:
+            # A worker that died since the last health check is replaced here rather than handed a job it would fail.
+            for dead_worker in __workers:
+                if dead_worker["generating"] is None and not dead_worker["process"].is_alive():
+                    __restart(dead_worker, f"Worker {dead_worker['index']} exited with code {dead_worker['process'].exitcode}.")
+            worker: dict[str, Any] | None = next((worker for worker in __workers if worker["generating"] is None), None)
+            if worker is not None:
+                break
+            __condition.wait()
+        request_id: str = __send(worker, ("generate", model_id, kwargs))
+        messages: queue.Queue[tuple[str, Any]] = queue.Queue()
+        __requests[request_id] = messages
+        worker["generating"] = request_id
+
+    # Callbacks run on the calling thread, so they still see the job that thread is working on.
+    try:
+        while True:
+            kind, payload = messages.get()
+            if kind == "progress":
+                if progress_callback is not None:
+                    progress_callback(*payload)
+            elif kind == "preview":
+                if preview_callback is not None:
+                    preview_callback(payload[0], [Image.frombytes(*payload[1:])], True)
+            elif kind == "done":
+                return __read_shared_images(payload)
+            elif kind == "crash":
+                raise WorkerCrashedError(payload)
+            else:
+                raise RuntimeError(payload)
+    finally:
+        with __condition:
+            __requests.pop(request_id, None)
+            if worker["generating"] == request_id:
+                worker["generating"] = None
+            __condition.notify_all()
+
+
+def shutdown() -> None:
+    with __condition:
+        workers: list[dict[str, Any]] = list(__workers)
+        __workers.clear()
+        for worker in workers:
+            __try_send(worker, ("stop", None, None, None))
+    for worker in workers:
+        worker["process"].join(constants.WORKER_STOP_TIMEOUT)
+        if worker["process"].is_alive():
+            worker["process"].kill()
+        worker["connection"].close()
+
+
+def __start() -> None:
+    global __started
+
+    with __condition:
+        if __started:
+            return
+        __started = True
+        for index in range(get_worker_count()):
+            worker: dict[str, Any] = {"index": index}
+            __spawn(worker)
+            __workers.append(worker)
+    threading.Thread(target=__listen, name="worker-pool-listener", daemon=True).start()
+    threading.Thread(target=__monitor, name="worker-pool-monitor", daemon=True).start()
+    atexit.register(shutdown)
+    print(f"Started {len(__workers)} worker process(es).")
+
+
+def __get_cpus() -> list[int]:
+    return sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+
+
+def __spawn(worker: dict[str, Any]) -> None:
+    cpus: list[int] = __get_cpus()
+    share: int = get_cpu_share()
+    worker_cpus: list[int] | None = None
+    if settings.get_key("workers/cpu_affinity", constants.DEFAULT_SETTINGS["workers"]["cpu_affinity"]) and hasattr(os, "sched_setaffinity"):
+        worker_cpus = cpus[worker["index"] * share:(worker["index"] + 1) * share] or cpus
+
+    threads_per_worker: int = settings.get_key("workers/threads_per_worker", constants.DEFAULT_SETTINGS["workers"]["threads_per_worker"])
+    if threads_per_worker <= 0:
+        threads_per_worker = share
+
+    # A pipe per worker, unlike a shared queue, reports a crashed worker right away as end-of-file.
+    connection, worker_connection = __context.Pipe()
+    worker["connection"] = connection
+    worker["process"] = __context.Process(
+        target=__run_worker,
+        args=(worker_connection, threads_per_worker, worker_cpus),
+        name=f"cudiffusion-worker-{worker['index']}",
+        daemon=True,
+    )
+    worker["process"].start()
+    worker_connection.close()
+    worker["generating"] = None
+    worker["pending"] = 0
+    worker["ping_time"] = None
+
+
+def __send(worker: dict[str, Any], task: tuple[str, Any, Any]) -> str:
+    request_id: str = uuid.uuid4().hex
+    __request_workers[request_id] = worker
+    worker["pending"] += 1
+    __try_send(worker, (task[0], request_id, task[1], task[2]))
+    return request_id
+
+
+def __try_send(worker: dict[str, Any], message: tuple[Any, ...]) -> None:
+    # A dead worker's pipe is closed; the listener notices and restarts it, failing whatever was sent.
+    try:
+        worker["connection"].send(message)
+    except (OSError, ValueError):
+        pass
+
+
+def __listen() -> None:
+    while True:
+        with __condition:
+            connections: dict[Any, dict[str, Any]] = {worker["connection"]: worker for worker in __workers}
+        if len(connections) == 0:
+            return
+
+        for connection in multiprocessing.connection.wait(list(connections), constants.WORKER_HEALTH_CHECK_INTERVAL):
+            worker: dict[str, Any] = connections[connection]
+            try:
+                request_id, kind, payload = connection.recv()
+            except (EOFError, OSError):
+                with __condition:
+                    # Workers stopped by shutdown() or already replaced are not restarted.
+                    if worker in __workers and worker["connection"] is connection:
+                        worker["process"].join(constants.WORKER_STOP_TIMEOUT)
+                        __restart(worker, f"Worker {worker['index']} exited with code {worker['process'].exitcode}.")
+                continue
+            __dispatch(worker, request_id, kind, payload)
+
+
+def __dispatch(worker: dict[str, Any], request_id: str | None, kind: str, payload: Any) -> None:
+    with __condition:
+        if kind == "pong":
+            worker["ping_time"] = None
+            return
+        if kind in ("done", "error") and __request_workers.pop(request_id or "", None) is not None:
+            worker["pending"] -= 1
+        messages: queue.Queue[tuple[str, Any]] | None = __requests.get(request_id or "")
+    if messages is not None:
+        messages.put((kind, payload))
+    elif kind == "done" and isinstance(payload, tuple):
+        # The waiter is gone, so nobody else will release the result's shared memory. Loads only report a peak RSS.
+        __read_shared_images(payload)
+    elif kind == "error":
+        print(f"Worker {worker['index']} task failed: {payload}")
+
+
+def __monitor() -> None:
+    while True:
+        time.sleep(constants.WORKER_HEALTH_CHECK_INTERVAL)
+        with __condition:
+            if len(__workers) == 0:
+                return
+            for worker in __workers:
+                if worker["ping_time"] is not None and time.perf_counter() - worker["ping_time"] > constants.WORKER_PING_TIMEOUT:
+                    worker["process"].kill()
+                    worker["process"].join()
+                    __restart(worker, f"Worker {worker['index']} stopped responding.")
+                elif worker["ping_time"] is None and worker["pending"] == 0:
+                    # Only idle workers are pinged; a busy one is stuck in native code and cannot answer until it is done.
+                    worker["ping_time"] = time.perf_counter()
+                    __try_send(worker, ("ping", None, None, None))
+
+
+def __restart(worker: dict[str, Any], reason: str) -> None:
+    print(f"{reason} Restarting it.")
+    for request_id, request_worker in list(__request_workers.items()):
+        if request_worker is worker:
+            del __request_workers[request_id]
+            messages: queue.Queue[tuple[str, Any]] | None = __requests.get(request_id)
+            if messages is not None:
+                messages.put(("crash", reason))
+
+    worker["connection"].close()
+    __spawn(worker)
+    # The replacement reloads every model the pool holds, so existing proxies stay valid.
+    for model_id, kwargs in __models.items():
+        __send(worker, ("load", model_id, kwargs))
+    __condition.notify_all()
+
+
+def __read_shared_images(payload: tuple[str, list[tuple[str, int, int, int, int]]]) -> list[Image.Image]:
+    name, layouts = payload
+    shared_memory: multiprocessing.shared_memory.SharedMemory = multiprocessing.shared_memory.SharedMemory(name=name)
+    try:
+        images: list[Image.Image] = []
+        for mode, width, height, offset, size in layouts:
+            # Decoding straight from a view of the block copies the pixels once, into the image, instead of through an intermediate bytes object.
+            with shared_memory.buf[offset:offset + size] as buffer:
+                images.append(Image.frombytes(mode, (width, height), buffer))
+        return images
+    finally:
+        shared_memory.close()
+        shared_memory.unlink()
+
+
+def __write_shared_images(images: list[Image.Image]) -> tuple[str, list[tuple[str, int, int, int, int]]]:
+    images = [image if image.mode in ("L", "RGB", "RGBA") else image.convert("RGB") for image in images]
+    sizes: list[int] = [image.width * image.height * len(image.getbands()) for image in images]
+    shared_memory: multiprocessing.shared_memory.SharedMemory = multiprocessing.shared_memory.SharedMemory(create=True, size=max(sum(sizes), 1))
+    layouts: list[tuple[str, int, int, int, int]] = []
+    offset: int = 0
+    # Images are serialized one at a time, so at most one extra copy of the pixels exists alongside the block.
+    for image, size in zip(images, sizes):
+        shared_memory.buf[offset:offset + size] = image.tobytes()
+        layouts.append((image.mode, image.width, image.height, offset, size))
+        offset += size
+    # The parent unlinks the block once it has copied the pixels out.
+    shared_memory.close()
+    return shared_memory.name, layouts
+
+
+def __run_worker(connection: Any, threads_per_worker: int, cpus: list[int] | None) -> None:
+    from modules import diffuser_pool
+
+    # Ctrl+C and service stops signal the whole process group; workers leave when the parent stops them
+    # or closes the pipe instead, so they never die mid-shutdown and get restarted.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    backend: Any = diffuser_pool.get_native_backend()
+    diffusers: dict[int, Any] = {}
+    while True:
+        try:
+            kind, request_id, model_id, kwargs = connection.recv()
+        except EOFError:
+            return
+        if kind == "stop":
+            return
+        if kind == "ping":
+            connection.send((None, "pong", None))
+            continue
+        if kind == "unload":
+            diffusers.pop(model_id, None)
+            continue
+
+        try:
+            if kind == "load":
+                kwargs = dict(kwargs)
+                if kwargs.get("n_threads", -1) <= 0:
+                    kwargs["n_threads"] = threads_per_worker
+                # A worker runs one task at a time, so resetting its high-water mark cannot disturb another measurement.
+                memory_info.reset_peak_rss()
+                diffusers[model_id] = backend.StableDiffusion(**kwargs)
+                connection.send((request_id, "done", memory_info.get_peak_rss()))
+            else:
+                diffuser: Any = diffusers[model_id]
+                kwargs["progress_callback"] = lambda step, steps, step_time: connection.send((request_id, "progress", (step, steps, step_time)))
+                if kwargs.pop("send_previews") and "preview_callback" in inspect.signature(diffuser.generate_image).parameters:
+                    kwargs["preview_callback"] = lambda step, frames, is_noisy: connection.send((request_id, "preview", (step, frames[0].mode, frames[0].size, frames[0].tobytes()))) if len(frames) > 0 else None
+                else:
+                    kwargs.pop("preview_method", None)
+                    kwargs.pop("preview_interval", None)
+                images: list[Image.Image] = diffuser.generate_image(**kwargs)
+                connection.send((request_id, "done", __write_shared_images(images)))
+        except Exception as exception:
+            connection.send((request_id, "error", f"{type(exception).__name__}: {exception}"))
@@ -0,0 +1,57 @@
+from typing import Any, Iterator
+import os
+import sys
+import sqlite3
+import collections
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["CUDIFFUSION_MOCK_BACKEND"] = "1"
+
+from modules.core import constants
+from modules import settings
+from modules import image_writer
+from modules import diffuser_pool
+from modules import job_journal
+from modules import model_catalog
+from modules import output_store
+from modules import result_cache
+from modules import worker_pool
+
+
+def get_private(module: Any, name: str) -> Any:
+    # Module-level "__name" globals are not name-mangled, but they are only reachable through the module's namespace.
+    return vars(module)[f"__{name}"]
+
+
+def set_private(monkeypatch: pytest.MonkeyPatch, module: Any, name: str, value: Any) -> None:
+    monkeypatch.setitem(vars(module), f"__{name}", value)
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path: Any, monkeypatch: pytest.MonkeyPatch) -> Iterator[Any]:
+    # Every path the app uses is relative to the working directory, so each test gets a fresh one.
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(constants.IMAGE_MODEL_DIR_PATH, exist_ok=True)
+    for module in (job_journal, output_store):
+        set_private(monkeypatch, module, "connection", None)
+    set_private(monkeypatch, model_catalog, "entries", None)
+    # A model left loaded by another test would count against this test's memory plan.
+    set_private(monkeypatch, diffuser_pool, "entries", collections.OrderedDict())
+    set_private(monkeypatch, diffuser_pool, "active_key", None)
+    # Cached images from another test would point at output files in that test's directory.
+    set_private(monkeypatch, result_cache, "memory_entries", collections.OrderedDict())
+    set_private(monkeypatch, result_cache, "memory_size", 0)
+    set_private(monkeypatch, result_cache, "disk_size", None)
+    set_private(monkeypatch, worker_pool, "worker_count", None)
+    settings.load()
+    yield tmp_path
+
+    # Pending writes must land in this test's directory, not in whatever directory is current at exit.
+    image_writer.flush()
+    settings.flush()
+    for module in (job_journal, output_store):
+        connection: sqlite3.Connection | None = get_private(module, "connection")
+        if connection is not None:
+            connection.close()
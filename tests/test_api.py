@@ -0,0 +1,126 @@
+from typing import Any
+import io
+import json
+import time
+import base64
+
+import fastapi
+import fastapi.testclient
+import pytest
+from PIL import Image
+
+from modules.core import constants
+from modules import api
+
+
+MODEL: str = "model.safetensors"
+
+
+@pytest.fixture
+def client() -> fastapi.testclient.TestClient:
+    # The mock backend accepts any file, so an empty model is enough to load.
+    with open(f"{constants.IMAGE_MODEL_DIR_PATH}{MODEL}", "wb"):
+        pass
+    app: fastapi.FastAPI = fastapi.FastAPI()
+    app.include_router(api.router)
+    app.include_router(api.metrics_router)
+    return fastapi.testclient.TestClient(app)
+
+
+def create_payload(**changes: Any) -> dict[str, Any]:
+    payload: dict[str, Any] = {"prompt": "a cat", "model": MODEL, "seed": 3, "steps": 2, "width": 64, "height": 64}
+    payload.update(changes)
+    return payload
+
+
+def encode_png(image: Image.Image) -> bytes:
+    buffer: io.BytesIO = io.BytesIO()
+    image.save(buffer, format="png")
+    return buffer.getvalue()
+
+
+def decode_image(text: str) -> Image.Image:
+    return Image.open(io.BytesIO(base64.b64decode(text)))
+
+
+def test_txt2img_returns_images(client: fastapi.testclient.TestClient) -> None:
+    response: Any = client.post("/api/v1/txt2img", json=create_payload(batch_size=2))
+    assert response.status_code == 200
+    content: dict[str, Any] = response.json()
+    assert content["status"] == "done"
+    assert content["seed"] == 3
+    assert [decode_image(image).size for image in content["images"]] == [(64, 64), (64, 64)]
+
+
+@pytest.mark.parametrize("changes, status_code", [
+    ({"sampler": "eulr"}, 422),
+    ({"steps": 0}, 422),
+    ({"width": 100}, 422),
+    ({"prompt": ""}, 422),
+    ({"model": "missing.gguf"}, 404),
+])
+def test_txt2img_rejects_invalid_requests(client: fastapi.testclient.TestClient, changes: dict[str, Any], status_code: int) -> None:
+    assert client.post("/api/v1/txt2img", json=create_payload(**changes)).status_code == status_code
+
+
+def test_img2img_accepts_base64(client: fastapi.testclient.TestClient) -> None:
+    init_image: str = base64.b64encode(encode_png(Image.new("RGB", (128, 128), "red"))).decode("ascii")
+    response: Any = client.post("/api/v1/img2img", json=create_payload(init_image=f"data:image/png;base64,{init_image}"))
+    assert response.status_code == 200
+    content: dict[str, Any] = response.json()
+    assert content["status"] == "done"
+    assert content["resampled"]
+    assert decode_image(content["images"][0]).size == (64, 64)
+
+
+def test_img2img_accepts_multipart(client: fastapi.testclient.TestClient) -> None:
+    response: Any = client.post(
+        "/api/v1/img2img",
+        data={"payload": json.dumps(create_payload())},
+        files={"init_image": ("init.png", encode_png(Image.new("RGB", (64, 64), "blue")), "image/png")},
+    )
+    assert response.status_code == 200
+    content: dict[str, Any] = response.json()
+    assert content["status"] == "done"
+    assert not content["resampled"]
+
+
+@pytest.mark.parametrize("changes, status_code", [
+    ({}, 400),
+    ({"init_image": "not base64!"}, 400),
+    ({"init_image": base64.b64encode(b"not an image").decode("ascii")}, 400),
+    ({"init_image": "", "sampler": "eulr"}, 422),
+])
+def test_img2img_rejects_invalid_images(client: fastapi.testclient.TestClient, changes: dict[str, Any], status_code: int) -> None:
+    assert client.post("/api/v1/img2img", json=create_payload(**changes)).status_code == status_code
+
+
+def test_async_job_is_polled_until_done(client: fastapi.testclient.TestClient) -> None:
+    response: Any = client.post("/api/v1/txt2img", json=create_payload(mode="async", steps=20))
+    assert response.status_code == 202
+    job_id: str = response.json()["job_id"]
+
+    deadline: float = time.perf_counter() + 10.0
+    while response.status_code == 202 and time.perf_counter() < deadline:
+        time.sleep(0.05)
+        response = client.get(f"/api/v1/jobs/{job_id}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "done"
+    assert len(response.json()["images"]) == 1
+    assert client.get("/api/v1/jobs/unknown").status_code == 404
+
+
+def test_image_endpoint_serves_saved_files(client: fastapi.testclient.TestClient) -> None:
+    job_id: str = client.post("/api/v1/txt2img", json=create_payload(batch_size=2)).json()["job_id"]
+    response: Any = client.get(f"/api/v1/jobs/{job_id}/images/1")
+    assert response.status_code == 200
+    assert Image.open(io.BytesIO(response.content)).size == (64, 64)
+    assert client.get(f"/api/v1/jobs/{job_id}/images/2").status_code == 404
+    assert client.get("/api/v1/jobs/unknown/images/0").status_code == 404
+
+
+def test_metrics_count_generated_images(client: fastapi.testclient.TestClient) -> None:
+    client.post("/api/v1/txt2img", json=create_payload())
+    response: Any = client.get("/metrics")
+    assert response.status_code == 200
+    assert "cudiffusion_images_generated_total{" in response.text
@@ -0,0 +1,98 @@
+import os
+import sys
+import argparse
+import subprocess
+
+from modules.core import constants
+from modules import benchmark
+
+
+BENCHMARK_PATH: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmark.py")
+
+
+def create_arguments(**changes) -> argparse.Namespace:
+    arguments: dict = {
+        "model": "model.gguf",
+        "samplers": ["euler", "lcm"],
+        "schedulers": ["default"],
+        "steps": [2],
+        "resolutions": [(64, 64)],
+        "vae_tiling": [False],
+        "rng_type": "default",
+        "threads": -1,
+        "prompt": "a cat",
+        "cfg_scale": 7.0,
+        "seed": 1,
+        "warmup": 1,
+        "repeats": 2,
+        "output": None,
+        "baseline": None,
+        "tolerance": 0.1,
+    }
+    arguments.update(changes)
+    return argparse.Namespace(**arguments)
+
+
+def create_result(**changes) -> dict:
+    result: dict = {
+        "model": "model.gguf",
+        "sampler": "euler",
+        "scheduler": "default",
+        "steps": 2,
+        "width": 64,
+        "height": 64,
+        "use_vae_tiling": False,
+        "load_time": 0.5,
+        "step_time": 0.1,
+        "latency": 1.0,
+        "peak_rss": 100.0,
+        "images_per_second": 1.0,
+    }
+    result.update(changes)
+    return result
+
+
+def test_run_records_every_cell_on_the_mock_backend() -> None:
+    with open(f"{constants.IMAGE_MODEL_DIR_PATH}model.gguf", "wb"):
+        pass
+    assert benchmark.run(create_arguments(output="results/run.csv")) == 0
+
+    results: list[dict] = benchmark.load_results("results/run.csv")
+    assert [result["sampler"] for result in results] == ["euler", "lcm"]
+    for result in results:
+        assert (result["width"], result["height"], result["steps"]) == (64, 64, 2)
+        assert result["latency"] > 0.0 and result["step_time"] > 0.0
+        assert result["peak_rss"] > 0.0
+
+    # Against a baseline that is far faster, every cell is a regression.
+    benchmark.save_results("results/baseline.json", [dict(result, latency=result["latency"] / 100.0) for result in results])
+    assert benchmark.run(create_arguments(baseline="results/baseline.json")) == 1
+
+
+def test_results_round_trip_through_csv_and_json() -> None:
+    results: list[dict] = [create_result(), create_result(sampler="lcm", use_vae_tiling=True)]
+    for path in ("results.csv", "results.json"):
+        benchmark.save_results(path, results)
+        assert benchmark.load_results(path) == results
+
+
+def test_compare_reports_slowdowns_beyond_the_tolerance() -> None:
+    baseline: list[dict] = [create_result(), create_result(sampler="lcm")]
+    assert benchmark.compare(baseline, [create_result(latency=1.05)], 0.1) == []
+    regressions: list[str] = benchmark.compare(baseline, [create_result(latency=1.2, step_time=0.2), create_result(sampler="lcm", latency=0.5)], 0.1)
+    assert len(regressions) == 2
+    assert "sampler=euler" in regressions[0] and "latency 1.000s -> 1.200s (+20.0%)" in regressions[0]
+    assert "step_time" in regressions[1]
+    # Configurations missing from the baseline are new, not regressions.
+    assert benchmark.compare(baseline, [create_result(steps=20, latency=9.0)], 0.1) == []
+
+
+def test_command_line_runs_against_the_mock_backend() -> None:
+    with open(f"{constants.IMAGE_MODEL_DIR_PATH}model.gguf", "wb"):
+        pass
+    command: list[str] = [
+        sys.executable, BENCHMARK_PATH, "model.gguf", "--mock",
+        "--steps", "2", "--resolutions", "64x64", "--vae-tiling", "off", "--warmup", "0", "--repeats", "1", "--output", "run.json",
+    ]
+    assert subprocess.run(command, capture_output=True, timeout=60).returncode == 0
+    assert [(result["sampler"], result["use_vae_tiling"]) for result in benchmark.load_results("run.json")] == [("euler", False)]
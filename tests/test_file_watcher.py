@@ -0,0 +1,41 @@
+import pytest
+
+from modules.core import constants
+from modules import settings
+from modules import file_watcher
+
+
+class StopWatching(BaseException):
+    pass
+
+
+def test_poll_reports_added_models_and_settings_changes(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setitem(vars(file_watcher), "__model_signatures", {})
+    version: int = file_watcher.get_version()
+    vars(file_watcher)["__poll"]()
+    assert file_watcher.get_version() == version
+
+    with open(f"{constants.IMAGE_MODEL_DIR_PATH}model.gguf", "wb"):
+        pass
+    vars(file_watcher)["__poll"]()
+    assert file_watcher.get_version() == version + 1
+
+    monkeypatch.setattr(settings, "reload_if_changed", lambda: True)
+    vars(file_watcher)["__poll"]()
+    assert file_watcher.get_version() == version + 2
+
+
+def test_failed_poll_keeps_watching(monkeypatch: pytest.MonkeyPatch) -> None:
+    polls: list[None] = []
+
+    def poll() -> None:
+        polls.append(None)
+        if len(polls) == 1:
+            raise RuntimeError("unexpected")
+        raise StopWatching()
+
+    monkeypatch.setattr(constants, "FILE_WATCH_INTERVAL", 0.0)
+    monkeypatch.setitem(vars(file_watcher), "__poll", poll)
+    with pytest.raises(StopWatching):
+        vars(file_watcher)["__watch"]()
+    assert len(polls) == 2
@@ -0,0 +1,85 @@
+import pytest
+from PIL import Image
+
+from modules.core import constants
+from modules import diffuser_pool
+from modules import generation
+from modules import memory_planner
+from modules import metrics
+from modules import settings
+from modules.ui import generation_runner
+
+
+def create_request(seed: int, batch_size: int = 1) -> generation.Request:
+    return generation.Request(
+        diffuser_key=diffuser_pool.Key("model.gguf", False, "default", "default"),
+        clip_skip=0,
+        positive_prompt="a cat",
+        negative_prompt="",
+        seed=seed,
+        steps=4,
+        sampler="euler",
+        cfg_scale=7.0,
+        width=64,
+        height=64,
+        batch_size=batch_size,
+        save_outputs=False,
+    )
+
+
+@pytest.fixture
+def generated_requests(monkeypatch: pytest.MonkeyPatch) -> list[generation.Request]:
+    requests: list[generation.Request] = []
+
+    def run(request: generation.Request, progress_callback=None) -> list[Image.Image]:
+        requests.append(request)
+        return [Image.new("RGB", (request.width, request.height)) for _ in range(request.batch_size)]
+
+    monkeypatch.setattr(generation, "run", run)
+    return requests
+
+
+def run_batch(*arguments, **keyword_arguments) -> tuple[list, str]:
+    *_, (gallery, status) = generation_runner.stream_batch(*arguments, owner="test", **keyword_arguments)
+    return gallery, status
+
+
+def test_coalesced_calls_are_capped_by_the_planner(generated_requests: list[generation.Request], monkeypatch: pytest.MonkeyPatch) -> None:
+    settings.set_key("generation/coalesce_seed_sweeps", True)
+    monkeypatch.setattr(memory_planner, "get_max_batch_size", lambda key, width, height, limit: min(limit, 3))
+    gallery, status = run_batch(create_request(10, 2), 4, "increment")
+    assert [(request.seed, request.batch_size) for request in generated_requests] == [(10, 3), (13, 3), (16, 2)]
+    assert [label for _, label in gallery] == [f"Seed {seed}" for seed in range(10, 18)]
+    assert "Seeds `10`-`17`" in status
+
+
+def test_variations_share_calls_without_caching_random_seeds(generated_requests: list[generation.Request], monkeypatch: pytest.MonkeyPatch) -> None:
+    # Variations merge their seeds even with merging turned off for batches.
+    settings.set_key("generation/coalesce_seed_sweeps", False)
+    monkeypatch.setattr(memory_planner, "get_max_batch_size", lambda key, width, height, limit: min(limit, 3))
+    gallery, status = run_batch(create_request(-1), 5, "increment", coalesce=True)
+    assert len(gallery) == 5
+    assert [request.batch_size for request in generated_requests] == [3, 2]
+    assert generated_requests[1].seed == generated_requests[0].seed + 3
+    assert f"Seeds `{generated_requests[0].seed}`-`{generated_requests[0].seed + 4}`" in status
+    assert not any(request.use_cache for request in generated_requests)
+
+
+def test_fixed_seeds_are_cacheable(generated_requests: list[generation.Request]) -> None:
+    settings.set_key("generation/coalesce_seed_sweeps", False)
+    run_batch(create_request(5), 2, "increment")
+    assert [(request.seed, request.use_cache) for request in generated_requests] == [(5, True), (6, True)]
+
+
+def test_batched_call_counts_saved_prompt_encodes() -> None:
+    with open(f"{constants.IMAGE_MODEL_DIR_PATH}model.gguf", "wb"):
+        pass
+    request: generation.Request = create_request(5, 3)
+    label_key: tuple[tuple[str, str], ...] = tuple(sorted(generation.get_metric_labels(request).items()))
+    series: dict = vars(metrics)["__series"]
+    encodes: float = series["cudiffusion_prompt_encodes_total"].get(label_key, 0.0)
+    saved_encodes: float = series["cudiffusion_prompt_encodes_saved_total"].get(label_key, 0.0)
+
+    assert len(generation.run(request)) == 3
+    assert series["cudiffusion_prompt_encodes_total"][label_key] - encodes == 1
+    assert series["cudiffusion_prompt_encodes_saved_total"][label_key] - saved_encodes == 2
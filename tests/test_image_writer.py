@@ -0,0 +1,48 @@
+import os
+
+import pytest
+from PIL import Image
+
+from modules import image_writer
+
+
+def test_submit_writes_file_and_resolves_path() -> None:
+    future = image_writer.submit(Image.new("RGB", (8, 8), "red"), "image", {"parameters": "a cat"}, image_format="png")
+    path: str | None = future.result(5)
+    assert path == "image.png"
+    with Image.open(path) as image:
+        assert image.size == (8, 8)
+        assert image.info["parameters"] == "a cat"
+
+
+def test_unwritable_path_resolves_to_none() -> None:
+    future = image_writer.submit(Image.new("RGB", (8, 8)), "missing/directory/image", {}, image_format="png")
+    assert future.result(5) is None
+
+
+def test_failing_callback_keeps_writer_threads_alive() -> None:
+    def fail(path: str) -> None:
+        raise RuntimeError("bookkeeping failed")
+
+    futures = [image_writer.submit(Image.new("RGB", (8, 8)), f"image_{index}", {}, fail, image_format="png") for index in range(4)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(5)
+
+    assert image_writer.submit(Image.new("RGB", (8, 8)), "after", {}, image_format="png").result(5) == "after.png"
+    assert all(worker is not None and worker.is_alive() for worker in vars(image_writer)["__workers"])
+
+
+def test_dead_writer_thread_is_replaced() -> None:
+    image_writer.submit(Image.new("RGB", (8, 8)), "first", {}, image_format="png").result(5)
+    workers: list = vars(image_writer)["__workers"]
+    # The shutdown sentinel makes one thread exit, as an unexpected error used to.
+    vars(image_writer)["__queue"].put(None)
+    image_writer.flush()
+    for worker in workers:
+        worker.join(0.1)
+    assert any(not worker.is_alive() for worker in workers)
+
+    assert image_writer.submit(Image.new("RGB", (8, 8)), "second", {}, image_format="png").result(5) == "second.png"
+    assert all(worker.is_alive() for worker in vars(image_writer)["__workers"])
+    assert os.path.exists("second.png")
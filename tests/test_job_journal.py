@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+from PIL import Image
+
+from modules import diffuser_pool
+from modules import generation
+from modules import image_writer
+from modules import job_journal
+from modules import job_queue
+
+
+def create_request(**changes) -> generation.Request:
+    fields: dict = {
+        "diffuser_key": diffuser_pool.Key("model.gguf", False, "default", "default"),
+        "clip_skip": 0,
+        "positive_prompt": "a cat",
+        "negative_prompt": "",
+        "seed": 7,
+        "steps": 4,
+        "sampler": "euler",
+        "cfg_scale": 7.0,
+        "width": 64,
+        "height": 64,
+        "save_outputs": False,
+    }
+    fields.update(changes)
+    return generation.Request(**fields)
+
+
+@pytest.fixture
+def generated_requests(monkeypatch: pytest.MonkeyPatch) -> list[generation.Request]:
+    requests: list[generation.Request] = []
+
+    def run(request: generation.Request, progress_callback=None) -> list[Image.Image]:
+        requests.append(request)
+        return [Image.new("RGB", (request.width, request.height), ((request.seed + index) % 256,) * 3) for index in range(request.batch_size)]
+
+    monkeypatch.setattr(generation, "run", run)
+    return requests
+
+
+def test_submitted_job_is_journaled_with_its_results(generated_requests: list[generation.Request]) -> None:
+    job: job_queue.Job = job_journal.submit(create_request(batch_size=2), owner="test")
+    assert job.wait(5)
+    assert job.status == "done"
+    # Results are stored from the writers' callbacks, after the job itself is done.
+    image_writer.flush()
+
+    entry: dict | None = job_journal.get(job.id)
+    assert entry is not None
+    assert entry["status"] == "done"
+    assert [path.rsplit("/", 1)[1] for path in entry["paths"]] == ["0.png", "1.png"]
+    with Image.open(entry["paths"][1]) as image:
+        assert image.getpixel((0, 0)) == (8, 8, 8)
+
+
+def test_recover_requeues_only_unfinished_jobs(generated_requests: list[generation.Request]) -> None:
+    done_job: job_queue.Job = job_journal.submit(create_request(seed=1), owner="test")
+    assert done_job.wait(5)
+    # A job left behind by a crash is still pending in the journal.
+    vars(job_journal)["__insert"]("crashed", create_request(seed=2), 0, "test", None)
+    generated_requests.clear()
+
+    assert job_journal.recover() == 1
+    job: job_queue.Job | None = job_queue.get_job("crashed")
+    assert job is not None
+    assert job.wait(5)
+    assert [request.seed for request in generated_requests] == [2]
+    assert job_journal.get("crashed")["status"] == "done"
+
+
+def test_cache_hits_are_journaled(generated_requests: list[generation.Request]) -> None:
+    job: job_queue.Job = job_journal.complete(create_request(), [Image.new("RGB", (64, 64))], owner="test")
+    assert job.is_done()
+    assert generated_requests == []
+    image_writer.flush()
+    entry: dict | None = job_journal.get(job.id)
+    assert entry is not None
+    assert entry["status"] == "done"
+    assert len(entry["paths"]) == 1
+
+
+def test_sweep_axes_survive_the_journal() -> None:
+    axes: dict = {"seed": [1, 2], "size": [(64, 64), (128, 64)], "sampler": ["euler"]}
+    text: str = vars(job_journal)["__serialize"](create_request(), axes)
+    request, restored_axes = vars(job_journal)["__deserialize"]("unused", text)
+    assert request == create_request()
+    assert restored_axes == axes
+
+
+def test_unknown_job_is_none() -> None:
+    assert job_journal.get("unknown") is None
+
+
+def test_results_are_stored_without_blocking_the_job(generated_requests: list[generation.Request], monkeypatch: pytest.MonkeyPatch) -> None:
+    release_writes: threading.Event = threading.Event()
+    write = vars(image_writer)["__write"]
+    monkeypatch.setitem(vars(image_writer), "__write", lambda *arguments: (release_writes.wait(5), write(*arguments))[1])
+
+    job: job_queue.Job = job_journal.submit(create_request(save_outputs=True), owner="test")
+    # The job finishes while its output is still being written, and its result follows once the file is on disk.
+    assert job.wait(5)
+    assert job_journal.get(job.id)["paths"] == []
+    release_writes.set()
+    image_writer.flush()
+    assert [path.rsplit("/", 1)[1] for path in job_journal.get(job.id)["paths"]] == ["0.png"]
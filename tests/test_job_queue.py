@@ -0,0 +1,129 @@
+import time
+import threading
+
+from modules import settings
+from modules import job_queue
+from modules import worker_pool
+
+
+def block_queue() -> threading.Event:
+    # Holds the single dispatch thread, so jobs submitted meanwhile stay pending.
+    release: threading.Event = threading.Event()
+    started: threading.Event = threading.Event()
+    job_queue.submit(lambda: (started.set(), release.wait(5)), kind="test")
+    assert started.wait(5)
+    return release
+
+
+def test_priority_ordering_runs_higher_priority_first() -> None:
+    settings.set_key("queue/ordering", "priority")
+    order: list[str] = []
+    release: threading.Event = block_queue()
+    jobs: list[job_queue.Job] = [
+        job_queue.submit(lambda name=name: order.append(name), kind="test", priority=priority)
+        for name, priority in (("low", 0), ("high", 5), ("middle", 1))
+    ]
+    release.set()
+    for job in jobs:
+        assert job.wait(5)
+    assert order == ["high", "middle", "low"]
+
+
+def test_fifo_ordering_ignores_priority() -> None:
+    settings.set_key("queue/ordering", "fifo")
+    order: list[str] = []
+    release: threading.Event = block_queue()
+    jobs: list[job_queue.Job] = [
+        job_queue.submit(lambda name=name: order.append(name), kind="test", priority=priority)
+        for name, priority in (("first", 0), ("second", 5))
+    ]
+    release.set()
+    for job in jobs:
+        assert job.wait(5)
+    assert order == ["first", "second"]
+
+
+def test_cancel_pending_job() -> None:
+    release: threading.Event = block_queue()
+    job: job_queue.Job = job_queue.submit(lambda: "never", kind="test")
+    assert job_queue.get_position(job) == 1
+    assert job_queue.cancel(job.id)
+    release.set()
+    assert job.wait(5)
+    assert job.status == "cancelled"
+    assert job.result is None
+    assert not job_queue.cancel(job.id)
+
+
+def test_failed_job_keeps_exception() -> None:
+    def fail() -> None:
+        raise ValueError("broken")
+
+    job: job_queue.Job = job_queue.submit(fail, kind="test")
+    assert job.wait(5)
+    assert job.status == "failed"
+    assert isinstance(job.exception, ValueError)
+
+
+def test_failing_listener_does_not_strand_waiters() -> None:
+    def fail(job: job_queue.Job) -> None:
+        raise RuntimeError("listener failed")
+
+    job_queue.add_listener(fail)
+    try:
+        job: job_queue.Job = job_queue.submit(lambda: "result", kind="test")
+        assert job.wait(5)
+        assert job.status == "done"
+        assert job.result == "result"
+
+        cached_job: job_queue.Job = job_queue.complete("cached", kind="test")
+        assert cached_job.is_done()
+    finally:
+        vars(job_queue)["__listeners"].remove(fail)
+
+
+def test_listeners_run_without_the_queue_lock() -> None:
+    lock_was_free: list[bool] = []
+
+    def listener(job: job_queue.Job) -> None:
+        if job.kind != "test-lock":
+            return
+        # Another thread must be able to use the queue while a listener does its (slow) work.
+        probe: threading.Thread = threading.Thread(target=job_queue.is_busy)
+        probe.start()
+        probe.join(2)
+        lock_was_free.append(not probe.is_alive())
+
+    job_queue.add_listener(listener)
+    try:
+        job: job_queue.Job = job_queue.submit(lambda: None, kind="test-lock")
+        assert job.wait(5)
+    finally:
+        vars(job_queue)["__listeners"].remove(listener)
+    assert lock_was_free == [True, True]
+
+
+def test_worker_count_is_fixed_at_startup() -> None:
+    # Models run in-process with 0 workers; raising the setting later must not add concurrent dispatch threads.
+    settings.set_key("workers/count", 0)
+    worker_pool.configure()
+    settings.set_key("workers/count", 2)
+    assert worker_pool.get_worker_count() == 0
+    assert not worker_pool.is_enabled()
+
+    running: list[int] = [0]
+    overlaps: list[int] = []
+    lock: threading.Lock = threading.Lock()
+
+    def generate() -> None:
+        with lock:
+            running[0] += 1
+            overlaps.append(running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    jobs: list[job_queue.Job] = [job_queue.submit(generate, kind="test") for _ in range(4)]
+    for job in jobs:
+        assert job.wait(5)
+    assert max(overlaps) == 1
@@ -0,0 +1,62 @@
+import pytest
+
+from modules import settings
+from modules import memory_info
+from modules import model_catalog
+from modules import memory_planner
+from modules import diffuser_pool
+from modules import worker_pool
+
+
+GIB: int = 1024 ** 3
+KEY: diffuser_pool.Key = diffuser_pool.Key("model.gguf", False, "default", "default")
+
+
+@pytest.fixture(autouse=True)
+def model(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(model_catalog, "get_info", lambda image_model: {"file_size": 2 * GIB, "architecture": "SD1.x"})
+    monkeypatch.setattr(memory_info, "get_available_video_memory", lambda: None)
+
+
+def set_worker_count(count: int) -> None:
+    # The count is normally read once at startup; the tests restart that read.
+    vars(worker_pool)["__worker_count"] = None
+    settings.set_key("workers/count", count)
+    worker_pool.configure()
+
+
+def test_estimate_scales_with_batch_size() -> None:
+    set_worker_count(0)
+    single: dict[str, int] = memory_planner.estimate(KEY, 512, 512)
+    weights: dict[str, int] = memory_planner.estimate(KEY, 0, 0)
+    batch: dict[str, int] = memory_planner.estimate(KEY, 512, 512, 4)
+    assert batch["device"] - weights["device"] == 4 * (single["device"] - weights["device"])
+
+
+def test_estimate_counts_a_copy_per_worker() -> None:
+    set_worker_count(0)
+    in_process: dict[str, int] = memory_planner.estimate(KEY, 512, 512)
+    set_worker_count(2)
+    assert memory_planner.estimate(KEY, 512, 512) == {location: size * 2 for location, size in in_process.items()}
+
+
+def test_plan_falls_back_to_vae_tiling_for_large_batches(monkeypatch: pytest.MonkeyPatch) -> None:
+    set_worker_count(0)
+    monkeypatch.setattr(memory_info, "get_available_memory", lambda: 8 * GIB)
+    assert memory_planner.plan(KEY, 512, 512) == KEY
+    assert memory_planner.plan(KEY, 512, 512, 4).use_vae_tiling
+    with pytest.raises(memory_planner.InsufficientMemoryError, match="batches of 64"):
+        memory_planner.plan(KEY, 512, 512, 64)
+
+
+def test_max_batch_size_is_capped_by_free_memory(monkeypatch: pytest.MonkeyPatch) -> None:
+    set_worker_count(0)
+    monkeypatch.setattr(memory_info, "get_available_memory", lambda: 16 * GIB)
+    batch_size: int = memory_planner.get_max_batch_size(KEY, 512, 512, 256)
+    assert 1 < batch_size < 256
+    usage: dict[str, int] = memory_planner.estimate(KEY, 512, 512, batch_size)
+    assert usage["device"] + usage["host"] <= 16 * GIB
+    assert memory_planner.get_max_batch_size(KEY, 512, 512, 2) == 2
+
+    monkeypatch.setattr(memory_info, "get_available_memory", lambda: 1 * GIB)
+    assert memory_planner.get_max_batch_size(KEY, 512, 512, 256) == 1
@@ -0,0 +1,76 @@
+import json
+import struct
+
+from modules.core import constants
+from modules import model_catalog
+
+
+def write_safetensors(name: str, header: dict) -> None:
+    data: bytes = json.dumps(header).encode()
+    with open(f"{constants.IMAGE_MODEL_DIR_PATH}{name}", "wb") as file:
+        file.write(struct.pack("<Q", len(data)))
+        file.write(data)
+
+
+def gguf_string(text: str) -> bytes:
+    data: bytes = text.encode()
+    return struct.pack("<Q", len(data)) + data
+
+
+def write_gguf(name: str, architecture: str, tensors: list[tuple[str, tuple[int, ...], int]]) -> None:
+    data: bytes = b"GGUF" + struct.pack("<I", 3) + struct.pack("<QQ", len(tensors), 2)
+    # An array value, which the reader has to skip over, followed by the architecture.
+    data += gguf_string("tokenizer.scores") + struct.pack("<IIQ", 9, 6, 3) + struct.pack("<3f", 0.0, 1.0, 2.0)
+    data += gguf_string("general.architecture") + struct.pack("<I", 8) + gguf_string(architecture)
+    for tensor_name, shape, tensor_type in tensors:
+        data += gguf_string(tensor_name) + struct.pack("<I", len(shape)) + struct.pack(f"<{len(shape)}Q", *shape) + struct.pack("<IQ", tensor_type, 0)
+    with open(f"{constants.IMAGE_MODEL_DIR_PATH}{name}", "wb") as file:
+        file.write(data)
+
+
+def test_safetensors_header() -> None:
+    write_safetensors("sdxl.safetensors", {
+        "__metadata__": {"format": "pt"},
+        "conditioner.embedders.1.model.weight": {"dtype": "F16", "shape": [4, 8], "data_offsets": [0, 64]},
+        "model.diffusion_model.out.bias": {"dtype": "F32", "shape": [4], "data_offsets": [64, 80]},
+    })
+    info: dict = model_catalog.get_info("sdxl.safetensors")
+    assert info["architecture"] == "SDXL"
+    assert info["dtype"] == "F16"
+    assert info["parameter_count"] == 36
+    assert model_catalog.get_default_resolution("sdxl.safetensors") == constants.ARCHITECTURE_RESOLUTIONS["SDXL"]
+
+
+def test_gguf_header() -> None:
+    write_gguf("flux.gguf", "flux", [
+        ("double_blocks.0.img_attn.qkv.weight", (64, 32), 12),
+        ("double_blocks.0.img_attn.norm.scale", (64,), 0),
+    ])
+    info: dict = model_catalog.get_info("flux.gguf")
+    assert info["architecture"] == "Flux"
+    assert info["dtype"] == "Q4_K"
+    assert info["parameter_count"] == 64 * 32 + 64
+
+
+def test_unreadable_header_is_unknown() -> None:
+    with open(f"{constants.IMAGE_MODEL_DIR_PATH}broken.safetensors", "wb") as file:
+        file.write(b"\x01\x02")
+    info: dict = model_catalog.get_info("broken.safetensors")
+    assert info["architecture"] == "unknown"
+    assert info["file_size"] == 2
+
+
+def test_replaced_file_is_parsed_again() -> None:
+    write_safetensors("model.safetensors", {"cond_stage_model.transformer.weight": {"dtype": "F32", "shape": [2], "data_offsets": [0, 8]}})
+    assert model_catalog.get_info("model.safetensors")["architecture"] == "SD1.x"
+    write_safetensors("model.safetensors", {"joint_blocks.0.weight": {"dtype": "F32", "shape": [2, 2, 2], "data_offsets": [0, 32]}})
+    assert model_catalog.get_info("model.safetensors")["architecture"] == "SD3"
+
+
+def test_digest_tells_content_changes_from_touches() -> None:
+    write_safetensors("model.safetensors", {"a": {"dtype": "F32", "shape": [2], "data_offsets": [0, 8]}})
+    digest: str | None = model_catalog.get_digest("model.safetensors")
+    write_safetensors("model.safetensors", {"a": {"dtype": "F32", "shape": [2], "data_offsets": [0, 8]}})
+    assert model_catalog.get_digest("model.safetensors") == digest
+    write_safetensors("model.safetensors", {"b": {"dtype": "F32", "shape": [2], "data_offsets": [0, 8]}})
+    assert model_catalog.get_digest("model.safetensors") != digest
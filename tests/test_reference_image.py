@@ -0,0 +1,46 @@
+import io
+
+import pytest
+from PIL import Image
+
+from modules import reference_image
+
+
+def encode(image: Image.Image, image_format: str = "png", **arguments) -> bytes:
+    buffer: io.BytesIO = io.BytesIO()
+    image.save(buffer, format=image_format, **arguments)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("resize_mode", ["crop", "pad", "stretch"])
+def test_prepare_fits_requested_size(resize_mode: str) -> None:
+    prepared_image: reference_image.PreparedImage = reference_image.prepare(encode(Image.new("RGB", (300, 200), "red")), 128, 128, resize_mode)
+    assert prepared_image.image.size == (128, 128)
+    assert prepared_image.image.mode == "RGB"
+    assert prepared_image.source_size == (300, 200)
+    assert prepared_image.resampled
+
+
+def test_exif_orientation_is_applied() -> None:
+    exif: Image.Exif = Image.Exif()
+    exif[0x0112] = 6
+    prepared_image: reference_image.PreparedImage = reference_image.prepare(encode(Image.new("RGB", (128, 64)), "jpeg", exif=exif), 64, 128, "crop")
+    assert prepared_image.source_size == (64, 128)
+    assert not prepared_image.resampled
+
+
+def test_same_upload_is_prepared_once() -> None:
+    source: bytes = encode(Image.new("RGB", (64, 64), "blue"))
+    assert reference_image.prepare(source, 64, 64, "crop") is reference_image.prepare(source, 64, 64, "crop")
+
+
+def test_oversized_image_is_an_os_error(monkeypatch: pytest.MonkeyPatch) -> None:
+    source: bytes = encode(Image.new("L", (100, 100)))
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    with pytest.raises(OSError):
+        reference_image.prepare(source, 64, 64, "crop")
+
+
+def test_garbage_is_an_os_error() -> None:
+    with pytest.raises(OSError):
+        reference_image.prepare(b"not an image", 64, 64, "crop")
@@ -0,0 +1,54 @@
+import collections
+
+import pytest
+from PIL import Image
+
+from modules.core import constants
+from modules import diffuser_pool
+from modules import generation
+from modules import image_writer
+from modules import metrics
+from modules import result_cache
+
+
+def get_lookups(result: str) -> float:
+    return vars(metrics)["__series"]["cudiffusion_result_cache_lookups_total"].get((("result", result),), 0.0)
+
+
+def create_request() -> generation.Request:
+    return generation.Request(
+        diffuser_key=diffuser_pool.Key("model.gguf", False, "default", "default"),
+        clip_skip=0,
+        positive_prompt="a cat",
+        negative_prompt="",
+        seed=1,
+        steps=4,
+        sampler="euler",
+        cfg_scale=7.0,
+        width=64,
+        height=64,
+    )
+
+
+def test_lookups_are_counted_by_tier(monkeypatch: pytest.MonkeyPatch) -> None:
+    lookups: dict[str, float] = {result: get_lookups(result) for result in ("memory_hit", "disk_hit", "miss")}
+    assert result_cache.get("key", 1) is None
+    result_cache.put("key", [Image.new("RGB", (8, 8), "red")])
+    assert result_cache.get("key", 1)[0].getpixel((0, 0)) == (255, 0, 0)
+
+    # With the memory tier gone, the entry is read back from disk.
+    image_writer.flush()
+    monkeypatch.setitem(vars(result_cache), "__memory_entries", collections.OrderedDict())
+    assert result_cache.get("key", 1)[0].getpixel((0, 0)) == (255, 0, 0)
+    assert {result: get_lookups(result) - count for result, count in lookups.items()} == {"memory_hit": 1, "disk_hit": 1, "miss": 1}
+
+
+def test_replaced_model_changes_the_key() -> None:
+    with open(f"{constants.IMAGE_MODEL_DIR_PATH}model.gguf", "wb") as file:
+        file.write(b"old")
+    key: str = generation.get_cache_key(create_request())
+    assert generation.get_cache_key(create_request()) == key
+
+    with open(f"{constants.IMAGE_MODEL_DIR_PATH}model.gguf", "wb") as file:
+        file.write(b"new weights")
+    assert generation.get_cache_key(create_request()) != key
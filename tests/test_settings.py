@@ -0,0 +1,95 @@
+import os
+import json
+import time
+
+import pytest
+
+from modules.core import constants
+from modules import settings
+
+
+SETTINGS_PATH: str = f"{constants.DATA_DIR_PATH}{constants.SETTINGS_FILENAME}"
+
+
+def read_file() -> dict:
+    with open(SETTINGS_PATH, "rt") as file:
+        return json.load(file)
+
+
+def write_file(text: str) -> None:
+    # The signature includes the mtime, which would not change between two writes in quick succession.
+    time.sleep(0.01)
+    with open(SETTINGS_PATH, "wt") as file:
+        file.write(text)
+    stat: os.stat_result = os.stat(SETTINGS_PATH)
+    os.utime(SETTINGS_PATH, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def wait_until(condition, timeout: float = 3.0) -> bool:
+    deadline: float = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture(autouse=True)
+def short_save_delay(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(constants, "SETTINGS_SAVE_DELAY", 0.05)
+
+
+def test_burst_of_changes_is_saved_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    saves: list[None] = []
+    save = settings.save
+    monkeypatch.setattr(settings, "save", lambda: (saves.append(None), save())[1])
+
+    settings.set_key("image_model/scheduler", "karras")
+    settings.set_key("image_model/rng_type", "cuda")
+    assert wait_until(lambda: os.path.exists(SETTINGS_PATH))
+    time.sleep(0.2)
+    assert len(saves) == 1
+    assert read_file()["image_model"]["scheduler"] == "karras"
+    assert read_file()["image_model"]["rng_type"] == "cuda"
+
+
+def test_change_during_a_slow_write_is_saved(monkeypatch: pytest.MonkeyPatch) -> None:
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda descriptor: (time.sleep(0.3), fsync(descriptor)))
+
+    settings.set_key("image_model/scheduler", "karras")
+    # The save timer is now inside its slow write.
+    time.sleep(0.15)
+    settings.set_key("image_model/rng_type", "cuda")
+    assert wait_until(lambda: os.path.exists(SETTINGS_PATH) and read_file()["image_model"]["rng_type"] == "cuda")
+    assert read_file()["image_model"]["scheduler"] == "karras"
+
+
+def test_reload_picks_up_external_edit() -> None:
+    settings.save()
+    data: dict = read_file()
+    data["image_model"]["scheduler"] = "exponential"
+    write_file(json.dumps(data))
+    assert settings.reload_if_changed()
+    assert settings.get_key("image_model/scheduler") == "exponential"
+    assert not settings.reload_if_changed()
+
+
+def test_reload_keeps_settings_when_file_is_broken() -> None:
+    settings.set_key("image_model/scheduler", "karras")
+    settings.flush()
+    write_file('{"image_model": {"sched')
+
+    assert not settings.reload_if_changed()
+    assert settings.get_key("image_model/scheduler") == "karras"
+    # Nothing is written back over the user's (broken) file.
+    time.sleep(0.2)
+    with open(SETTINGS_PATH, "rt") as file:
+        assert file.read() == '{"image_model": {"sched'
+
+    # Once the file is fixed, it is picked up.
+    data: dict = json.loads(json.dumps(constants.DEFAULT_SETTINGS))
+    data["image_model"]["scheduler"] = "exponential"
+    write_file(json.dumps(data))
+    assert settings.reload_if_changed()
+    assert settings.get_key("image_model/scheduler") == "exponential"
@@ -0,0 +1,78 @@
+import pytest
+from PIL import Image
+
+from modules.core import constants
+from modules import diffuser_pool
+from modules import generation
+from modules import sweep
+
+
+def create_request() -> generation.Request:
+    return generation.Request(
+        diffuser_key=diffuser_pool.Key("model.gguf", False, "default", "default"),
+        clip_skip=0,
+        positive_prompt="a cat",
+        negative_prompt="",
+        seed=1,
+        steps=4,
+        sampler="euler",
+        cfg_scale=7.0,
+        width=64,
+        height=64,
+    )
+
+
+def test_parse_values() -> None:
+    assert sweep.parse_values("seed", "1, 2,, 2, 3") == [1, 2, 3]
+    assert sweep.parse_values("size", "512x768, 64X64") == [(512, 768), (64, 64)]
+    assert sweep.parse_values("sampler", "euler, lcm") == ["euler", "lcm"]
+    assert sweep.parse_values("cfg_scale", "") == []
+
+
+@pytest.mark.parametrize("axis, text", [
+    ("sampler", "eulr"),
+    ("steps", "0"),
+    ("steps", "101"),
+    ("cfg_scale", "31"),
+    ("clip_skip", "3"),
+    ("size", "500x512"),
+    ("seed", "one"),
+])
+def test_invalid_values_are_rejected(axis: str, text: str) -> None:
+    with pytest.raises(ValueError, match=constants.SWEEP_AXES[axis]):
+        sweep.parse_values(axis, text)
+
+
+def test_too_many_cells_are_rejected() -> None:
+    axes: dict = {"seed": list(range(constants.MAX_SWEEP_CELLS)), "steps": [1, 2]}
+    assert sweep.get_cell_count(axes) == constants.MAX_SWEEP_CELLS * 2
+    with pytest.raises(ValueError):
+        sweep.validate(axes)
+    with pytest.raises(ValueError):
+        sweep.run(create_request(), axes)
+
+
+def test_run_coalesces_seeds_and_builds_grid(monkeypatch: pytest.MonkeyPatch) -> None:
+    requests: list[generation.Request] = []
+
+    def run(request: generation.Request, progress_callback=None) -> list[Image.Image]:
+        requests.append(request)
+        return [Image.new("RGB", (request.width, request.height)) for _ in range(request.batch_size)]
+
+    monkeypatch.setattr(generation, "run", run)
+    grid, cells = sweep.run(create_request(), {"seed": [1, 2, 3], "steps": [4, 8]})
+    assert len(cells) == 6
+    # Consecutive seeds with the same settings share one backend call.
+    assert [(request.steps, request.seed, request.batch_size) for request in requests] == [(4, 1, 3), (8, 1, 3)]
+    assert grid.width > 3 * 64 and grid.height > 2 * 64
+
+
+def test_large_grid_is_scaled_down(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(constants, "MAX_SWEEP_GRID_PIXELS", 256 * 256)
+    cells: list[dict] = [
+        {"values": {"seed": seed, "steps": steps}, "image": Image.new("RGB", (512, 512)), "seconds": 0.1}
+        for steps in (4, 8) for seed in (1, 2)
+    ]
+    grid: Image.Image = vars(sweep)["__assemble_grid"](cells, {"seed": [1, 2], "steps": [4, 8]})
+    # Labels and padding come on top of the cells, which are scaled to fit the limit.
+    assert grid.width * grid.height < 2 * 256 * 256
@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+from modules.core import constants
+from modules import settings
+from modules import diffuser_pool
+from modules import memory_planner
+from modules import thread_tuner
+from modules import worker_pool
+
+
+KEY: diffuser_pool.Key = diffuser_pool.Key("model.gguf", False, "default", "default")
+
+
+def test_tuned_count_is_capped_to_a_worker_share(monkeypatch: pytest.MonkeyPatch) -> None:
+    cpu_count: int = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    settings.set_key("image_model/tuned_threads", {"model.gguf": 10_000})
+    assert thread_tuner.get_thread_count("model.gguf") == cpu_count
+    assert thread_tuner.get_thread_count("other.gguf") == -1
+
+    monkeypatch.setitem(vars(worker_pool), "__worker_count", 2)
+    assert thread_tuner.get_thread_count("model.gguf") == max(cpu_count // 2, 1)
+    assert max(thread_tuner.get_candidates()) == max(cpu_count // 2, 1)
+    # An explicit count is the user's call.
+    settings.set_key("image_model/n_threads", 10_000)
+    assert thread_tuner.get_thread_count("model.gguf") == 10_000
+
+
+def test_tune_plans_every_candidate_and_keeps_the_fastest(monkeypatch: pytest.MonkeyPatch) -> None:
+    with open(f"{constants.IMAGE_MODEL_DIR_PATH}model.gguf", "wb"):
+        pass
+    monkeypatch.setattr(thread_tuner, "get_candidates", lambda: [1, 2])
+    planned_keys: list[diffuser_pool.Key] = []
+    plan = memory_planner.plan
+    monkeypatch.setattr(memory_planner, "plan", lambda key, *arguments: (planned_keys.append(key), plan(key, *arguments))[1])
+
+    n_threads: int = thread_tuner.tune(KEY)
+    assert [key.n_threads for key in planned_keys] == [1, 2]
+    assert n_threads in (1, 2)
+    assert settings.get_key(f"image_model/tuned_threads/{KEY.image_model}") == n_threads
+    # Only the winner stays loaded.
+    assert diffuser_pool.is_resident(planned_keys[n_threads - 1])
+    assert not diffuser_pool.is_resident(planned_keys[2 - n_threads])